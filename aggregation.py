@@ -0,0 +1,127 @@
+import torch
+import logging
+from codec import decode_into
+
+# 异步聚合中陈旧更新的衰减函数，见 staleness_weight
+STALENESS_FUNCTIONS = ("constant", "polynomial", "hinge")
+
+
+def staleness_weight(staleness, mode="polynomial", a=0.5, b=4):
+    """陈旧度为 staleness（训练起点之后全局模型已更新的次数）的更新的权重系数 s(τ)
+
+    constant: 1；polynomial: (1 + τ)^-a；hinge: τ <= b 时为 1，之后为 1 / (a(τ - b) + 1)。
+    """
+    staleness = max(0, staleness)
+    if mode == "constant":
+        return 1.0
+    if mode == "polynomial":
+        return (1.0 + staleness) ** -a
+    if mode == "hinge":
+        return 1.0 if staleness <= b else 1.0 / (a * (staleness - b) + 1.0)
+    raise ValueError(f"未知的陈旧度函数: {mode}")
+
+
+class StreamingFedAvg:
+    """流式加权FedAvg聚合器
+
+    按 state_dict 的全部条目（包括 BatchNorm 等缓冲区）预分配一块扁平累加缓冲，
+    每收到一个客户端更新就按权重（通常为 num_examples）累加进去后立即释放，
+    因此无论客户端数量多少，常驻内存中只有一份模型大小的累加器。
+
+    设置基准模型（本轮全局模型）后累加器进入增量模式：缓冲中累加的是各更新相对基准的
+    加权增量，编码后的增量更新可以直接解码进缓冲，最终结果为基准加上加权平均增量。
+    """
+
+    def __init__(self, template, device=None, dtype=torch.float32):
+        """根据模板 state_dict 预分配累加缓冲"""
+        self.device = device if device is not None else torch.device("cpu")
+        self.dtype = dtype
+        self._layout = []
+        offset = 0
+        for name, tensor in template.items():
+            numel = tensor.numel()
+            self._layout.append((name, offset, numel, tuple(tensor.shape), tensor.dtype))
+            offset += numel
+        self._buffer = torch.zeros(offset, dtype=dtype, device=self.device)
+        self._base = None
+        self.total_weight = 0.0
+        self.num_updates = 0
+
+    @property
+    def numel(self):
+        return self._buffer.numel()
+
+    def reset(self, base=None):
+        """清空累加器，复用同一块缓冲开始新一轮聚合；传入 base 时进入增量模式"""
+        self._buffer.zero_()
+        self.total_weight = 0.0
+        self.num_updates = 0
+        if base is None:
+            self._base = None
+            return
+        if self._base is None:
+            self._base = torch.empty_like(self._buffer)
+        with torch.no_grad():
+            for name, offset, numel, shape, _ in self._layout:
+                self._base[offset:offset + numel].copy_(base[name].detach().reshape(-1))
+
+    def _check_weight(self, weight):
+        if weight <= 0:
+            raise ValueError(f"聚合权重必须为正数，收到 {weight}")
+
+    def add(self, state_dict, weight=1.0, base=None):
+        """将一个客户端的 state_dict 按权重累加进缓冲
+
+        增量模式下可以用 base 指定该更新的训练起点（异步聚合中的陈旧全局模型），
+        累加的是相对 base 而不是相对当前基准的增量。
+        """
+        self._check_weight(weight)
+        missing = [name for name, *_ in self._layout if name not in state_dict]
+        if missing or len(state_dict) != len(self._layout):
+            raise KeyError(f"state_dict 与模板不一致，缺失: {missing}")
+        if base is not None and self._base is None:
+            raise RuntimeError("指定更新的基准模型前必须通过 reset(base=...) 进入增量模式")
+        with torch.no_grad():
+            for name, offset, numel, shape, _ in self._layout:
+                tensor = state_dict[name]
+                if tuple(tensor.shape) != shape:
+                    raise ValueError(f"参数 {name} 形状不匹配: {tuple(tensor.shape)} != {shape}")
+                flat = tensor.detach().reshape(-1).to(device=self.device, dtype=self.dtype)
+                if base is not None:
+                    flat = flat - base[name].detach().reshape(-1).to(device=self.device, dtype=self.dtype)
+                elif self._base is not None:
+                    flat = flat - self._base[offset:offset + numel]
+                self._buffer[offset:offset + numel].add_(flat, alpha=weight)
+        self.total_weight += weight
+        self.num_updates += 1
+
+    def add_encoded(self, payload, weight=1.0):
+        """将编码后的增量更新（见 codec.UpdateEncoder）直接解码累加进缓冲"""
+        self._check_weight(weight)
+        if self._base is None:
+            raise RuntimeError("累加编码增量前必须通过 reset(base=...) 设置基准模型")
+        tensors = payload["tensors"]
+        missing = [name for name, *_ in self._layout if name not in tensors]
+        if missing:
+            raise KeyError(f"编码更新与模板不一致，缺失: {missing}")
+        with torch.no_grad():
+            for name, offset, numel, _, _ in self._layout:
+                decode_into(tensors[name], self._buffer[offset:offset + numel], alpha=weight)
+        self.total_weight += weight
+        self.num_updates += 1
+
+    def result(self):
+        """返回加权平均后的 state_dict，整数类型的缓冲区四舍五入后还原原始类型"""
+        if self.num_updates == 0:
+            raise RuntimeError("尚未累加任何客户端更新")
+        averaged = {}
+        with torch.no_grad():
+            for name, offset, numel, shape, dtype in self._layout:
+                value = self._buffer[offset:offset + numel] / self.total_weight
+                if self._base is not None:
+                    value = value + self._base[offset:offset + numel]
+                if not dtype.is_floating_point:
+                    value = value.round()
+                averaged[name] = value.to(dtype).reshape(shape)
+        logging.info(f"完成 {self.num_updates} 个更新的加权聚合，总权重={self.total_weight}")
+        return averaged
@@ -0,0 +1,123 @@
+import flwr as fl
+from flwr.common import Code
+from flwr.server.history import History
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import logging
+import timeit
+
+
+class BufferedAsyncServer(fl.server.Server):
+    """FedBuff 式异步缓冲聚合服务器
+
+    不再按轮次同步等待全部训练者：每个客户端完成训练后其结果进入缓冲区，并立即以当前最新的
+    全局模型重新下发训练任务；缓冲区攒满 buffer_size 个更新时调用
+    strategy.aggregate_buffered 聚合并在链上提交一次新的全局模型。num_rounds 为提交全局模型的次数。
+    慢客户端的更新在到达时按陈旧度降权，不会阻塞快客户端。
+    start_version 大于 1 时从该次全局模型更新继续（见 server_main 的 --resume）。
+    聚合连续失败 max_aggregation_failures 次（例如IPFS或链不可用）时停止训练并记录错误，不再无限下发任务。
+    """
+
+    def __init__(self, *, client_manager, strategy, buffer_size=2, max_failures=3, start_version=1,
+                 max_aggregation_failures=3):
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        if buffer_size < 1:
+            raise ValueError(f"缓冲区大小必须为正数，收到 {buffer_size}")
+        self.buffer_size = buffer_size
+        # 客户端连续失败达到该次数后不再向其下发任务
+        self.max_failures = max_failures
+        if max_aggregation_failures < 1:
+            raise ValueError(f"聚合失败次数上限必须为正数，收到 {max_aggregation_failures}")
+        self.max_aggregation_failures = max_aggregation_failures
+        self.start_version = start_version
+
+    def fit(self, num_rounds, timeout):
+        history = History()
+        self.parameters = self._get_initial_parameters(server_round=self.start_version - 1, timeout=timeout)
+        res = self.strategy.evaluate(self.start_version - 1, parameters=self.parameters)
+        if res is not None:
+            history.add_loss_centralized(server_round=self.start_version - 1, loss=res[0])
+            history.add_metrics_centralized(server_round=self.start_version - 1, metrics=res[1])
+
+        num_clients = self.strategy.num_trainers()
+        if not self._client_manager.wait_for(num_clients, timeout=timeout if timeout is not None else 86400):
+            logging.error(f"等待 {num_clients} 个客户端连接超时")
+            return history, 0.0
+        clients = list(self._client_manager.all().values())
+        # 每次全局模型更新对应链上一轮，该轮开始时登记训练者，评估器在提交全局模型之前为它们打分
+        register_trainers = getattr(self.strategy, "register_trainers", None)
+        if register_trainers is not None:
+            register_trainers(self.start_version, clients, timeout)
+        logging.info(f"异步训练开始：{len(clients)} 个客户端，每 {self.buffer_size} 个更新聚合一次")
+
+        start_time = timeit.default_timer()
+        version = self.start_version
+        buffer = []
+        failures = []
+        consecutive_failures = {}
+        aggregation_failures = 0
+        aborted = False
+        executor = ThreadPoolExecutor(max_workers=self.max_workers or len(clients) or 1,
+                                      thread_name_prefix="async-fit")
+        running = {}
+
+        def dispatch(client):
+            ins = self.strategy.configure_async_fit(version, self.parameters, client)
+            running[executor.submit(client.fit, ins, timeout, version)] = client
+
+        try:
+            for client in clients:
+                dispatch(client)
+            while version <= num_rounds and running and not aborted:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    client = running.pop(future)
+                    try:
+                        fit_res = future.result()
+                        if fit_res.status.code != Code.OK:
+                            raise RuntimeError(fit_res.status.message)
+                        buffer.append((client, fit_res))
+                        consecutive_failures[client.cid] = 0
+                    except Exception as e:
+                        logging.warning(f"客户端 {client.cid} 训练失败: {e}")
+                        failures.append(e)
+                        consecutive_failures[client.cid] = consecutive_failures.get(client.cid, 0) + 1
+
+                    if not aborted and len(buffer) >= self.buffer_size and version <= num_rounds:
+                        parameters, metrics = self.strategy.aggregate_buffered(version, buffer, failures)
+                        buffer, failures = [], []
+                        if parameters is not None:
+                            self.parameters = parameters
+                            history.add_metrics_distributed_fit(server_round=version, metrics=metrics)
+                            res = self.strategy.evaluate(version, parameters=self.parameters)
+                            if res is not None:
+                                history.add_loss_centralized(server_round=version, loss=res[0])
+                                history.add_metrics_centralized(server_round=version, metrics=res[1])
+                            logging.info(f"第 {version} 次全局模型更新完成，"
+                                         f"用时 {timeit.default_timer() - start_time:.1f}s")
+                            version += 1
+                            aggregation_failures = 0
+                            if register_trainers is not None and version <= num_rounds:
+                                register_trainers(version, clients, timeout)
+                        else:
+                            aggregation_failures += 1
+                            logging.warning(f"第 {version} 次全局模型聚合失败"
+                                            f"（连续 {aggregation_failures}/{self.max_aggregation_failures} 次）")
+                            if aggregation_failures >= self.max_aggregation_failures:
+                                logging.error(f"聚合连续失败 {aggregation_failures} 次，停止训练，"
+                                              f"全局模型只更新到第 {version - 1} 次")
+                                aborted = True
+
+                    if aborted or version > num_rounds:
+                        continue
+                    if consecutive_failures.get(client.cid, 0) < self.max_failures:
+                        dispatch(client)
+            if version <= num_rounds and not aborted:
+                logging.error(f"所有客户端均已停止，全局模型只更新到第 {version - 1} 次")
+        finally:
+            # 仍在训练的客户端的结果不再需要，断开连接时其请求会被取消
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        collect = getattr(self.strategy, "collect_evaluations", None)
+        if collect is not None:
+            collect(history)
+        return history, timeit.default_timer() - start_time
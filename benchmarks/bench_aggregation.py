@@ -0,0 +1,89 @@
+"""流式加权FedAvg聚合的峰值内存基准
+
+分别以旧的“每个客户端保留一份模型再平均”方式与 StreamingFedAvg 聚合 N 个合成更新，
+每个配置在独立子进程中运行，以子进程的峰值RSS作为结果。
+
+用法: python benchmarks/bench_aggregation.py --clients 2 8 32 --params 5000000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from aggregation import StreamingFedAvg
+
+
+def make_update(num_params, seed):
+    """生成一个包含权重与 BatchNorm 缓冲的合成 state_dict"""
+    generator = torch.Generator().manual_seed(seed)
+    return {
+        "fc.weight": torch.randn(num_params, generator=generator),
+        "bn.running_mean": torch.randn(64, generator=generator),
+        "bn.num_batches_tracked": torch.tensor(seed, dtype=torch.long),
+    }
+
+
+def run_naive(num_clients, num_params):
+    updates = [make_update(num_params, i) for i in range(num_clients)]
+    result = {name: torch.zeros_like(t, dtype=torch.float32) for name, t in updates[0].items()}
+    for update in updates:
+        for name, tensor in update.items():
+            result[name] += tensor.float() / len(updates)
+    return result
+
+
+def run_streaming(num_clients, num_params):
+    aggregator = StreamingFedAvg(make_update(num_params, 0))
+    for i in range(num_clients):
+        update = make_update(num_params, i)
+        aggregator.add(update, weight=100 + i)
+        del update
+    return aggregator.result()
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def worker(mode, num_clients, num_params):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    (run_naive if mode == "naive" else run_streaming)(num_clients, num_params)
+    elapsed = time.perf_counter() - start
+    print(f"{peak_rss_mb() - baseline:.1f} {elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聚合峰值内存基准")
+    parser.add_argument("--clients", type=int, nargs="+", default=[2, 8, 32, 64])
+    parser.add_argument("--params", type=int, default=5_000_000, help="每个模型的参数量")
+    parser.add_argument("--worker", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], int(args.worker[1]), int(args.worker[2]))
+        return
+
+    model_mb = args.params * 4 / 2 ** 20
+    print(f"模型大小约 {model_mb:.1f} MB")
+    print(f"{'clients':>8} {'naive_MB':>10} {'naive_s':>8} {'stream_MB':>10} {'stream_s':>9}")
+    for num_clients in args.clients:
+        row = []
+        for mode in ("naive", "streaming"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", mode, str(num_clients), str(args.params)],
+                check=True, capture_output=True, text=True,
+            ).stdout.split()
+            row.extend(float(v) for v in out)
+        print(f"{num_clients:>8} {row[0]:>10.1f} {row[1]:>8.3f} {row[2]:>10.1f} {row[3]:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""同步轮次与异步缓冲聚合（FedBuff）的墙钟时间-精度基准
+
+在合成的类 MNIST 任务上用虚拟时钟模拟异构客户端：每个客户端本地训练一次的耗时为
+基准耗时乘以其速度系数（部分客户端被放慢 slowdown 倍，另加随机抖动）。同步模式每轮等待
+全部客户端；异步模式每攒满 buffer 个更新用 StreamingFedAvg 按陈旧度降权聚合一次，完成训练
+的客户端立即以最新全局模型开始下一次训练。输出两种模式下精度随虚拟时间的变化与达到目标精度的时间。
+
+用法: python benchmarks/bench_async.py --clients 8 --buffer 3 --budget 60
+"""
+import argparse
+import heapq
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from aggregation import STALENESS_FUNCTIONS, StreamingFedAvg, staleness_weight
+from bench_codec import accuracy, local_train, make_dataset
+from model import CNN
+
+
+def client_durations(args):
+    """每个客户端一次本地训练的虚拟耗时（秒）"""
+    generator = torch.Generator().manual_seed(7)
+    jitter = torch.empty(args.clients).log_normal_(0.0, 0.2, generator=generator)
+    num_slow = int(round(args.clients * args.slow_fraction))
+    return [args.step_time * jitter[i].item() * (args.slowdown if i < num_slow else 1.0) for i in range(args.clients)]
+
+
+def train_from(global_state, images, labels):
+    model = CNN()
+    model.load_state_dict(global_state)
+    local_train(model, images, labels)
+    return model.state_dict()
+
+
+def evaluate(global_state, test_set):
+    model = CNN()
+    model.load_state_dict(global_state)
+    return accuracy(model, *test_set)
+
+
+def run_sync(args, shards, test_set, initial_state, durations):
+    torch.manual_seed(1)
+    global_state = {k: v.clone() for k, v in initial_state.items()}
+    aggregator = StreamingFedAvg(global_state)
+    now = 0.0
+    history = [(0.0, evaluate(global_state, test_set))]
+    while now + max(durations) <= args.budget:
+        aggregator.reset()
+        for images, labels in shards:
+            aggregator.add(train_from(global_state, images, labels), weight=len(labels))
+        global_state = aggregator.result()
+        # 本轮在最慢的客户端完成后才结束
+        now += max(durations)
+        history.append((now, evaluate(global_state, test_set)))
+    return history
+
+
+def run_async(args, shards, test_set, initial_state, durations, staleness):
+    torch.manual_seed(1)
+    global_state = {k: v.clone() for k, v in initial_state.items()}
+    aggregator = StreamingFedAvg(global_state)
+    version = 0
+    versions = {0: global_state}
+    history = [(0.0, evaluate(global_state, test_set))]
+    # (完成时间, 客户端, 训练起点版本, 训练结果)
+    events = []
+    for i, (images, labels) in enumerate(shards):
+        heapq.heappush(events, (durations[i], i, version, train_from(global_state, images, labels)))
+    buffer = []
+    while events:
+        now, i, start_version, state_dict = heapq.heappop(events)
+        if now > args.budget:
+            break
+        buffer.append((i, start_version, state_dict))
+        if len(buffer) >= args.buffer:
+            aggregator.reset(base=global_state)
+            for j, base_version, update in buffer:
+                weight = len(shards[j][1]) * staleness_weight(version - base_version, staleness)
+                aggregator.add(update, weight=weight, base=versions[base_version])
+            global_state = aggregator.result()
+            version += 1
+            versions[version] = global_state
+            buffer = []
+            history.append((now, evaluate(global_state, test_set)))
+            # 只保留仍可能作为训练起点的版本
+            live = {v for _, _, v, _ in events} | {v for _, v, _ in buffer} | {version}
+            versions = {v: s for v, s in versions.items() if v in live}
+        images, labels = shards[i]
+        heapq.heappush(events, (now + durations[i], i, version, train_from(global_state, images, labels)))
+    return history
+
+
+def time_to(history, target):
+    for now, acc in history:
+        if acc >= target:
+            return now
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步缓冲聚合基准")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--buffer", type=int, default=3, help="异步模式每次聚合的更新数 K")
+    parser.add_argument("--samples", type=int, default=500, help="每个客户端的样本数")
+    parser.add_argument("--budget", type=float, default=60.0, help="模拟的虚拟时间上限（秒）")
+    parser.add_argument("--step_time", type=float, default=2.0, help="快客户端一次本地训练的虚拟耗时（秒）")
+    parser.add_argument("--slow_fraction", type=float, default=0.25, help="慢客户端所占比例")
+    parser.add_argument("--slowdown", type=float, default=5.0, help="慢客户端的耗时倍数")
+    parser.add_argument("--target", type=float, default=0.8, help="目标测试精度")
+    parser.add_argument("--staleness", type=str, nargs="+", default=["polynomial"], choices=STALENESS_FUNCTIONS)
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(42)
+    shards = [make_dataset(args.samples, generator) for _ in range(args.clients)]
+    test_set = make_dataset(2000, generator)
+    initial_state = CNN().state_dict()
+    durations = client_durations(args)
+    print("客户端单次训练耗时(s): " + ", ".join(f"{d:.1f}" for d in durations))
+
+    results = {"sync": run_sync(args, shards, test_set, initial_state, durations)}
+    for staleness in args.staleness:
+        results[f"async/{staleness}"] = run_async(args, shards, test_set, initial_state, durations, staleness)
+
+    print(f"{'mode':>18} {'updates':>8} {'final_acc':>10} {f'time_to_{args.target:.2f}':>14}")
+    for mode, history in results.items():
+        reached = time_to(history, args.target)
+        reached = f"{reached:.1f}s" if reached is not None else "-"
+        print(f"{mode:>18} {len(history) - 1:>8} {history[-1][1]:>10.4f} {reached:>14}")
+    for mode, history in results.items():
+        print(f"\n{mode}: " + " ".join(f"{now:.0f}s={acc:.3f}" for now, acc in history))
+
+
+if __name__ == "__main__":
+    main()
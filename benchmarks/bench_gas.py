@@ -0,0 +1,173 @@
+"""链上承诺的 gas 与交易数基准：字符串CID逐笔提交 vs bytes32 摘要 + 批量分数 + Merkle 根
+
+在 eth-tester 上部署合约产物（默认 build/contracts/BCFL.json），按与训练相同的顺序模拟若干轮：
+每个训练者提交更新、评估器提交分数、服务器登记训练者并提交全局模型，从交易回执统计每个
+合约函数的 gas 与交易数。模式：
+    string   每个训练者一笔 submitUpdate（CID 字符串），每个分数一笔 submitScore
+    bytes32  每个训练者一笔 submitUpdateDigest，全部分数一笔 submitScores，全局模型以摘要提交
+    merkle   服务器一笔 commitUpdateRoot 承诺全部更新，其余同 bytes32
+后两种模式需要用当前 contracts/BCFL.sol 重新编译的产物；产物中没有对应函数时该模式记为 stale，
+并列出产物与源码不一致的签名（见 blockchain_utils.abi_drift），需先运行 truffle compile。
+另外按 ABI 编码长度计算各调用的固有 gas（21000 + calldata），不依赖合约产物。
+
+用法: python benchmarks/bench_gas.py --trainers 8 --rounds 3 --artifact build/contracts/BCFL.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from eth_abi import encode
+from web3 import Web3
+
+from blockchain_utils import abi_drift, cid_to_bytes32, merkle_proof, merkle_root, update_leaf
+from fakes import DEFAULT_ARTIFACT, InProcessChain, content_cid
+
+MODES = ("string", "bytes32", "merkle")
+# 各模式需要合约提供的函数
+REQUIRED = {"string": (), "bytes32": ("submitUpdateDigest", "submitScores", "submitGlobalModelDigest"),
+            "merkle": ("commitUpdateRoot", "submitScores", "submitGlobalModelDigest")}
+
+
+class GasMeter:
+    """按合约函数汇总交易回执中的 gasUsed"""
+
+    def __init__(self):
+        self.by_function = {}
+
+    def add(self, name, receipts):
+        if not isinstance(receipts, list):
+            receipts = [receipts]
+        for receipt in receipts:
+            if not receipt:
+                raise RuntimeError(f"{name} 交易失败")
+            entry = self.by_function.setdefault(name, {"txs": 0, "gas": 0})
+            entry["txs"] += 1
+            entry["gas"] += receipt["gasUsed"]
+
+    def totals(self):
+        return {"txs": sum(e["txs"] for e in self.by_function.values()),
+                "gas": sum(e["gas"] for e in self.by_function.values())}
+
+
+def run_mode(mode, args):
+    chain = InProcessChain(args.artifact)
+    server = chain.utils(0, cid_encoding="string" if mode == "string" else "bytes32")
+    missing = [name for name in REQUIRED[mode] if not server.has_function(name)]
+    if missing:
+        return {"stale": f"合约产物过期，缺少 {', '.join(missing)}；请运行 truffle compile 重新编译后再测",
+                "drift": abi_drift(chain.abi, os.path.join(ROOT, "contracts", "BCFL.sol"))}
+    if args.trainers + 1 > len(chain.accounts):
+        raise ValueError(f"eth-tester 只有 {len(chain.accounts)} 个账户，最多支持 {len(chain.accounts) - 1} 个训练者")
+    trainers = chain.accounts[1:args.trainers + 1]
+    clients = {account: chain.utils(account, cid_encoding=server.cid_encoding) for account in trainers}
+
+    meter = GasMeter()
+    genesis = content_cid(b"genesis")
+    meter.add("initialize", server.transact(server.contract.functions.initialize(genesis, args.rounds, args.trainers)))
+    meter.add("submitGlobalModel", server.submit_global_model(0, genesis))
+    per_round = []
+    start = time.perf_counter()
+    for round_num in range(1, args.rounds + 1):
+        before = meter.totals()
+        cids = {account: content_cid(f"update-{round_num}-{account}".encode()) for account in trainers}
+        if mode == "merkle":
+            entries = list(cids.items())
+            leaves = [update_leaf(account, round_num, cid_to_bytes32(cid)) for account, cid in entries]
+            manifest = content_cid(json.dumps({"round": round_num, "updates": entries}).encode())
+            meter.add("commitUpdateRoot", server.commit_update_root(round_num, merkle_root(leaves), manifest,
+                                                                    len(entries)))
+            # 抽查一个训练者的包含证明能通过合约校验
+            if not server.verify_update(round_num, entries[0][0], entries[0][1], merkle_proof(leaves, 0)):
+                raise RuntimeError("Merkle 包含证明校验失败")
+        else:
+            name = "submitUpdate" if mode == "string" else "submitUpdateDigest"
+            for account, cid in cids.items():
+                meter.add(name, clients[account].submit_update_cid(round_num, cid))
+        scores = {account: 50 + i for i, account in enumerate(trainers)}
+        name = "submitScore" if mode == "string" else "submitScores"
+        meter.add(name, server.submit_scores(round_num, scores) if mode != "string" else
+                  [server.submit_score(round_num, account, score) for account, score in scores.items()])
+        meter.add("selectTrainersForRound", server.select_trainers(round_num, trainers))
+        name = "submitGlobalModel" if mode == "string" else "submitGlobalModelDigest"
+        meter.add(name, server.submit_global_model(round_num, content_cid(f"global-{round_num}".encode())))
+        after = meter.totals()
+        per_round.append({"txs": after["txs"] - before["txs"], "gas": after["gas"] - before["gas"]})
+    elapsed = time.perf_counter() - start
+
+    if server.get_current_round() != args.rounds + 1:
+        raise RuntimeError("轮次推进与预期不一致")
+    if server.get_global_model_cid(args.rounds) != content_cid(f"global-{args.rounds}".encode()):
+        raise RuntimeError("读回的全局模型CID与提交的不一致")
+    return {"functions": meter.by_function, "per_round": per_round,
+            "gas_per_round": sum(r["gas"] for r in per_round) / args.rounds,
+            "txs_per_round": sum(r["txs"] for r in per_round) / args.rounds,
+            "wall_s_per_round": elapsed / args.rounds}
+
+
+def calldata_gas(data):
+    return sum(16 if byte else 4 for byte in data)
+
+
+def intrinsic_gas(signature, types, values):
+    """一笔调用交易的固有 gas：21000 基础费用加 calldata 费用"""
+    data = Web3.keccak(text=signature)[:4] + encode(types, values)
+    return 21000 + calldata_gas(data)
+
+
+def intrinsic(args):
+    """每轮更新与分数提交的固有 gas 下限（与合约产物无关）"""
+    n = args.trainers
+    cid = content_cid(b"update")
+    addresses = [Web3.to_checksum_address(f"0x{i + 1:040x}") for i in range(n)]
+    root = bytes(Web3.keccak(text="root"))
+    return {
+        "updates": {
+            "string": n * intrinsic_gas("submitUpdate(uint256,string)", ["uint256", "string"], [1, cid]),
+            "bytes32": n * intrinsic_gas("submitUpdateDigest(uint256,bytes32)", ["uint256", "bytes32"],
+                                         [1, cid_to_bytes32(cid)]),
+            "merkle": intrinsic_gas("commitUpdateRoot(uint256,bytes32,bytes32,uint256)",
+                                    ["uint256", "bytes32", "bytes32", "uint256"], [1, root, root, n]),
+        },
+        "scores": {
+            "per_trainer": n * intrinsic_gas("submitScore(uint256,address,uint256)", ["uint256", "address", "uint256"],
+                                             [1, addresses[0], 50]),
+            "batched": intrinsic_gas("submitScores(uint256,address[],uint256[])",
+                                     ["uint256", "address[]", "uint256[]"], [1, addresses, [50] * n]),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="链上承诺的 gas 基准")
+    parser.add_argument("--trainers", type=int, default=8, help="每轮的训练者数量（eth-tester 提供 10 个账户，最多 9 个）")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--artifact", type=str, default=DEFAULT_ARTIFACT, help="truffle 编译产物")
+    parser.add_argument("--modes", type=str, default=",".join(MODES), help="逗号分隔的模式")
+    parser.add_argument("--output", type=str, default=None, help="JSON 结果文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "intrinsic_gas": intrinsic(args), "modes": {}}
+    for mode in args.modes.split(","):
+        if mode not in MODES:
+            raise ValueError(f"未知的模式: {mode}")
+        report["modes"][mode] = run_mode(mode, args)
+    baseline = report["modes"].get("string", {})
+    for mode, result in report["modes"].items():
+        if mode != "string" and "gas_per_round" in result and "gas_per_round" in baseline:
+            result["gas_saving"] = 1 - result["gas_per_round"] / baseline["gas_per_round"]
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""鲁棒聚合规则的吞吐量基准
+
+对每个 (客户端数, 参数量, 规则) 组合，用 RobustAggregator 写入 N 个合成增量后计时聚合，
+输出写入耗时、聚合耗时与聚合吞吐量（每秒处理的 客户端×参数 坐标数），以及本进程的峰值RSS。
+临时更新矩阵占用 N×P×4 字节磁盘空间（例如 1000 个客户端、1亿参数约 400 GB），
+请用 --tmp_dir 指定空间足够的目录。
+
+用法: python benchmarks/bench_robust.py --clients 10 100 1000 --params 1000000 10000000 --workers 4
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from robust_aggregation import RULES, RobustAggregator
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench(rule, num_clients, num_params, args):
+    template = {"fc.weight": torch.zeros(num_params)}
+    aggregator = RobustAggregator(template, rule=rule, trim_ratio=0.1, num_byzantine=max(0, num_clients // 10),
+                                  clip_norm=args.clip_norm, chunk_bytes=args.chunk_mb * 1024 * 1024,
+                                  workers=args.workers, tmp_dir=args.tmp_dir)
+    aggregator.reset()
+    generator = torch.Generator().manual_seed(0)
+    # 所有客户端共享一个随机方向加各自的少量噪声，避免生成数据的耗时掩盖写入耗时
+    shared = torch.randn(num_params, generator=generator)
+    start = time.perf_counter()
+    for i in range(num_clients):
+        update = shared + 0.01 * torch.randn(num_params, generator=generator)
+        aggregator.add({"fc.weight": update}, weight=100 + i)
+        del update
+    ingest = time.perf_counter() - start
+    start = time.perf_counter()
+    aggregator.aggregate_flat()
+    elapsed = time.perf_counter() - start
+    aggregator.close()
+    return ingest, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="鲁棒聚合吞吐量基准")
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--params", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--rules", type=str, nargs="+", default=list(RULES), choices=RULES)
+    parser.add_argument("--workers", type=int, default=0, help="按块并行的进程数")
+    parser.add_argument("--chunk_mb", type=int, default=64, help="每块读入内存的大小（MB）")
+    parser.add_argument("--clip_norm", type=float, default=None)
+    parser.add_argument("--tmp_dir", type=str, default=None, help="临时更新矩阵所在目录")
+    args = parser.parse_args()
+
+    print(f"{'rule':>13} {'clients':>8} {'params':>11} {'ingest_s':>9} {'agg_s':>8} {'Mcoord/s':>9} {'peak_MB':>8}")
+    for num_params in args.params:
+        for num_clients in args.clients:
+            for rule in args.rules:
+                ingest, elapsed = bench(rule, num_clients, num_params, args)
+                throughput = num_clients * num_params / elapsed / 1e6
+                print(f"{rule:>13} {num_clients:>8} {num_params:>11} {ingest:>9.2f} {elapsed:>8.3f} "
+                      f"{throughput:>9.1f} {peak_rss_mb():>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""端到端轮次基准：BCFLStrategy + N 个 BCFLClient，全部运行在当前进程内
+
+IPFS 与区块链分别由 fakes.InMemoryIPFSUtils 与 fakes.InProcessChain（eth-tester）代替，
+客户端通过 fakes.InProcessClientProxy 直接注册到与 server_main 相同的 DeadlineServer /
+BufferedAsyncServer，因此不依赖 Ganache、IPFS 守护进程或网络，结果可复现。
+默认使用合成的类 MNIST 数据（--data mnist 使用仓库 data/ 下的真实数据缓存）。
+
+输出一个 JSON 对象：各阶段耗时分布（服务器与客户端的方法级计时、IPFS 会话统计）、
+吞吐量（更新数/秒、样本数/秒、IPFS 字节数）、链上 gas 总量、本进程峰值RSS与 History 中的评估结果，
+便于在不同版本之间比较。
+
+用法: python benchmarks/bench_rounds.py --clients 4 --rounds 3 --output rounds.json
+"""
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - Bench - %(message)s')
+
+import flwr as fl
+import numpy as np
+import torch
+
+from async_server import BufferedAsyncServer
+from client import BCFLClient
+from data import _cache_paths, _save_npy
+from deadline_server import DeadlineServer
+from fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain, InProcessClientProxy
+from ipfs_utils import LatencyStats
+from model import CNN
+from server import BCFLStrategy
+from server_main import advance_to_next_round, initialize_task, select_trainers_for_round
+import telemetry
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class PhaseTimer:
+    """把对象的方法替换为计时包装，按阶段名汇总到 LatencyStats"""
+
+    def __init__(self):
+        self.stats = LatencyStats(window=100000)
+
+    def wrap(self, obj, name, phase):
+        fn = getattr(obj, name)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self.stats.record(phase, time.perf_counter() - start, ok)
+
+        setattr(obj, name, timed)
+
+
+def write_synthetic_data(root, num_train, num_test, seed=0):
+    """按 data.load_arrays 的缓存格式写入随机的类 MNIST 数组"""
+    rng = np.random.default_rng(seed)
+    for split, n in (("train", num_train), ("test", num_test)):
+        images_path, labels_path = _cache_paths(root, split)
+        os.makedirs(os.path.dirname(images_path), exist_ok=True)
+        _save_npy(rng.integers(0, 10, size=n, dtype=np.int64), labels_path)
+        _save_npy(rng.standard_normal((n, 1, 28, 28), dtype=np.float32), images_path)
+
+
+def merge_ipfs_stats(utils_list):
+    """合并多个 IPFSUtils 的会话统计（计数与总耗时相加，分位数取最大值）"""
+    merged = {}
+    for utils in utils_list:
+        for op, entry in utils.session_stats().items():
+            total = merged.setdefault(op, {"count": 0, "errors": 0, "total_s": 0.0, "p50_s": 0.0, "p95_s": 0.0,
+                                           "max_s": 0.0})
+            total["count"] += entry["count"]
+            total["errors"] += entry["errors"]
+            total["total_s"] += entry["mean_s"] * entry["count"]
+            for key in ("p50_s", "p95_s", "max_s"):
+                total[key] = max(total[key], entry[key])
+    for entry in merged.values():
+        entry["mean_s"] = entry["total_s"] / entry["count"] if entry["count"] else 0.0
+    return merged
+
+
+def run(args):
+    timer = PhaseTimer()
+    telemetry.reset()
+    telemetry.enable(trace_dir=args.trace_dir, process_name="bench")
+    store = InMemoryIPFSStore()
+    chain = InProcessChain()
+    trainers = args.trainers or args.clients
+    if args.clients + 1 > len(chain.accounts):
+        raise ValueError(f"eth-tester 只有 {len(chain.accounts)} 个账户，最多支持 {len(chain.accounts) - 1} 个客户端")
+
+    server_chain = chain.utils(0)
+    server_ipfs = InMemoryIPFSUtils(store)
+    timer.wrap(server_chain, "transact", "server.chain_tx")
+
+    # 与 server_main.run_server 相同的任务初始化，提示信息输出到 stderr，不混入 JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        genesis_cid = server_ipfs.upload_model(CNN())
+        initialize_task(server_chain, genesis_cid, args.rounds, trainers)
+        advance_to_next_round(server_chain, 0, genesis_cid)
+        select_trainers_for_round(server_chain, 1, chain.accounts[1:trainers + 1])
+
+    strategy = BCFLStrategy(server_chain, server_ipfs, model_class=CNN, update_codec=args.codec,
+                            aggregation=args.aggregation, over_selection=args.over_selection,
+                            straggler_wait=args.round_deadline,
+                            async_evaluate=not args.sync_evaluate, transport=args.transport,
+                            inline_max_bytes=args.inline_max_bytes)
+    for name, phase in (("configure_fit", "server.configure_fit"), ("aggregate_fit", "server.aggregate_fit"),
+                        ("aggregate_buffered", "server.aggregate_buffered"), ("_commit_global", "server.commit_global"),
+                        ("_evaluate_global", "server.evaluate")):
+        timer.wrap(strategy, name, phase)
+
+    client_manager = fl.server.SimpleClientManager()
+    clients, client_ipfs = [], []
+    examples = {"count": 0}
+    examples_lock = threading.Lock()
+    for i in range(1, args.clients + 1):
+        blockchain_utils = chain.utils(i)
+        ipfs_utils = InMemoryIPFSUtils(store)
+        timer.wrap(blockchain_utils, "transact", "client.chain_tx")
+        timer.wrap(ipfs_utils, "load_state_dict", "client.load_global")
+        timer.wrap(ipfs_utils, "upload_state_dict", "client.upload")
+        client = BCFLClient(blockchain_utils, ipfs_utils, i, CNN, num_clients=args.clients, partition=args.partition,
+                            prefetch=not args.no_prefetch)
+        proxy = InProcessClientProxy(str(i), client)
+        fit = proxy.fit
+
+        def counted_fit(ins, timeout, group_id, fit=fit):
+            res = fit(ins, timeout, group_id)
+            with examples_lock:
+                examples["count"] += res.num_examples
+            return res
+
+        proxy.fit = counted_fit
+        timer.wrap(proxy, "fit", "client.fit")
+        client_manager.register(proxy)
+        clients.append(client)
+        client_ipfs.append(ipfs_utils)
+
+    if args.async_buffer > 0:
+        server = BufferedAsyncServer(client_manager=client_manager, strategy=strategy, buffer_size=args.async_buffer)
+    else:
+        server = DeadlineServer(client_manager=client_manager, strategy=strategy, round_deadline=args.round_deadline)
+        timer.wrap(server, "fit_round", "server.round")
+
+    start = time.perf_counter()
+    history, _ = server.fit(args.rounds, timeout=None)
+    strategy.collect_evaluations(history)
+    wall = time.perf_counter() - start
+
+    strategy.shutdown()
+    for client in clients:
+        # 内联传输时客户端的IPFS上传与链上提交在后台进行，统计前等待其完成
+        client.flush()
+        if client.prefetcher is not None:
+            client.prefetcher.close()
+    for ipfs_utils in client_ipfs:
+        ipfs_utils.close()
+
+    phases = timer.stats.snapshot()
+    num_updates = phases.get("client.fit", {}).get("count", 0)
+    store_stats = store.stats()
+    return {
+        "revision": git_revision(),
+        "versions": {"torch": torch.__version__, "flwr": fl.__version__, "numpy": np.__version__},
+        "config": vars(args),
+        "wall_s": wall,
+        "final_round": server_chain.get_current_round(),
+        "phases": phases,
+        "spans": telemetry.snapshot(),
+        "ipfs": {"server": merge_ipfs_stats([server_ipfs]), "clients": merge_ipfs_stats(client_ipfs),
+                 "store": store_stats},
+        "throughput": {
+            "rounds_per_s": args.rounds / wall,
+            "updates_per_s": num_updates / wall,
+            "examples_per_s": examples["count"] / wall,
+            "ipfs_mb_per_s": (store_stats["bytes_added"] + store_stats["bytes_read"]) / wall / 2 ** 20,
+        },
+        "gas_used": chain.gas_used(),
+        "peak_rss_mb": peak_rss_mb(),
+        "losses_centralized": history.losses_centralized,
+        "metrics_centralized": history.metrics_centralized,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端轮次基准（进程内IPFS与区块链）")
+    parser.add_argument("--clients", type=int, default=4, help="客户端数量（eth-tester 提供 10 个账户，最多 9 个）")
+    parser.add_argument("--trainers", type=int, default=None, help="任务的训练者数量，默认等于客户端数量")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--data", type=str, default="synthetic", choices=["synthetic", "mnist"])
+    parser.add_argument("--samples_per_client", type=int, default=256, help="合成数据中每个客户端的训练样本数")
+    parser.add_argument("--test_samples", type=int, default=1000, help="合成数据的测试样本数")
+    parser.add_argument("--partition", type=str, default="iid", choices=["iid", "dirichlet"])
+    parser.add_argument("--codec", type=str, default="none", help="客户端更新编码")
+    parser.add_argument("--aggregation", type=str, default="fedavg")
+    parser.add_argument("--transport", type=str, default="ipfs", choices=["ipfs", "inline"], help="客户端更新的传输方式")
+    parser.add_argument("--inline_max_bytes", type=int, default=4 * 1024 * 1024, help="内联发送的更新大小上限（字节）")
+    parser.add_argument("--over_selection", type=float, default=1.0)
+    parser.add_argument("--round_deadline", type=float, default=None)
+    parser.add_argument("--async_buffer", type=int, default=0, help="大于0时使用异步缓冲聚合")
+    parser.add_argument("--sync_evaluate", action="store_true", help="在聚合线程中同步评估全局模型")
+    parser.add_argument("--no_prefetch", action="store_true", help="关闭客户端的全局模型预取")
+    parser.add_argument("--trace_dir", type=str, default=None, help="按轮次写出 Chrome trace 文件的目录")
+    parser.add_argument("--workdir", type=str, default=None, help="数据缓存与模型缓存所在目录，默认使用临时目录")
+    parser.add_argument("--output", type=str, default=None, help="JSON 结果文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bcfl-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    if args.trace_dir is not None:
+        args.trace_dir = os.path.abspath(args.trace_dir)
+    # 客户端与策略按相对路径 data/ 读取数据缓存
+    os.chdir(workdir)
+    try:
+        if args.data == "synthetic":
+            write_synthetic_data("data", args.samples_per_client * args.clients, args.test_samples)
+        elif not os.path.exists("data"):
+            os.symlink(os.path.join(REPO_DIR, "data"), "data")
+        report = run(args)
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""基准测试用的进程内替身：内存中的内容寻址存储与 eth-tester 区块链
+
+InMemoryIPFSUtils 只替换 IPFSUtils 的连接（会话池返回 InMemoryIPFSClient），序列化、分块、
+本地缓存与统计仍走真实代码；InProcessChain 在 py-evm 上部署 build/contracts/BCFL.json 中的合约，
+返回的 BlockchainUtils 与连接真实节点时完全相同。两者都不需要 Ganache 或 IPFS 守护进程。
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import base58
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flwr as fl
+from flwr.common import Code, Status, ndarrays_to_parameters
+from flwr.server.client_proxy import ClientProxy
+from web3 import EthereumTesterProvider, Web3
+
+from blockchain_utils import BlockchainUtils
+from ipfs_utils import IPFSSessionPool, IPFSUtils
+
+DEFAULT_ARTIFACT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "build", "contracts", "BCFL.json")
+
+
+def _field(number, value):
+    """protobuf 的 varint（int）或长度前缀（bytes）字段"""
+    def varint(n):
+        out = b""
+        while True:
+            low, n = n & 0x7F, n >> 7
+            out += bytes([low | 0x80 if n else low])
+            if not n:
+                return out
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def _dag_node(links, data, filesize):
+    """dag-pb 节点（Links 在前、Data 在后）包装的 UnixFS File，返回 (multihash, 累计大小, 文件大小)"""
+    unixfs = _field(1, 2)
+    if data:
+        unixfs += _field(2, data)
+    unixfs += _field(3, filesize)
+    for link in links:
+        unixfs += _field(4, link[2])
+    encoded = b""
+    for link in links:
+        encoded += _field(2, _field(1, link[0]) + _field(2, b"") + _field(3, link[1]))
+    encoded += _field(1, unixfs)
+    return b"\x12\x20" + hashlib.sha256(encoded).digest(), len(encoded) + sum(link[1] for link in links), filesize
+
+
+def content_cid(data, chunk_size=256 * 1024, max_links=174):
+    """ipfs add 默认参数下的 CIDv0
+
+    按 go-unixfs balanced builder 的自顶向下过程构建：先得到第一个叶子，之后每次以旧根为第一个子节点
+    创建更深一层的新根，并递归填满 max_links 个子节点，直到数据用完。与 ipfs_utils.compute_cid 的
+    自底向上分组相互独立实现，存储返回的CID因此可以检验内联传输时客户端本地计算的CID。
+    """
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] or [b""]
+    position = 0
+
+    def leaf():
+        nonlocal position
+        chunk = chunks[position]
+        position += 1
+        return _dag_node([], chunk, len(chunk))
+
+    def fill(links, depth):
+        while len(links) < max_links and position < len(chunks):
+            links.append(leaf() if depth == 1 else fill([], depth - 1))
+        return _dag_node(links, None, sum(link[2] for link in links))
+
+    root, depth = leaf(), 1
+    while position < len(chunks):
+        root = fill([root], depth)
+        depth += 1
+    return base58.b58encode(root[0]).decode()
+
+
+class InMemoryIPFSStore:
+    """线程安全的内容寻址字节存储，可被多个 InMemoryIPFSUtils 共享"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+        self.bytes_added = 0
+        self.bytes_read = 0
+
+    def put(self, data):
+        data = bytes(data)
+        cid = content_cid(data)
+        with self._lock:
+            self._objects[cid] = data
+            self.bytes_added += len(data)
+        return cid
+
+    def get(self, cid):
+        with self._lock:
+            data = self._objects.get(cid)
+            if data is None:
+                raise KeyError(f"CID {cid} 不存在")
+            self.bytes_read += len(data)
+            return data
+
+    def stats(self):
+        with self._lock:
+            return {"objects": len(self._objects), "stored_bytes": sum(map(len, self._objects.values())),
+                    "bytes_added": self.bytes_added, "bytes_read": self.bytes_read}
+
+
+class InMemoryIPFSClient:
+    """实现 IPFSUtils 用到的 ipfshttpclient 会话接口（version / add_bytes / cat / close）"""
+
+    def __init__(self, store, chunk_size=1024 * 1024):
+        self.store = store
+        self.chunk_size = chunk_size
+
+    def version(self):
+        return {"Version": "in-memory"}
+
+    def add_bytes(self, data, opts=None):
+        # 存储总是按默认布局（即 ipfs_utils.IPFS_ADD_OPTIONS）计算CID
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = b"".join(data)
+        return self.store.put(data)
+
+    def cat(self, cid, stream=False, timeout=None):
+        data = self.store.get(cid)
+        if not stream:
+            return data
+        view = memoryview(data)
+        return (bytes(view[i:i + self.chunk_size]) for i in range(0, len(data), self.chunk_size))
+
+    def close(self):
+        pass
+
+
+class InMemoryIPFSSessionPool(IPFSSessionPool):
+    def __init__(self, store, size=4):
+        super().__init__("memory", size=size)
+        self.store = store
+
+    def _connect(self):
+        return InMemoryIPFSClient(self.store)
+
+
+class InMemoryIPFSUtils(IPFSUtils):
+    """连接到 InMemoryIPFSStore 的 IPFSUtils；默认关闭本地缓存，使每次下载都经过存储"""
+
+    def __init__(self, store=None, use_cache=False, cache_dir=None, pool_size=4):
+        self.store = store if store is not None else InMemoryIPFSStore()
+        kwargs = {} if cache_dir is None else {"cache_dir": cache_dir}
+        super().__init__(ipfs_api="memory", use_cache=use_cache, pool_size=pool_size, **kwargs)
+
+    def _make_pool(self, pool_size):
+        return InMemoryIPFSSessionPool(self.store, size=pool_size)
+
+
+class SerializedTesterProvider(EthereumTesterProvider):
+    """eth-tester 不是线程安全的，服务器、客户端与事件监听线程的请求在这里串行执行"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._request_lock = threading.RLock()
+
+    def make_request(self, method, params):
+        with self._request_lock:
+            return super().make_request(method, params)
+
+
+class InProcessChain:
+    """在进程内 EVM 上部署 BCFL 合约；utils(i) 返回以第 i 个测试账户发送交易的 BlockchainUtils"""
+
+    def __init__(self, artifact_path=DEFAULT_ARTIFACT, poll_interval=0.01):
+        with open(artifact_path, "r") as f:
+            artifact = json.load(f)
+        self.abi = artifact["abi"]
+        self.poll_interval = poll_interval
+        self.provider = SerializedTesterProvider()
+        self.web3 = Web3(self.provider)
+        contract = self.web3.eth.contract(abi=self.abi, bytecode=artifact["bytecode"])
+        tx_hash = contract.constructor().transact({"from": self.web3.eth.accounts[0]})
+        self.address = self.web3.eth.wait_for_transaction_receipt(tx_hash).contractAddress
+
+    @property
+    def accounts(self):
+        return self.web3.eth.accounts
+
+    def utils(self, account=0, **kwargs):
+        kwargs.setdefault("poll_interval", self.poll_interval)
+        return BlockchainUtils(self.provider, self.address, self.abi, account=account, **kwargs)
+
+    def gas_used(self):
+        """从创世区块到当前区块所有交易消耗的 gas 总量"""
+        return sum(self.web3.eth.get_block(number)["gasUsed"] for number in range(self.web3.eth.block_number + 1))
+
+
+class InProcessClientProxy(ClientProxy):
+    """直接在当前进程中调用 NumPyClient 的 ClientProxy，代替 gRPC 连接"""
+
+    def __init__(self, cid, client):
+        super().__init__(cid)
+        self.client = client
+
+    def fit(self, ins, timeout, group_id):
+        parameters, num_examples, metrics = self.client.fit(fl.common.parameters_to_ndarrays(ins.parameters),
+                                                            ins.config)
+        return fl.common.FitRes(Status(Code.OK, ""), ndarrays_to_parameters(parameters), num_examples, metrics)
+
+    def evaluate(self, ins, timeout, group_id):
+        loss, num_examples, metrics = self.client.evaluate(fl.common.parameters_to_ndarrays(ins.parameters),
+                                                           ins.config)
+        return fl.common.EvaluateRes(Status(Code.OK, ""), loss, num_examples, metrics)
+
+    def get_properties(self, ins, timeout, group_id):
+        return fl.common.GetPropertiesRes(Status(Code.OK, ""), self.client.get_properties(ins.config))
+
+    def get_parameters(self, ins, timeout, group_id):
+        return fl.common.GetParametersRes(Status(Code.OK, ""),
+                                          ndarrays_to_parameters(self.client.get_parameters(ins.config)))
+
+    def reconnect(self, ins, timeout, group_id):
+        return fl.common.DisconnectRes(reason="")
@@ -1,54 +1,713 @@
 from web3 import Web3
+from web3.exceptions import TransactionNotFound, Web3TypeError
+from concurrent.futures import Future
+from eth_abi import decode
+from eth_utils import get_abi_output_types
+import base58
+import threading
 import logging
+import re
+import time
+from chain_indexer import ChainIndexer
+import telemetry
+
+
+class TransactionError(Exception):
+    """交易被打包但执行失败（status=0），或在超时时间内未得到确认"""
+
+
+CID_ENCODINGS = ("string", "bytes32")
+# sha2-256 multihash 前缀：函数码 0x12、摘要长度 0x20
+_SHA256_MULTIHASH = b"\x12\x20"
+EMPTY_DIGEST = b"\x00" * 32
+
+
+def cid_to_bytes32(cid):
+    """把 CIDv0（base58 编码的 sha2-256 multihash，即 "Qm..."）转换为32字节摘要，其他形式抛出 ValueError"""
+    try:
+        multihash = base58.b58decode(cid)
+    except Exception as e:
+        raise ValueError(f"无法解码CID {cid}: {e}")
+    if len(multihash) != 34 or not multihash.startswith(_SHA256_MULTIHASH):
+        raise ValueError(f"CID {cid} 不是 sha2-256 的 CIDv0，无法压缩为 bytes32")
+    return multihash[2:]
+
+
+def bytes32_to_cid(digest):
+    """cid_to_bytes32 的逆变换；全零摘要（未提交）返回空字符串"""
+    digest = bytes(digest)
+    if digest == EMPTY_DIGEST:
+        return ""
+    return base58.b58encode(_SHA256_MULTIHASH + digest).decode()
+
+
+def update_leaf(trainer, round_num, digest):
+    """更新承诺的 Merkle 叶子，与合约 verifyUpdate 中的 keccak256(abi.encodePacked(trainer, round, digest)) 一致"""
+    return bytes(Web3.solidity_keccak(["address", "uint256", "bytes32"], [trainer, round_num, digest]))
+
+
+def _hash_pair(a, b):
+    return bytes(Web3.keccak(a + b if a < b else b + a))
+
+
+def merkle_root(leaves):
+    """按排序后成对哈希构建 Merkle 树并返回根；落单的节点直接提升到上一层"""
+    if not leaves:
+        return EMPTY_DIGEST
+    level = list(leaves)
+    while len(level) > 1:
+        level = [_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def merkle_proof(leaves, index):
+    """返回第 index 个叶子的包含证明（自底向上的兄弟节点列表），可交给合约 verifyUpdate 校验"""
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        level = [_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        index //= 2
+    return proof
+
+
+def _checksum_addresses(abi_type, value):
+    """eth_abi 解码出的地址为小写，与 web3 的 call() 一样转换为校验和地址"""
+    if abi_type == "address":
+        return Web3.to_checksum_address(value)
+    if abi_type == "address[]":
+        return [Web3.to_checksum_address(item) for item in value]
+    return value
+
+
+def verify_merkle_proof(leaf, proof, root):
+    node = leaf
+    for sibling in proof:
+        node = _hash_pair(node, sibling)
+    return node == bytes(root)
+
+
+DEFAULT_CONTRACT_SOURCE = "contracts/BCFL.sol"
+_DECLARATION = re.compile(r"\b(function|event)\s+(\w+)\s*\(([^)]*)\)([^{;]*)")
+
+
+def _canonical_type(param):
+    """Solidity 参数声明 -> (ABI 类型, 是否 indexed)，uint/int 规范化为 uint256/int256"""
+    words = [word for word in param.split() if word not in ("memory", "calldata", "storage", "payable")]
+    base, suffix = re.match(r"(\w+)(.*)", words[0]).groups()
+    base = {"uint": "uint256", "int": "int256"}.get(base, base)
+    return base + suffix, "indexed" in words[1:]
+
+
+def source_signatures(source):
+    """Solidity 源码中外部可见的函数与事件签名，事件的 indexed 参数带 " indexed" 后缀"""
+    signatures = set()
+    for kind, name, params, modifiers in _DECLARATION.findall(source):
+        if kind == "function" and re.search(r"\b(private|internal)\b", modifiers):
+            continue
+        types = []
+        for param in filter(None, (param.strip() for param in params.split(","))):
+            abi_type, indexed = _canonical_type(param)
+            types.append(abi_type + (" indexed" if kind == "event" and indexed else ""))
+        signatures.add(f"{name}({','.join(types)})")
+    return signatures
+
+
+def abi_signatures(abi):
+    signatures = set()
+    for item in abi:
+        if item.get("type") not in ("function", "event"):
+            continue
+        types = [param["type"] + (" indexed" if param.get("indexed") else "") for param in item.get("inputs", [])]
+        signatures.add(f"{item['name']}({','.join(types)})")
+    return signatures
+
+
+def abi_drift(abi, source_path=DEFAULT_CONTRACT_SOURCE):
+    """源码中声明、但编译产物的 ABI 中没有（或参数、indexed 不同）的函数与事件签名；读不到源码时返回空列表
+
+    非空说明 build/contracts/BCFL.json 是旧源码的编译产物，需要 truffle compile 重新编译后再部署。
+    """
+    try:
+        with open(source_path, "r") as f:
+            source = f.read()
+    except OSError:
+        return []
+    return sorted(source_signatures(source) - abi_signatures(abi))
+
+
+class NonceManager:
+    """本地nonce管理器：首次从节点读取pending交易数，之后在本地递增，避免每笔交易查询节点"""
+
+    def __init__(self, web3, account):
+        self.web3 = web3
+        self.account = account
+        self._lock = threading.Lock()
+        self._next = None
+
+    def allocate(self):
+        with self._lock:
+            if self._next is None:
+                self._next = self.web3.eth.get_transaction_count(self.account, "pending")
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def resync(self):
+        """发送失败后nonce可能出现空洞，下次分配时重新从节点读取"""
+        with self._lock:
+            self._next = None
+
+
+class TransactionPipeline:
+    """流水线式交易提交器
+
+    submit 在本地分配nonce并立即发送交易，返回一个 concurrent.futures.Future；
+    后台线程轮询所有未确认交易的回执，达到确认深度后完成对应的 Future。
+    同一账户的交易按nonce顺序上链，调用方可以连续发送多笔交易后一起等待。
+    """
+
+    def __init__(self, web3, account, confirmations=1, poll_interval=0.2, timeout=120):
+        self.web3 = web3
+        self.account = account
+        self.confirmations = max(1, confirmations)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.nonces = NonceManager(web3, account)
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._poller = None
+        self._closed = False
+
+    def submit(self, contract_fn, tx_params=None):
+        """发送合约调用交易，返回在回执确认后完成的 Future"""
+        future = Future()
+        params = {"from": self.account}
+        if tx_params:
+            params.update(tx_params)
+        with self._send_lock:
+            params["nonce"] = self.nonces.allocate()
+            try:
+                tx_hash = contract_fn.transact(params)
+            except Exception as e:
+                # 交易未发出，已分配的nonce作废
+                self.nonces.resync()
+                future.set_exception(e)
+                return future
+        with self._cond:
+            self._pending[tx_hash] = (future, time.monotonic())
+            self._ensure_poller()
+            self._cond.notify()
+        return future
+
+    def _ensure_poller(self):
+        if self._poller is None or not self._poller.is_alive():
+            self._poller = threading.Thread(target=self._poll_loop, name="tx-receipt-poller", daemon=True)
+            self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                pending = list(self._pending.items())
+            try:
+                head = self.web3.eth.block_number
+            except Exception as e:
+                logging.warning(f"获取最新区块失败: {e}")
+                head = None
+            for tx_hash, (future, submitted_at) in pending:
+                receipt = None
+                if head is not None:
+                    try:
+                        receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+                    except TransactionNotFound:
+                        pass
+                    except Exception as e:
+                        # 查询持续失败时仍按超时结束该交易，等待回执的调用方不会永久阻塞
+                        logging.warning(f"查询交易回执失败: {e}")
+                done = False
+                if receipt is not None and head - receipt["blockNumber"] + 1 >= self.confirmations:
+                    if receipt["status"] == 0:
+                        future.set_exception(TransactionError(f"交易 {tx_hash.hex()} 执行失败"))
+                    else:
+                        future.set_result(receipt)
+                    done = True
+                elif time.monotonic() - submitted_at > self.timeout:
+                    future.set_exception(TransactionError(f"交易 {tx_hash.hex()} 在 {self.timeout}s 内未确认"))
+                    done = True
+                if done:
+                    with self._cond:
+                        self._pending.pop(tx_hash, None)
+            with self._cond:
+                if self._pending:
+                    self._cond.wait(self.poll_interval)
+
+    def close(self):
+        """停止接收新交易，后台线程在已发送交易全部完成后退出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+
+class EventWatcher:
+    """合约事件订阅：后台线程每隔 poll_interval 拉取新事件并调用 callback(args, log)
+
+    启用本地索引器时注册为索引器的监听器，由索引器同步时分发；否则按事件主题过滤，
+    用 eth_getLogs 从上次处理到的区块继续拉取。poll() 可在需要最新状态时同步调用一次。
+    """
+
+    def __init__(self, web3, contract, event_name, callback, indexer=None, poll_interval=1.0, from_block=None):
+        self.web3 = web3
+        self.contract = contract
+        self.event_name = event_name
+        self.callback = callback
+        self.indexer = indexer
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if indexer is not None:
+            indexer.add_listener(event_name, callback)
+        else:
+            self._event = getattr(contract.events, event_name)()
+            self._next_block = web3.eth.block_number if from_block is None else from_block
+
+    def poll(self):
+        """拉取并分发新事件，返回处理的事件数"""
+        if self.indexer is not None:
+            return self.indexer.sync(force=True)
+        with self._lock:
+            head = self.web3.eth.block_number
+            if head < self._next_block:
+                return 0
+            logs = self.web3.eth.get_logs({
+                "address": self.contract.address,
+                "topics": [self._event.topic],
+                "fromBlock": self._next_block,
+                "toBlock": head,
+            })
+            self._next_block = head + 1
+            # 持锁分发，保证并发 poll 时回调仍按区块顺序执行
+            for log in logs:
+                try:
+                    self.callback(self._event.process_log(log)["args"], log)
+                except Exception as e:
+                    logging.warning(f"事件 {self.event_name} 的回调执行失败: {e}")
+            return len(logs)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    logging.warning(f"拉取事件 {self.event_name} 失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name=f"watch-{self.event_name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.indexer is not None:
+            self.indexer.remove_listener(self.event_name, self.callback)
+
 
 class BlockchainUtils:
-    def __init__(self, provider_url, contract_address, abi):
-        self.web3 = Web3(Web3.HTTPProvider(provider_url))
+    def __init__(self, provider_url, contract_address, abi, account=None, confirmations=1,
+                 use_indexer=False, index_path=None, min_sync_interval=1.0, poll_interval=0.2,
+                 cid_encoding="string", deployment_block=None):
+        """account 可以是账户地址或节点账户列表中的索引，默认使用第0个账户
+
+        provider_url 也可以直接传入 web3 provider 对象（例如进程内的 EthereumTesterProvider）。
+        use_indexer 时合约读取由本地事件索引（见 chain_indexer.ChainIndexer）提供。
+        poll_interval 为交易回执的轮询间隔（秒）。
+        cid_encoding="bytes32" 时更新与全局模型CID以32字节摘要提交（submitUpdateDigest /
+        submitGlobalModelDigest）；读取总是同时识别两种形式。
+        deployment_block 为合约部署所在区块，事件日志从这里开始扫描；未指定时首次需要时查找（见 deployment_block()）。
+        """
+        if cid_encoding not in CID_ENCODINGS:
+            raise ValueError(f"未知的CID编码: {cid_encoding}")
+        provider = Web3.HTTPProvider(provider_url) if isinstance(provider_url, str) else provider_url
+        self.web3 = Web3(provider)
         self.contract = self.web3.eth.contract(address=contract_address, abi=abi)
-        self.account = self.web3.eth.accounts[0]
+        if account is None or isinstance(account, int):
+            account = self.web3.eth.accounts[account or 0]
+        self.account = account
+        self.tx_pipeline = TransactionPipeline(self.web3, self.account, confirmations=confirmations,
+                                               poll_interval=poll_interval)
+        self._deployment_block = deployment_block
+        self.indexer = None
+        if use_indexer:
+            self.indexer = ChainIndexer(self.web3, self.contract, index_path, from_block=self.deployment_block(),
+                                        min_sync_interval=min_sync_interval)
+        if cid_encoding == "bytes32" and not self.has_function("submitUpdateDigest"):
+            logging.warning("合约ABI中没有 submitUpdateDigest，请重新编译部署合约；CID 仍以字符串提交")
+            cid_encoding = "string"
+        self.cid_encoding = cid_encoding
+        # provider 不支持 JSON-RPC 批量请求（例如 EthereumTesterProvider）时退回逐个调用
+        self._batching = True
+
+    def has_function(self, name):
+        """合约ABI中是否有名为 name 的函数（旧部署的合约没有紧凑模式与批量接口）"""
+        return any(item.get("type") == "function" and item.get("name") == name for item in self.contract.abi)
+
+    def has_event(self, name):
+        return any(item.get("type") == "event" and item.get("name") == name for item in self.contract.abi)
 
+    def deployment_block(self):
+        """合约部署所在的区块号，按 eth_getCode 二分查找并缓存；节点不支持历史状态查询时返回 0"""
+        if self._deployment_block is None:
+            try:
+                address = self.contract.address
+                low, high = 0, self.web3.eth.block_number
+                while low < high:
+                    mid = (low + high) // 2
+                    if self.web3.eth.get_code(address, mid):
+                        high = mid
+                    else:
+                        low = mid + 1
+                self._deployment_block = low
+            except Exception as e:
+                logging.warning(f"查找合约部署区块失败，事件日志将从创世区块开始扫描: {e}")
+                self._deployment_block = 0
+        return self._deployment_block
+
+    def _round_logs(self, event_name, round_num):
+        """读取 event_name 事件中 round 等于 round_num 的日志，按区块与日志序号排序
+
+        ABI 中 round 为 indexed 参数时由节点按 topic 过滤；旧合约的事件没有 indexed round，
+        只能取回部署以来该事件的全部日志在本地过滤，代价随合约历史增长。
+        """
+        event = getattr(self.contract.events, event_name)
+        start = self.deployment_block()
+        if self._round_indexed(event_name):
+            logs = event.get_logs(argument_filters={"round": round_num}, from_block=start)
+        else:
+            logs = [log for log in event.get_logs(from_block=start) if log["args"]["round"] == round_num]
+        return sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"]))
+
+    def _round_indexed(self, event_name):
+        for item in self.contract.abi:
+            if item.get("type") == "event" and item.get("name") == event_name:
+                return any(arg["name"] == "round" and arg.get("indexed") for arg in item["inputs"])
+        return False
+
+    def _digest(self, cid):
+        """紧凑模式下返回CID的32字节摘要；未启用或CID无法压缩时返回 None，调用方按字符串提交"""
+        if self.cid_encoding != "bytes32":
+            return None
+        try:
+            return cid_to_bytes32(cid)
+        except ValueError as e:
+            logging.warning(f"{e}，按字符串提交")
+            return None
+
+    def transact(self, contract_fn, wait=True):
+        """通过本地nonce流水线发送交易；wait=False 时返回 Future，否则阻塞等待回执"""
+        with telemetry.span("chain.send", fn=contract_fn.fn_name):
+            future = self.tx_pipeline.submit(contract_fn)
+        telemetry.count("chain_transactions", fn=contract_fn.fn_name)
+        if self.indexer is not None:
+            self.indexer.mark_dirty()
+            future.add_done_callback(lambda _: self.indexer.mark_dirty())
+        if not wait:
+            return future
+        with telemetry.span("chain.receipt_wait", fn=contract_fn.fn_name):
+            return future.result()
+
+    def batch_call(self, calls):
+        """在一次往返中执行多个只读合约调用，返回与 calls 顺序一致的结果列表
+
+        calls 为绑定了参数的合约函数，例如 contract.functions.getSelectedTrainers(1)。
+        合约提供 multicall 时打包成一次 eth_call（同一区块上的一致读取）；否则用一个
+        JSON-RPC 批量请求；provider 不支持批量请求时逐个调用。
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+        with telemetry.span("chain.batch_call", calls=len(calls)) as span:
+            if self.has_function("multicall"):
+                span.set(method="multicall")
+                return self._multicall(calls)
+            if self._batching:
+                try:
+                    with self.web3.batch_requests() as batch:
+                        for fn in calls:
+                            batch.add(fn)
+                        span.set(method="json_rpc_batch")
+                        return list(batch.execute())
+                except Web3TypeError:
+                    logging.info("provider 不支持 JSON-RPC 批量请求，逐个执行合约调用")
+                    self._batching = False
+            span.set(method="sequential")
+            return [fn.call() for fn in calls]
+
+    def _multicall(self, calls):
+        outputs = self.contract.functions.multicall([fn._encode_transaction_data() for fn in calls]).call()
+        results = []
+        for fn, output in zip(calls, outputs):
+            types = get_abi_output_types(fn.abi)
+            values = [_checksum_addresses(t, v) for t, v in zip(types, decode(types, output))]
+            # 与 call() 一致：单个返回值直接返回，多个返回值返回列表
+            results.append(values[0] if len(values) == 1 else values)
+        return results
+
+    def subscribe(self, event_name, callback, poll_interval=1.0):
+        """订阅合约事件，返回已启动的 EventWatcher；只分发订阅之后出现的事件"""
+        return EventWatcher(self.web3, self.contract, event_name, callback, indexer=self.indexer,
+                            poll_interval=poll_interval).start()
+
+    def _indexed(self):
+        """返回已同步到最新区块的索引器，未启用时返回 None"""
+        if self.indexer is None:
+            return None
+        self.indexer.sync()
+        return self.indexer
+
+    @telemetry.traced("chain.get_task")
+    def get_task(self):
+        """获取任务信息 (creator, genesisModelCID, totalRounds, trainerCount, initialized)"""
+        if self.indexer is not None:
+            return self.indexer.task()
+        return tuple(self.contract.functions.task().call())
+
+    @telemetry.traced("chain.get_current_round")
     def get_current_round(self):
         """获取当前训练轮次"""
         try:
+            indexer = self._indexed()
+            if indexer is not None:
+                return indexer.current_round()
             return self.contract.functions.getCurrentRound().call()
         except Exception as e:
             logging.error(f"获取当前轮次失败: {e}")
             raise
 
+    @telemetry.traced("chain.get_global_model_cid")
     def get_global_model_cid(self, round_num):
         """获取指定轮次的全局模型CID"""
         try:
-            cid = self.contract.functions.getGlobalModelCID(round_num).call()
+            indexer = self._indexed()
+            if indexer is not None:
+                cid = indexer.global_model_cid(round_num)
+            else:
+                cid = ""
+                if self.has_function("getGlobalModelDigest"):
+                    cid = bytes32_to_cid(self.contract.functions.getGlobalModelDigest(round_num).call())
+                if not cid:
+                    cid = self.contract.functions.getGlobalModelCID(round_num).call()
             return cid if cid else ""
         except Exception as e:
             logging.error(f"获取轮次 {round_num} 的全局模型CID失败: {e}")
             return ""
 
-    def submit_update_cid(self, round_num, cid):
+    @telemetry.traced("chain.get_update_cids")
+    def get_update_cids(self, round_num):
+        """获取指定轮次各训练者提交的更新CID {训练者地址: CID}
+
+        合约没有读取 updates 映射的视图函数，因此从 UpdateSubmitted / UpdateDigestSubmitted 事件中获取。
+        以 Merkle 根提交的轮次不在其中，见 get_update_root。
+        """
+        indexer = self._indexed()
+        if indexer is not None:
+            return indexer.update_cids(round_num)
+        logs = self._round_logs("UpdateSubmitted", round_num)
+        if self.has_event("UpdateDigestSubmitted"):
+            logs += self._round_logs("UpdateDigestSubmitted", round_num)
+            logs.sort(key=lambda log: (log["blockNumber"], log["logIndex"]))
+        updates = {}
+        for log in logs:
+            args = log["args"]
+            updates[args["trainer"]] = args["cid"] if "cid" in args else bytes32_to_cid(args["digest"])
+        return updates
+
+    @telemetry.traced("chain.get_update_commitments")
+    def get_update_commitments(self, first_round, last_round, from_block=None):
+        """读取 first_round 到 last_round 各轮的更新提交，返回 ({(训练者地址, CID)}, 下次读取的起始区块)
+
+        供轮询使用：from_block 为上次返回的区块时只扫描其后新出的区块，每次轮询的代价与合约历史无关；
+        为 None 时从部署区块开始。启用索引时直接查询本地索引，返回的起始区块为 None。
+        """
+        rounds = list(range(first_round, last_round + 1))
+        indexer = self._indexed()
+        if indexer is not None:
+            return {entry for round_num in rounds for entry in indexer.update_cids(round_num).items()}, None
+        start = self.deployment_block() if from_block is None else from_block
+        head = self.web3.eth.block_number
+        entries = set()
+        if start > head or not rounds:
+            return entries, start
+        names = ["UpdateSubmitted"] + (["UpdateDigestSubmitted"] if self.has_event("UpdateDigestSubmitted") else [])
+        for name in names:
+            event = getattr(self.contract.events, name)
+            if self._round_indexed(name):
+                logs = event.get_logs(argument_filters={"round": rounds}, from_block=start, to_block=head)
+            else:
+                logs = [log for log in event.get_logs(from_block=start, to_block=head)
+                        if first_round <= log["args"]["round"] <= last_round]
+            for log in logs:
+                args = log["args"]
+                entries.add((args["trainer"], args["cid"] if "cid" in args else bytes32_to_cid(args["digest"])))
+        return entries, head + 1
+
+    @telemetry.traced("chain.get_scores")
+    def get_scores(self, round_num):
+        """获取指定轮次已提交的分数 {训练者地址: 分数}（来自 ScoreSubmitted 事件，读取代价见 _round_logs）"""
+        indexer = self._indexed()
+        if indexer is not None:
+            return indexer.scores(round_num)
+        return {log["args"]["trainer"]: log["args"]["score"] for log in self._round_logs("ScoreSubmitted", round_num)}
+
+    @telemetry.traced("chain.get_round_state")
+    def get_round_state(self, round_num):
+        """读取一轮的完整状态 {trainers, updates: {训练者: CID}, scores: {训练者: 分数}, global_model_cid}
+
+        启用索引器时全部来自本地库；合约提供 getRoundState 时为一次 eth_call；否则训练者与
+        全局模型CID合并为一次批量读取，更新与分数来自 eth_getLogs。后一种情况下往返次数与训练者数量
+        无关，但旧合约的事件没有 indexed round，节点要返回部署以来的全部更新与分数日志，
+        数据量随合约历史增长，长期运行的任务应启用索引器。
+        updates 与 scores 只包含已提交者，至少覆盖 trainers 中的全部训练者。
+        """
+        if self.indexer is None and self.has_function("getRoundState"):
+            trainers, cids, digests, scores, global_cid, global_digest = \
+                self.contract.functions.getRoundState(round_num).call()
+            updates = {}
+            for trainer, cid, digest in zip(trainers, cids, digests):
+                cid = cid or bytes32_to_cid(digest)
+                if cid:
+                    updates[trainer] = cid
+            # 合约中未提交的分数读出为 0，以 ScoreSubmitted 事件为准时使用 get_scores
+            return {"trainers": list(trainers), "updates": updates,
+                    "scores": {trainer: score for trainer, score in zip(trainers, scores) if score},
+                    "global_model_cid": bytes32_to_cid(global_digest) or global_cid}
+        if self.indexer is not None:
+            trainers = self.get_selected_trainers(round_num)
+            global_cid = self.get_global_model_cid(round_num)
+        else:
+            calls = [self.contract.functions.getSelectedTrainers(round_num),
+                     self.contract.functions.getGlobalModelCID(round_num)]
+            if self.has_function("getGlobalModelDigest"):
+                calls.append(self.contract.functions.getGlobalModelDigest(round_num))
+            results = self.batch_call(calls)
+            trainers, global_cid = results[0], results[1]
+            if len(results) > 2:
+                global_cid = bytes32_to_cid(results[2]) or global_cid
+        return {"trainers": list(trainers), "updates": self.get_update_cids(round_num),
+                "scores": self.get_scores(round_num), "global_model_cid": global_cid or ""}
+
+    @telemetry.traced("chain.get_update_root")
+    def get_update_root(self, round_num):
+        """返回指定轮次以 commit_update_root 提交的 (Merkle 根, 清单CID, 更新数)，没有时返回 None"""
+        indexer = self._indexed()
+        if indexer is not None:
+            return indexer.update_root(round_num)
+        if not self.has_event("UpdateRootCommitted"):
+            return None
+        result = None
+        for log in self._round_logs("UpdateRootCommitted", round_num):
+            args = log["args"]
+            result = (bytes(args["root"]), bytes32_to_cid(args["manifest"]), args["count"])
+        return result
+
+    def submit_update_cid(self, round_num, cid, wait=True):
         try:
-            tx = self.contract.functions.submitUpdate(round_num, cid).transact({'from': self.account})
-            return self.web3.eth.wait_for_transaction_receipt(tx)
+            digest = self._digest(cid)
+            if digest is not None:
+                return self.transact(self.contract.functions.submitUpdateDigest(round_num, digest), wait=wait)
+            return self.transact(self.contract.functions.submitUpdate(round_num, cid), wait=wait)
         except Exception as e:
             logging.error(f"提交更新CID失败: {e}")
             return None
 
+    def commit_update_root(self, round_num, root, manifest_cid, count, wait=True):
+        """以一笔交易提交一轮全部更新的 Merkle 根，manifest_cid 为按叶子顺序列出 (训练者, CID) 的清单"""
+        try:
+            return self.transact(self.contract.functions.commitUpdateRoot(round_num, root,
+                                                                          cid_to_bytes32(manifest_cid), count),
+                                 wait=wait)
+        except Exception as e:
+            logging.error(f"提交轮次 {round_num} 的更新 Merkle 根失败: {e}")
+            return None
+
+    def verify_update(self, round_num, trainer, cid, proof):
+        """在合约上校验训练者的更新CID是否包含在该轮的 Merkle 根中"""
+        try:
+            return self.contract.functions.verifyUpdate(round_num, trainer, cid_to_bytes32(cid), proof).call()
+        except Exception as e:
+            logging.error(f"校验训练者 {trainer} 的更新失败: {e}")
+            return False
+
+    @telemetry.traced("chain.get_selected_trainers")
     def get_selected_trainers(self, round_num):
+        indexer = self._indexed()
+        if indexer is not None:
+            trainers = indexer.selected_trainers(round_num)
+            if trainers is not None:
+                return trainers
         return self.contract.functions.getSelectedTrainers(round_num).call()
 
-    def submit_global_model(self, round_num, cid):
+    def select_trainers(self, round_num, trainer_addresses, wait=True):
+        try:
+            return self.transact(self.contract.functions.selectTrainersForRound(round_num, trainer_addresses), wait=wait)
+        except Exception as e:
+            logging.error(f"选择训练者失败: {e}")
+            return None
+
+    def submit_score(self, round_num, trainer, score, wait=True):
+        try:
+            return self.transact(self.contract.functions.submitScore(round_num, trainer, score), wait=wait)
+        except Exception as e:
+            logging.error(f"提交训练者 {trainer} 的分数失败: {e}")
+            return None
+
+    def submit_scores(self, round_num, scores, wait=True, batch_size=200):
+        """提交一轮的全部分数 {训练者: 分数}，返回各笔交易的回执（wait=False 时为 Future）列表
+
+        合约支持 submitScores 时每 batch_size 个训练者一笔交易，否则退回逐个 submitScore。
+        发送失败的交易记为 None。
+        """
+        items = list(scores.items())
+        if not self.has_function("submitScores"):
+            return [self.submit_score(round_num, trainer, score, wait=wait) for trainer, score in items]
+        results = []
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                results.append(self.transact(self.contract.functions.submitScores(
+                    round_num, [trainer for trainer, _ in batch], [score for _, score in batch]), wait=wait))
+            except Exception as e:
+                logging.error(f"批量提交 {len(batch)} 个训练者的分数失败: {e}")
+                results.append(None)
+        return results
+
+    def submit_global_model(self, round_num, cid, wait=True):
         try:
-            tx = self.contract.functions.submitGlobalModel(round_num, cid).transact({'from': self.account})
-            return self.web3.eth.wait_for_transaction_receipt(tx)
+            digest = self._digest(cid)
+            if digest is not None:
+                return self.transact(self.contract.functions.submitGlobalModelDigest(round_num, digest), wait=wait)
+            return self.transact(self.contract.functions.submitGlobalModel(round_num, cid), wait=wait)
         except Exception as e:
             logging.error(f"提交全局模型失败: {e}")
             return None
 
-    def distribute_tokens(self, round_num, total_reward, enable_tokens=False):
+    def distribute_tokens(self, round_num, total_reward, enable_tokens=False, wait=True):
         if enable_tokens:
             try:
-                tx = self.contract.functions.distributeTokens(round_num, total_reward).transact({'from': self.account})
-                return self.web3.eth.wait_for_transaction_receipt(tx)
+                return self.transact(self.contract.functions.distributeTokens(round_num, total_reward), wait=wait)
             except Exception as e:
                 logging.error(f"分配代币失败: {e}")
                 return None
-        return None
\ No newline at end of file
+        return None
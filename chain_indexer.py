@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+DEFAULT_INDEX_DIR = "chain_index"
+
+# 索引的合约事件；TrainersSelected 与紧凑模式的三个事件仅在重新编译部署后的合约中存在
+INDEXED_EVENTS = (
+    "TaskInitialized",
+    "UpdateSubmitted",
+    "ScoreSubmitted",
+    "GlobalModelUpdated",
+    "TokensDistributed",
+    "TrainersSelected",
+    "UpdateDigestSubmitted",
+    "GlobalModelDigestUpdated",
+    "UpdateRootCommitted",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS task (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    creator TEXT, genesis_cid TEXT, total_rounds INTEGER, trainer_count INTEGER, initialized INTEGER
+);
+CREATE TABLE IF NOT EXISTS global_models (round INTEGER PRIMARY KEY, cid TEXT NOT NULL, block INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS updates (
+    round INTEGER NOT NULL, trainer TEXT NOT NULL, cid TEXT NOT NULL, block INTEGER NOT NULL,
+    PRIMARY KEY (round, trainer)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    round INTEGER NOT NULL, trainer TEXT NOT NULL, score INTEGER NOT NULL, block INTEGER NOT NULL,
+    PRIMARY KEY (round, trainer)
+);
+CREATE TABLE IF NOT EXISTS selections (round INTEGER PRIMARY KEY, trainers TEXT NOT NULL, block INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS update_roots (
+    round INTEGER PRIMARY KEY, root TEXT NOT NULL, manifest_cid TEXT NOT NULL, count INTEGER NOT NULL,
+    block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rewards (
+    block INTEGER NOT NULL, log_index INTEGER NOT NULL, trainer TEXT NOT NULL, amount INTEGER NOT NULL,
+    PRIMARY KEY (block, log_index)
+);
+"""
+
+
+class ChainIndexer:
+    """BCFL合约事件的本地索引器
+
+    从上次同步到的区块开始，用一次 eth_getLogs 增量拉取合约的全部事件并写入本地SQLite，
+    之后轮次、全局模型CID、训练者更新与分数等读取都直接查询本地库，不再逐次调用合约视图函数。
+    同一主机上的多个进程可以共享同一个库文件（WAL 模式，写入幂等）。
+    """
+
+    def __init__(self, web3, contract, db_path=None, from_block=0, min_sync_interval=0.0, max_block_range=5000):
+        self.web3 = web3
+        self.contract = contract
+        if db_path is None:
+            db_path = os.path.join(DEFAULT_INDEX_DIR, f"{contract.address}.sqlite")
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.from_block = from_block
+        # 两次同步之间的最小间隔（秒）；本进程发送交易后会强制下一次读取前同步
+        self.min_sync_interval = min_sync_interval
+        self.max_block_range = max_block_range
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._last_sync = 0.0
+        self._dirty = True
+        self._events = {}
+        for name in INDEXED_EVENTS:
+            try:
+                event = getattr(self.contract.events, name)()
+            except Exception:
+                logging.info(f"合约ABI中没有事件 {name}，跳过索引")
+                continue
+            self._events[event.topic] = (name, event)
+        self._poller = None
+        self._stop = threading.Event()
+        # 事件监听器 [(事件名, 回调)]，同步到新事件后以事件参数调用
+        self._listeners = []
+
+    @property
+    def has_selection_events(self):
+        return any(name == "TrainersSelected" for name, _ in self._events.values())
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._db.close()
+
+    def add_listener(self, event_name, callback):
+        """订阅事件：之后每次同步到该事件时调用 callback(args, log)，回调在同步线程中执行，应尽快返回"""
+        self._listeners.append((event_name, callback))
+
+    def remove_listener(self, event_name, callback):
+        try:
+            self._listeners.remove((event_name, callback))
+        except ValueError:
+            pass
+
+    def _notify(self, applied):
+        for name, args, log in applied:
+            for event_name, callback in list(self._listeners):
+                if event_name != name:
+                    continue
+                try:
+                    callback(args, log)
+                except Exception as e:
+                    logging.warning(f"事件 {name} 的监听器执行失败: {e}")
+
+    def mark_dirty(self):
+        """本进程写链后调用，确保下一次读取前先同步"""
+        self._dirty = True
+
+    def last_block(self):
+        row = self._db.execute("SELECT value FROM sync_state WHERE key = 'last_block'").fetchone()
+        return row[0] if row else self.from_block - 1
+
+    def sync(self, force=False):
+        """增量同步到最新区块，返回新处理的事件数"""
+        applied = []
+        with self._lock:
+            now = time.monotonic()
+            if not force and not self._dirty and now - self._last_sync < self.min_sync_interval:
+                return 0
+            head = self.web3.eth.block_number
+            start = self.last_block() + 1
+            while start <= head:
+                end = min(head, start + self.max_block_range - 1)
+                logs = self.web3.eth.get_logs({"address": self.contract.address, "fromBlock": start, "toBlock": end})
+                with self._db:
+                    for log in logs:
+                        event = self._apply(log)
+                        if event is not None:
+                            applied.append(event)
+                    self._db.execute(
+                        "INSERT INTO sync_state (key, value) VALUES ('last_block', ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = max(value, excluded.value)",
+                        (end,),
+                    )
+                start = end + 1
+            self._last_sync = now
+            self._dirty = False
+            if applied:
+                logging.info(f"索引同步到区块 {head}，新增 {len(applied)} 条事件")
+        # 写入提交后再通知监听器，回调中查询索引能看到这些事件
+        if applied and self._listeners:
+            self._notify(applied)
+        return len(applied)
+
+    def _apply(self, log):
+        """写入单条日志，返回 (事件名, 参数, 日志)；非本合约索引的事件返回 None"""
+        topics = log["topics"]
+        if not topics:
+            return None
+        topic = topics[0]
+        topic = topic.hex() if hasattr(topic, "hex") else topic
+        if not topic.startswith("0x"):
+            topic = "0x" + topic
+        match = self._events.get(topic)
+        if match is None:
+            return None
+        name, event = match
+        args = event.process_log(log)["args"]
+        block = log["blockNumber"]
+        # 紧凑模式的摘要事件还原为CID后写入与字符串事件相同的表
+        from blockchain_utils import bytes32_to_cid
+        if name == "TaskInitialized":
+            self._db.execute(
+                "INSERT INTO task (id, genesis_cid, total_rounds) VALUES (1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET genesis_cid = excluded.genesis_cid, total_rounds = excluded.total_rounds",
+                (args["genesisModelCID"], args["totalRounds"]),
+            )
+        elif name == "UpdateSubmitted":
+            self._db.execute(
+                "INSERT OR REPLACE INTO updates (round, trainer, cid, block) VALUES (?, ?, ?, ?)",
+                (args["round"], args["trainer"], args["cid"], block),
+            )
+        elif name == "ScoreSubmitted":
+            self._db.execute(
+                "INSERT OR REPLACE INTO scores (round, trainer, score, block) VALUES (?, ?, ?, ?)",
+                (args["round"], args["trainer"], args["score"], block),
+            )
+        elif name == "GlobalModelUpdated":
+            self._db.execute(
+                "INSERT OR REPLACE INTO global_models (round, cid, block) VALUES (?, ?, ?)",
+                (args["round"], args["cid"], block),
+            )
+        elif name == "TokensDistributed":
+            self._db.execute(
+                "INSERT OR IGNORE INTO rewards (block, log_index, trainer, amount) VALUES (?, ?, ?, ?)",
+                (block, log["logIndex"], args["trainer"], args["amount"]),
+            )
+        elif name == "UpdateDigestSubmitted":
+            self._db.execute(
+                "INSERT OR REPLACE INTO updates (round, trainer, cid, block) VALUES (?, ?, ?, ?)",
+                (args["round"], args["trainer"], bytes32_to_cid(args["digest"]), block),
+            )
+        elif name == "GlobalModelDigestUpdated":
+            self._db.execute(
+                "INSERT OR REPLACE INTO global_models (round, cid, block) VALUES (?, ?, ?)",
+                (args["round"], bytes32_to_cid(args["digest"]), block),
+            )
+        elif name == "UpdateRootCommitted":
+            self._db.execute(
+                "INSERT OR REPLACE INTO update_roots (round, root, manifest_cid, count, block) VALUES (?, ?, ?, ?, ?)",
+                (args["round"], bytes(args["root"]).hex(), bytes32_to_cid(args["manifest"]), args["count"], block),
+            )
+        elif name == "TrainersSelected":
+            self._db.execute(
+                "INSERT OR REPLACE INTO selections (round, trainers, block) VALUES (?, ?, ?)",
+                (args["round"], json.dumps(list(args["trainers"])), block),
+            )
+        return name, args, log
+
+    def start(self, poll_interval=1.0):
+        """启动后台线程定期同步"""
+        if self._poller is not None and self._poller.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(poll_interval):
+                try:
+                    self.sync(force=True)
+                except Exception as e:
+                    logging.warning(f"后台索引同步失败: {e}")
+
+        self._poller = threading.Thread(target=loop, name="chain-indexer", daemon=True)
+        self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---- 查询 ----
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def current_round(self):
+        """当前轮次等于已提交全局模型的最大轮次加一（与合约中 submitGlobalModel 的递增一致）"""
+        row = self._query("SELECT max(round) FROM global_models")[0]
+        return 0 if row[0] is None else row[0] + 1
+
+    def global_model_cid(self, round_num):
+        rows = self._query("SELECT cid FROM global_models WHERE round = ?", (round_num,))
+        if rows:
+            return rows[0][0]
+        if round_num == 0:
+            task = self._query("SELECT genesis_cid FROM task WHERE id = 1")
+            if task and task[0][0]:
+                return task[0][0]
+        return ""
+
+    def update_cids(self, round_num):
+        """返回 {训练者地址: 更新CID}"""
+        return dict(self._query("SELECT trainer, cid FROM updates WHERE round = ?", (round_num,)))
+
+    def scores(self, round_num):
+        return dict(self._query("SELECT trainer, score FROM scores WHERE round = ?", (round_num,)))
+
+    def selected_trainers(self, round_num):
+        """返回已索引的选择结果；合约不发出 TrainersSelected 事件时返回 None"""
+        if not self.has_selection_events:
+            return None
+        rows = self._query("SELECT trainers FROM selections WHERE round = ?", (round_num,))
+        return json.loads(rows[0][0]) if rows else []
+
+    def update_root(self, round_num):
+        """返回 (Merkle 根, 清单CID, 更新数)，该轮没有提交根时返回 None"""
+        rows = self._query("SELECT root, manifest_cid, count FROM update_roots WHERE round = ?", (round_num,))
+        if not rows:
+            return None
+        root, manifest_cid, count = rows[0]
+        return bytes.fromhex(root), manifest_cid, count
+
+    def rewards(self):
+        return dict(self._query("SELECT trainer, sum(amount) FROM rewards GROUP BY trainer"))
+
+    def task(self):
+        """返回与合约 task() 相同顺序的元组；任务初始化后不再变化，只需从链上读取一次"""
+        rows = self._query("SELECT creator, genesis_cid, total_rounds, trainer_count, initialized FROM task WHERE id = 1")
+        if rows and rows[0][4]:
+            creator, genesis_cid, total_rounds, trainer_count, initialized = rows[0]
+            return (creator, genesis_cid, total_rounds, trainer_count, bool(initialized))
+        task = self.contract.functions.task().call()
+        if task[4]:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO task (id, creator, genesis_cid, total_rounds, trainer_count, initialized) "
+                    "VALUES (1, ?, ?, ?, ?, 1)",
+                    (task[0], task[1], task[2], task[3]),
+                )
+        return tuple(task)
@@ -3,81 +3,224 @@ import torch
 import numpy as np
 from model import load_model, save_model
 from data import load_data
-import logging
+from codec import UpdateEncoder
+from prefetch import GlobalModelPrefetcher
+from training import LocalTrainer, configure_threads, training_config
+from ipfs_utils import compute_cid
+from concurrent.futures import ThreadPoolExecutor
+import tensor_format
+import telemetry
 import io
+import logging
 
 class BCFLClient(fl.client.NumPyClient):
-    def __init__(self, blockchain_utils, ipfs_utils, cid, model_class):
+    def __init__(self, blockchain_utils, ipfs_utils, cid, model_class, num_clients=None, partition="iid", alpha=0.5,
+                 prefetch=True, prefetcher=None, num_threads=None, compile_model=False, channels_last=False):
+        """num_clients 非空时只加载本客户端（第 cid 个，从1开始）的训练数据分片；
+        prefetch 时在后台监听 GlobalModelUpdated 事件并提前加载新的全局模型，
+        传入已启动的 prefetcher 时与同一进程中的其他客户端共用它；
+        num_threads / compile_model / channels_last 为本机的训练吞吐设置（见 training.LocalTrainer）"""
         self.blockchain_utils = blockchain_utils
         self.ipfs_utils = ipfs_utils
         self.cid = cid
         self.model = model_class()
-        self.trainloader, self.testloader = load_data()
+        self.trainloader, self.testloader = load_data(
+            client_id=cid - 1 if num_clients else None, num_clients=num_clients, partition=partition, alpha=alpha)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model.to(self.device)
+        configure_threads(num_threads)
+        # 训练超参数由服务器在每轮的 config 中下发
+        self.trainer = LocalTrainer(self.model, self.device, compile_model=compile_model, channels_last=channels_last)
+        # 增量编码器保存 topk 误差反馈残差，需跨轮次保留
+        self.encoder = UpdateEncoder()
+        # 本地模型参数当前与之完全一致的CID，相同CID的全局模型无需重新加载
+        self.held_cid = None
+        self.prefetcher = prefetcher
+        if prefetcher is None and prefetch:
+            self.prefetcher = GlobalModelPrefetcher(blockchain_utils, ipfs_utils, template=self.model.state_dict(),
+                                                    map_location=self.device, trace_scope=self.cid).start()
+        # 内联传输时更新CID在后台单线程中上链，各轮的交易按顺序发送
+        self._committer = None
         logging.info(f"客户端初始化完成，CID={self.cid}")
 
+    def rebind(self, blockchain_utils):
+        """切换到另一个合约或账户上的任务，保留已加载的数据、模型缓冲与编译结果（见 client_daemon）
+
+        预取器、增量编码残差与已持有的全局模型都属于原任务，需要重建；
+        原任务尚未上链的后台提交先在原绑定上完成。
+        """
+        self.flush()
+        prefetch = self.prefetcher is not None
+        if prefetch:
+            self.prefetcher.close()
+        self.blockchain_utils = blockchain_utils
+        self.encoder = UpdateEncoder()
+        self.held_cid = None
+        self.prefetcher = None
+        if prefetch:
+            self.prefetcher = GlobalModelPrefetcher(blockchain_utils, self.ipfs_utils, template=self.model.state_dict(),
+                                                    map_location=self.device, trace_scope=self.cid).start()
+        logging.info(f"客户端 {self.cid} 切换到合约 {blockchain_utils.contract.address}，账户 {blockchain_utils.account}")
+
     def get_parameters(self, config):
         logging.info("获取参数")
         return []
 
+    def get_properties(self, config):
+        """服务器在登记训练者时查询本客户端提交交易所用的账户"""
+        return {"account": self.blockchain_utils.account}
+
     def fit(self, parameters, config):
         server_round = config.get("server_round", 1)
-        logging.info(f"开始第 {server_round} 轮训练")
+        # 同一进程中可能有多个客户端（client_pool），各自只写出本客户端记录的 span
+        with telemetry.trace_scope(self.cid):
+            with telemetry.span("client.fit", client=self.cid, round=server_round):
+                result = self._fit(parameters, config)
+        # 每轮训练的 span 写入单独的 trace 文件
+        telemetry.flush_trace(f"client-{self.cid}-round-{server_round:04d}", scope=self.cid)
+        return result
 
-        round_num = self.blockchain_utils.get_current_round()
-        logging.info(f"当前轮次: {round_num}")
+    def _fit(self, parameters, config):
+        server_round = config.get("server_round", 1)
+        logging.info(f"开始第 {server_round} 轮训练")
 
-        # 对于第一轮，使用 rounds[0].globalModelCID
-        if round_num == 1:
-            cid = self.blockchain_utils.get_global_model_cid(0)  # 获取初始模型
-            logging.info(f"第一轮使用初始模型，CID={cid}")
+        # 预取器已跟踪到的最新全局模型即本轮下发的模型，无需再查询合约
+        known_round, cid = self.prefetcher.latest() if self.prefetcher is not None else (None, None)
+        if cid:
+            round_num = known_round + 1
+            logging.info(f"当前轮次: {round_num}，使用轮次 {known_round} 的全局模型，CID={cid}")
         else:
-            cid = self.blockchain_utils.get_global_model_cid(round_num - 1)  # 使用上一轮的全局模型
-            logging.info(f"使用轮次 {round_num - 1} 的全局模型，CID={cid}")
+            round_num = self.blockchain_utils.get_current_round()
+            logging.info(f"当前轮次: {round_num}")
+
+            # 对于第一轮，使用 rounds[0].globalModelCID
+            if round_num == 1:
+                cid = self.blockchain_utils.get_global_model_cid(0)  # 获取初始模型
+                logging.info(f"第一轮使用初始模型，CID={cid}")
+            else:
+                cid = self.blockchain_utils.get_global_model_cid(round_num - 1)  # 使用上一轮的全局模型
+                logging.info(f"使用轮次 {round_num - 1} 的全局模型，CID={cid}")
 
         if not cid or cid == "":
             logging.error(f"轮次 {round_num} 无有效全局模型CID")
             return [np.array([], dtype=np.uint8)], 0, {"error": "无效CID"}
 
         try:
-            model_bytes = self.ipfs_utils.download_model(cid)
-            if not model_bytes:
-                raise ValueError("下载模型失败，返回空字节")
-            buffer = io.BytesIO(model_bytes)
-            state_dict = torch.load(buffer, map_location=self.device)
-            self.model.load_state_dict(state_dict)
-            logging.info(f"成功加载全局模型，CID={cid}")
+            if cid == self.held_cid:
+                # 本地参数已与该全局模型一致，只在增量编码需要基准时复制一份
+                global_state = None
+                if config.get("codec", "none") != "none":
+                    global_state = {name: tensor.detach().clone() for name, tensor in self.model.state_dict().items()}
+                logging.info(f"本地模型已是全局模型 {cid}，跳过加载")
+            else:
+                with telemetry.span("client.load_global", cid=cid):
+                    global_state = self.prefetcher.get(cid) if self.prefetcher is not None else None
+                    if global_state is None:
+                        global_state = self.ipfs_utils.load_state_dict(cid, map_location=self.device)
+                    self.model.load_state_dict(global_state)
+                self.held_cid = cid
+                logging.info(f"成功加载全局模型，CID={cid}")
         except Exception as e:
             logging.error(f"从IPFS下载模型失败: {e}")
             return [np.array([], dtype=np.uint8)], 0, {"error": str(e)}
 
-        criterion = torch.nn.CrossEntropyLoss()
-        optimizer = torch.optim.SGD(self.model.parameters(), lr=0.01)
-        self.model.train()
-        for epoch in range(2):
-            for data, target in self.trainloader:
-                data, target = data.to(self.device), target.to(self.device)
-                optimizer.zero_grad()
-                output = self.model(data)
-                loss = criterion(output, target)
-                loss.backward()
-                optimizer.step()
-            logging.info(f"完成第 {epoch + 1} 次epoch")
-
-        new_cid = self.ipfs_utils.upload_model(self.model)
+        try:
+            params = training_config(config)
+        except ValueError as e:
+            logging.warning(f"{e}，使用默认训练参数")
+            params = training_config({})
+        self.held_cid = None
+        stats = self.trainer.train(self.trainloader, params)
+        logging.info(f"本地训练 {stats['num_examples']} 个样本，用时 {stats['train_seconds']:.2f}s，"
+                     f"{stats['samples_per_sec']:.1f} 样本/秒")
+
+        # 服务器通过 config 协商更新编码，默认上传完整模型
+        codec = config.get("codec", "none")
+        try:
+            self.encoder.configure(codec, config.get("topk_ratio"))
+        except ValueError as e:
+            logging.warning(f"{e}，回退为上传完整模型")
+            codec = "none"
+        # transport 为 inline 且序列化后不超过 inline_max_bytes 时，更新随 FitRes 直接发给服务器，
+        # IPFS上传与链上提交在后台进行，提交的CID由本地按 ipfs add 的规则计算
+        inline = None
+        with telemetry.span("client.upload", codec=codec):
+            payload = self.model.state_dict() if codec == "none" else self.encoder.encode(self.model.state_dict(),
+                                                                                          global_state, cid)
+            if config.get("transport") == "inline":
+                data = tensor_format.dumps(payload)
+                if len(data) <= int(config.get("inline_max_bytes", 0)):
+                    inline = data
+                    new_cid = compute_cid(data)
+                    self.ipfs_utils.pin_async(data, new_cid)
+                else:
+                    logging.info(f"更新大小 {len(data)} 字节超过内联上限，通过IPFS上传")
+                    new_cid = self.ipfs_utils.upload_state_dict(io.BytesIO(data))
+            else:
+                new_cid = self.ipfs_utils.upload_state_dict(payload)
+            if codec == "none":
+                self.held_cid = new_cid
         if not new_cid:
             logging.error("上传更新模型到IPFS失败")
             return [np.array([], dtype=np.uint8)], 0, {"error": "上传失败"}
-        logging.info(f"成功上传更新模型，CID={new_cid}")
+        logging.info(f"{'内联发送' if inline is not None else '成功上传'}更新模型，CID={new_cid}")
 
+        base_round = round_num - 1
+        if config.get("async"):
+            # 异步聚合下训练期间全局模型可能已更新，更新提交到链上的当前轮次，
+            # 服务器根据 base_round 计算陈旧度
+            round_num = self._current_round()
+        # samples_per_sec 供服务器评估各客户端的训练吞吐
+        metrics = {"base_round": base_round, "account": self.blockchain_utils.account,
+                   "samples_per_sec": stats["samples_per_sec"], "train_seconds": stats["train_seconds"],
+                   "train_loss": stats["train_loss"]}
+        parameters = [np.frombuffer(new_cid.encode('utf-8'), dtype=np.uint8)]
+        if inline is not None:
+            parameters.append(np.frombuffer(inline, dtype=np.uint8))
+        if config.get("commit") == "merkle":
+            # 服务器在聚合后把本轮全部更新作为一个 Merkle 根上链，客户端无需发送交易
+            return parameters, len(self.trainloader.dataset), metrics
+        if inline is not None:
+            # 服务器在推进轮次之前等待这笔提交上链，见 BCFLStrategy._await_commitments
+            metrics["commit_round"] = round_num
+            if self._committer is None:
+                self._committer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"commit-{self.cid}")
+            self._committer.submit(telemetry.scoped(self._submit_update), round_num, new_cid, config.get("async"))
+            return parameters, len(self.trainloader.dataset), metrics
+        if not self._submit_update(round_num, new_cid, config.get("async")):
+            return [np.array([], dtype=np.uint8)], 0, {"error": "提交CID失败"}
+        return parameters, len(self.trainloader.dataset), metrics
+
+    def _submit_update(self, round_num, new_cid, is_async=False):
+        """把更新CID提交到链上，返回交易回执，失败返回 None"""
         tx_receipt = self.blockchain_utils.submit_update_cid(round_num, new_cid)
+        if not tx_receipt:
+            try:
+                current_round = self.blockchain_utils.get_current_round()
+            except Exception:
+                current_round = None
+            if current_round == round_num or (is_async and current_round is not None):
+                # 轮次未变说明是临时错误，原轮次重试一次；异步聚合下服务器恰好推进了轮次，按新轮次重试
+                tx_receipt = self.blockchain_utils.submit_update_cid(current_round, new_cid)
+            elif current_round is not None:
+                logging.warning(f"服务器已进入轮次 {current_round}，轮次 {round_num} 的更新未能在聚合前上链")
         if not tx_receipt:
             logging.error("提交更新CID到区块链失败")
-            return [np.array([], dtype=np.uint8)], 0, {"error": "提交CID失败"}
+            return None
         logging.info(f"成功提交更新CID，交易哈希: {tx_receipt.transactionHash.hex()}")
+        return tx_receipt
+
+    def flush(self):
+        """等待后台的链上提交完成"""
+        if self._committer is not None:
+            self._committer.shutdown(wait=True)
+            self._committer = None
 
-        return [np.frombuffer(new_cid.encode('utf-8'), dtype=np.uint8)], len(self.trainloader.dataset), {}
+    def _current_round(self):
+        known_round, cid = self.prefetcher.latest() if self.prefetcher is not None else (None, None)
+        if cid:
+            return known_round + 1
+        return self.blockchain_utils.get_current_round()
     
     def evaluate(self, parameters, config):
         logging.info("评估模型")
@@ -0,0 +1,308 @@
+"""常驻客户端守护进程
+
+client_main.py 每次启动都要导入 torch / flwr / web3、读取合约ABI、加载数据并构建 BCFLClient，
+只为一次绑定单个合约地址的 Flower 会话。守护进程常驻内存，把这些状态保持在热态：
+    - 重量级依赖只导入一次，训练与测试数组（data.load_arrays）只打开一次
+    - 一个 IPFSUtils 会话池与本地模型缓存，每个节点URL一个 web3 HTTP provider
+    - 会话结束的 BCFLClient 连同模型缓冲、数据分片与 torch.compile 结果进入空闲池，
+      下一个相同数据分片的任务直接复用（换合约时通过 BCFLClient.rebind 切换）
+新任务通过本地 Unix 控制套接字提交，每条命令为一行 JSON，应答也是一行 JSON。
+status 命令返回启动耗时（冷启动）与各任务的准备耗时（热启动）。
+
+用法:
+    python client_daemon.py serve --socket /tmp/bcfl-client.sock
+    python client_daemon.py submit --cid 1 --account_idx 1 --addr 0x...
+    python client_daemon.py status
+    python client_daemon.py shutdown
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+DEFAULT_SOCKET = "/tmp/bcfl-client.sock"
+DEFAULT_URL = "http://127.0.0.1:7545"
+DEFAULT_ADDR = "0xe78A0F7E598Cc8b0Bb87894B0F60dD2a88d6a8Ab"
+DEFAULT_ABI = "build/contracts/BCFL.json"
+
+
+def request(socket_path, message, timeout=30):
+    """向守护进程发送一条控制命令并返回应答"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with sock.makefile("r", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+
+def _load_runtime():
+    """导入训练与链上交互所需的重量级依赖，返回耗时（秒）；控制命令不需要它们"""
+    start = time.perf_counter()
+    global BlockchainUtils, BCFLClient, IPFSUtils, CNN, Web3, client_pool, data, telemetry
+    from web3 import Web3
+    from blockchain_utils import BlockchainUtils
+    from client import BCFLClient
+    from ipfs_utils import IPFSUtils
+    from model import CNN
+    import client_pool
+    import data
+    import telemetry
+    return time.perf_counter() - start
+
+
+class ClientDaemon:
+    """保持热态的客户端宿主：按控制命令为不同合约或账户启动 Flower 会话"""
+
+    def __init__(self, ipfs_sessions=8, num_threads=None, compile_model=False, channels_last=False, prefetch=True):
+        self.imports_s = _load_runtime()
+        start = time.perf_counter()
+        client_pool.allow_threaded_clients()
+        self.compile_model = compile_model
+        self.channels_last = channels_last
+        self.prefetch = prefetch
+        self.num_threads = num_threads
+        self.ipfs_utils = IPFSUtils(pool_size=ipfs_sessions)
+        # 打开训练与测试数组，之后的客户端只需切片
+        data.load_arrays("train")
+        data.load_arrays("test")
+        self._abis = {DEFAULT_ABI: client_pool.load_abi(DEFAULT_ABI)}
+        self.warmup_s = time.perf_counter() - start
+        self._lock = threading.Lock()
+        self._providers = {}
+        # (节点URL, 账户地址) -> 共用的 TransactionPipeline，同一账户的并发任务共用一个nonce管理器
+        self._pipelines = {}
+        # (cid, num_clients, partition, alpha) -> 会话已结束、可复用的 (链上绑定, BCFLClient) 列表
+        self._idle = {}
+        self._tasks = {}
+        self._next_task = 1
+        logging.info(f"守护进程就绪：导入 {self.imports_s:.2f}s，预热 {self.warmup_s:.2f}s")
+
+    def _provider(self, url):
+        with self._lock:
+            provider = self._providers.get(url)
+            if provider is None:
+                provider = self._providers[url] = Web3.HTTPProvider(url)
+            return provider
+
+    def _share_pipeline(self, url, blockchain_utils):
+        """同一节点上的同一账户只使用一个交易流水线，避免两个任务各自在本地分配出相同的nonce"""
+        with self._lock:
+            key = (url, blockchain_utils.account)
+            blockchain_utils.tx_pipeline = self._pipelines.setdefault(key, blockchain_utils.tx_pipeline)
+
+    def _abi(self, path):
+        with self._lock:
+            abi = self._abis.get(path)
+        if abi is None:
+            with open(path, "r") as f:
+                abi = json.load(f)["abi"]
+            with self._lock:
+                self._abis[path] = abi
+        return abi
+
+    def submit(self, message):
+        """准备客户端并在后台线程中连接 Flower 服务器，返回任务编号与准备耗时"""
+        start = time.perf_counter()
+        cid = int(message["cid"])
+        url = message.get("url", DEFAULT_URL)
+        addr = message.get("addr", DEFAULT_ADDR)
+        account = message.get("account_idx", cid)
+        key = (cid, message.get("num_clients"), message.get("partition", "iid"), float(message.get("alpha", 0.5)))
+        binding = (url, addr, account, message.get("abi", DEFAULT_ABI), bool(message.get("use_indexer")),
+                   message.get("cid_encoding", "string"))
+        with self._lock:
+            idle = self._idle.get(key)
+            entry = idle.pop() if idle else None
+        warm = entry is not None
+        if warm and entry[0] == binding:
+            # 同一合约与账户：链上连接、索引与预取器都可以继续使用
+            client = entry[1]
+        else:
+            blockchain_utils = BlockchainUtils(self._provider(url), addr, self._abi(binding[3]), account=account,
+                                               use_indexer=binding[4], cid_encoding=binding[5])
+            self._share_pipeline(url, blockchain_utils)
+            if warm:
+                client = entry[1]
+                client.rebind(blockchain_utils)
+            else:
+                client = BCFLClient(blockchain_utils, self.ipfs_utils, cid, CNN, num_clients=key[1],
+                                    partition=key[2], alpha=key[3], prefetch=self.prefetch,
+                                    num_threads=self.num_threads, compile_model=self.compile_model,
+                                    channels_last=self.channels_last)
+        setup_s = time.perf_counter() - start
+        server_address = message.get("server_address", "localhost:8081")
+        with self._lock:
+            task_id = self._next_task
+            self._next_task += 1
+            self._tasks[task_id] = {"task": task_id, "cid": cid, "addr": addr, "account": client.blockchain_utils.account,
+                                    "server_address": server_address, "warm": warm, "setup_s": setup_s,
+                                    "state": "running", "started_at": time.time(), "session_s": None}
+        threading.Thread(target=self._run, args=(task_id, key, binding, client, server_address), name=f"task-{task_id}",
+                         daemon=True).start()
+        logging.info(f"任务 {task_id}：客户端 {cid} 连接 {server_address}，合约 {addr}，"
+                     f"{'热' if warm else '冷'}启动准备 {setup_s:.3f}s")
+        return {"ok": True, "task": task_id, "warm": warm, "setup_s": setup_s}
+
+    def _run(self, task_id, key, binding, client, server_address):
+        start = time.perf_counter()
+        client_pool._serve(client, server_address)
+        # 会话结束前完成后台的链上提交，空闲池中的客户端不带未完成的任务
+        client.flush()
+        with self._lock:
+            self._tasks[task_id]["state"] = "finished"
+            self._tasks[task_id]["session_s"] = time.perf_counter() - start
+            self._idle.setdefault(key, []).append((binding, client))
+        logging.info(f"任务 {task_id} 的会话结束，客户端 {client.cid} 进入空闲池")
+
+    def status(self):
+        """返回启动耗时、各任务的准备耗时与汇总的冷/热启动耗时"""
+        with self._lock:
+            tasks = [dict(task) for task in self._tasks.values()]
+            idle = sum(len(clients) for clients in self._idle.values())
+        cold = [task["setup_s"] for task in tasks if not task["warm"]]
+        warm = [task["setup_s"] for task in tasks if task["warm"]]
+        return {
+            "ok": True,
+            "startup": {"imports_s": self.imports_s, "warmup_s": self.warmup_s},
+            # 冷启动：导入、预热与第一次构建客户端之和，相当于一次 client_main.py 启动的准备耗时
+            "cold_start_s": self.imports_s + self.warmup_s + cold[0] if cold else None,
+            "warm_start_s": sum(warm) / len(warm) if warm else None,
+            "idle_clients": idle,
+            "tasks": tasks,
+            "ipfs_cache": self.ipfs_utils.cache_stats(),
+        }
+
+    def close(self):
+        with self._lock:
+            clients = [client for idle in self._idle.values() for _, client in idle]
+        for client in clients:
+            if client.prefetcher is not None:
+                client.prefetcher.close()
+        for pipeline in self._pipelines.values():
+            pipeline.close()
+        self.ipfs_utils.close()
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            message = json.loads(line)
+            command = message.get("cmd")
+            if command == "submit":
+                response = self.server.daemon.submit(message)
+            elif command == "status":
+                response = self.server.daemon.status()
+            elif command == "shutdown":
+                response = {"ok": True}
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                response = {"ok": False, "error": f"未知的命令: {command}"}
+        except Exception as e:
+            logging.error(f"处理控制命令失败: {e}")
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        # 上次异常退出遗留的套接字文件
+        if os.path.exists(socket_path):
+            try:
+                request(socket_path, {"cmd": "status"}, timeout=1)
+                raise RuntimeError(f"{socket_path} 上已有守护进程在运行")
+            except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+                os.remove(socket_path)
+        self.daemon = daemon
+        # bind 创建套接字文件时即为 0600，不留其他用户可以连接的窗口
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _ControlHandler)
+        finally:
+            os.umask(old_umask)
+
+
+def serve(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - Daemon %(threadName)s - %(message)s')
+    daemon = ClientDaemon(ipfs_sessions=args.ipfs_sessions, num_threads=args.num_threads, compile_model=args.compile,
+                          channels_last=args.channels_last, prefetch=not args.no_prefetch)
+    if args.trace_dir is not None or args.metrics_port is not None:
+        telemetry.enable(trace_dir=args.trace_dir, metrics_port=args.metrics_port, metrics_host=args.metrics_host,
+                         process_name="client-daemon")
+    server = ControlServer(args.socket, daemon)
+    logging.info(f"控制套接字: {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        daemon.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻客户端守护进程")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help="控制套接字路径")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="启动守护进程")
+    serve_parser.add_argument("--ipfs_sessions", type=int, default=8, help="共享的IPFS会话数")
+    serve_parser.add_argument("--num_threads", type=int, default=None, help="torch 算子线程数，0 表示使用全部CPU核")
+    serve_parser.add_argument("--compile", action="store_true", help="用 torch.compile 编译模型，不可用时退回 eager 模式")
+    serve_parser.add_argument("--channels_last", action="store_true", help="模型与输入使用 channels_last 内存布局")
+    serve_parser.add_argument("--no_prefetch", action="store_true", help="关闭全局模型预取")
+    serve_parser.add_argument("--trace_dir", type=str, default=None, help="按轮次写出 Chrome trace 文件的目录")
+    serve_parser.add_argument("--metrics_port", type=int, default=None, help="Prometheus 指标端点的端口")
+    serve_parser.add_argument("--metrics_host", type=str, default="127.0.0.1", help="Prometheus 指标端点监听的地址，默认只接受本机连接，0.0.0.0 表示所有网卡")
+
+    submit_parser = commands.add_parser("submit", help="提交一个训练任务")
+    submit_parser.add_argument("--cid", type=int, required=True, help="客户端ID（如 1, 2）")
+    submit_parser.add_argument("--account_idx", type=int, default=None, help="使用的账户索引，默认等于客户端ID")
+    submit_parser.add_argument("--url", type=str, default=DEFAULT_URL, help="区块链节点URL")
+    submit_parser.add_argument("--addr", type=str, default=DEFAULT_ADDR, help="智能合约地址")
+    submit_parser.add_argument("--abi", type=str, default=DEFAULT_ABI, help="合约编译产物（守护进程所在目录的相对路径）")
+    submit_parser.add_argument("--server_address", type=str, default="localhost:8081", help="Flower 服务器地址")
+    submit_parser.add_argument("--use_indexer", action="store_true", help="通过本地事件索引读取合约状态")
+    submit_parser.add_argument("--compact_cids", action="store_true", help="更新CID以 bytes32 摘要上链")
+    submit_parser.add_argument("--num_clients", type=int, default=None, help="客户端总数，指定后只使用本客户端的训练数据分片")
+    submit_parser.add_argument("--partition", type=str, default="iid", choices=["iid", "dirichlet"], help="训练数据划分方式")
+    submit_parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet 划分的集中参数")
+
+    commands.add_parser("status", help="查看守护进程状态与冷/热启动耗时")
+    commands.add_parser("shutdown", help="停止守护进程")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+        return
+    if args.command == "submit":
+        message = {"cmd": "submit", "cid": args.cid, "account_idx": args.account_idx or args.cid, "url": args.url,
+                   "addr": args.addr, "abi": args.abi, "server_address": args.server_address,
+                   "use_indexer": args.use_indexer, "cid_encoding": "bytes32" if args.compact_cids else "string",
+                   "num_clients": args.num_clients, "partition": args.partition, "alpha": args.alpha}
+    else:
+        message = {"cmd": args.command}
+    try:
+        # 冷启动时第一个任务要构建客户端，等待时间放宽
+        response = request(args.socket, message, timeout=300)
+    except (ConnectionRefusedError, FileNotFoundError):
+        print(f"错误：无法连接到 {args.socket}，请先运行 python client_daemon.py serve")
+        exit(1)
+    print(json.dumps(response, indent=2, ensure_ascii=False))
+    if not response.get("ok"):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
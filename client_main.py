@@ -1,7 +1,8 @@
 import flwr as fl
-from blockchain_utils import BlockchainUtils
+from blockchain_utils import BlockchainUtils, abi_drift
 from ipfs_utils import IPFSUtils
 from client import BCFLClient
+import telemetry
 import argparse
 import logging
 import json
@@ -14,21 +15,35 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - Client %(client_id
 def load_abi(path="build/contracts/BCFL.json"):
     try:
         with open(path, "r") as f:
-            return json.load(f)["abi"]
+            abi = json.load(f)["abi"]
     except FileNotFoundError:
         print(f"错误：找不到 {path} 文件，请先编译并部署合约。")
         exit(1)
+    drift = abi_drift(abi)
+    if drift:
+        print(f"警告：{path} 与 contracts/BCFL.sol 不一致，缺少 {', '.join(drift)}；"
+              f"请运行 truffle compile 重新编译并部署，否则只能使用旧接口")
+    return abi
 
-def start_client(url, addr, abi, cid, account_idx, model_class):
-    blockchain_utils = BlockchainUtils(url, addr, abi)
-    account = blockchain_utils.web3.eth.accounts[account_idx]
+def start_client(url, addr, abi, cid, account_idx, model_class, use_indexer=False,
+                 num_clients=None, partition="iid", alpha=0.5, trace_dir=None, metrics_port=None,
+                 num_threads=None, compile_model=False, channels_last=False, cid_encoding="string",
+                 metrics_host="127.0.0.1"):
+    if trace_dir is not None or metrics_port is not None:
+        telemetry.enable(trace_dir=trace_dir, metrics_port=metrics_port, metrics_host=metrics_host,
+                         process_name=f"client-{cid}")
+    blockchain_utils = BlockchainUtils(url, addr, abi, account=account_idx, use_indexer=use_indexer,
+                                       cid_encoding=cid_encoding)
+    account = blockchain_utils.account
     logging.getLogger().handlers[0].setFormatter(
         logging.Formatter(f'%(asctime)s - Client {cid} - %(message)s')
     )
     logging.info(f"启动客户端，使用账户 {account}")
 
     ipfs_utils = IPFSUtils()
-    client = BCFLClient(blockchain_utils, ipfs_utils, cid, model_class=model_class)
+    client = BCFLClient(blockchain_utils, ipfs_utils, cid, model_class=model_class,
+                        num_clients=num_clients, partition=partition, alpha=alpha, num_threads=num_threads,
+                        compile_model=compile_model, channels_last=channels_last)
     
     fl.client.start_client(
         server_address="localhost:8081",
@@ -37,6 +52,9 @@ def start_client(url, addr, abi, cid, account_idx, model_class):
         root_certificates=None,
         insecure=True
     )
+    # 等待最后一轮内联更新的后台上链完成再退出
+    client.flush()
+    telemetry.flush_trace(f"client-{cid}-final", scope=cid)
 
 def main():
     parser = argparse.ArgumentParser(description="区块链联邦学习客户端")
@@ -44,11 +62,26 @@ def main():
     parser.add_argument("--addr", type=str, default=DEFAULT_ADDR, help="智能合约地址")
     parser.add_argument("--cid", type=int, required=True, help="客户端ID（如 1, 2）")
     parser.add_argument("--account_idx", type=int, default=1, help="使用的账户索引（从1开始）")
+    parser.add_argument("--use_indexer", action="store_true", help="通过本地事件索引读取合约状态")
+    parser.add_argument("--num_clients", type=int, default=None, help="客户端总数，指定后只使用本客户端的训练数据分片")
+    parser.add_argument("--partition", type=str, default="iid", choices=["iid", "dirichlet"], help="训练数据划分方式")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet 划分的集中参数，越小越不均衡")
+    parser.add_argument("--trace_dir", type=str, default=None, help="按轮次写出 Chrome trace 文件的目录")
+    parser.add_argument("--metrics_port", type=int, default=None, help="Prometheus 指标端点的端口，多个客户端需使用不同端口")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1", help="Prometheus 指标端点监听的地址，默认只接受本机连接，0.0.0.0 表示所有网卡")
+    parser.add_argument("--num_threads", type=int, default=None, help="torch 算子线程数，0 表示使用全部CPU核")
+    parser.add_argument("--compile", action="store_true", help="用 torch.compile 编译模型，不可用时退回 eager 模式")
+    parser.add_argument("--channels_last", action="store_true", help="模型与输入使用 channels_last 内存布局")
+    parser.add_argument("--compact_cids", action="store_true", help="更新CID以 bytes32 摘要上链（需重新编译部署合约）")
     args = parser.parse_args()
 
     from model import CNN
     abi = load_abi()
-    start_client(args.url, args.addr, abi, args.cid, args.account_idx, model_class=CNN)
+    start_client(args.url, args.addr, abi, args.cid, args.account_idx, model_class=CNN, use_indexer=args.use_indexer,
+                 num_clients=args.num_clients, partition=args.partition, alpha=args.alpha,
+                 trace_dir=args.trace_dir, metrics_port=args.metrics_port, num_threads=args.num_threads,
+                 compile_model=args.compile, channels_last=args.channels_last,
+                 cid_encoding="bytes32" if args.compact_cids else "string", metrics_host=args.metrics_host)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""在少量进程中运行大量 BCFLClient 的模拟启动器
+
+每个工作进程承载一组虚拟客户端，每个客户端占用一个线程和一条到 Flower 服务器的连接，
+并以第 account_offset + cid 个节点账户提交交易。同一进程内的客户端共享：
+    - 训练数据：data.load_arrays 返回同一组内存映射数组（跨进程经由页缓存共享）与同一次划分结果
+    - 一个 web3 HTTP provider 与一个链上事件索引（--use_indexer 时）
+    - 一个 IPFSUtils 会话池与本地模型缓存
+    - 一个全局模型预取器，新的全局模型每个进程只下载一次
+因此模拟 100 个以上的训练者只需要少量进程。节点需提供足够的账户，例如
+ganache --wallet.totalAccounts 101。
+
+用法: python client_pool.py --clients 100 --processes 4 --num_clients 100
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import threading
+
+import flwr as fl
+import torch
+from web3 import Web3
+
+from blockchain_utils import BlockchainUtils
+from client import BCFLClient
+from ipfs_utils import IPFSUtils
+from prefetch import GlobalModelPrefetcher
+import telemetry
+
+DEFAULT_URL = "http://127.0.0.1:7545"
+DEFAULT_ADDR = "0xe78A0F7E598Cc8b0Bb87894B0F60dD2a88d6a8Ab"
+
+
+def load_abi(path="build/contracts/BCFL.json"):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)["abi"]
+    except FileNotFoundError:
+        print(f"错误：找不到 {path} 文件，请先编译并部署合约。")
+        exit(1)
+
+
+def allow_threaded_clients():
+    """start_client 会注册 SIGINT/SIGTERM 处理函数，而 signal.signal 只能在主线程调用；
+    在线程中运行的客户端跳过注册，进程的退出信号由主线程按默认方式处理"""
+    from flwr.client import app as flwr_client_app
+    flwr_client_app._AppStateTracker.register_signal_handler = lambda self: None
+
+
+def _serve(client, server_address):
+    try:
+        fl.client.start_client(server_address=server_address, client=client.to_client(),
+                               grpc_max_message_length=fl.common.GRPC_MAX_MESSAGE_LENGTH, insecure=True)
+    except Exception as e:
+        logging.error(f"客户端 {client.cid} 异常退出: {e}")
+
+
+def build_clients(cids, blockchain_factory, ipfs_utils, model_class, num_clients=None, partition="iid", alpha=0.5,
+                  prefetch=True, compile_model=False, channels_last=False):
+    """创建共享 IPFS 会话、链上索引与预取器的一组客户端
+
+    blockchain_factory(cid) 返回该客户端账户的 BlockchainUtils；第一个客户端的索引器
+    与事件订阅由所有客户端共用。
+    """
+    utils = [blockchain_factory(cid) for cid in cids]
+    for other in utils[1:]:
+        if other.indexer is None:
+            other.indexer = utils[0].indexer
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    prefetcher = None
+    if prefetch:
+        prefetcher = GlobalModelPrefetcher(utils[0], ipfs_utils, template=model_class().state_dict(),
+                                           map_location=device).start()
+    return [BCFLClient(blockchain_utils, ipfs_utils, cid, model_class, num_clients=num_clients, partition=partition,
+                       alpha=alpha, prefetch=prefetch, prefetcher=prefetcher, compile_model=compile_model,
+                       channels_last=channels_last)
+            for cid, blockchain_utils in zip(cids, utils)]
+
+
+def run_worker(worker_id, cids, options):
+    """工作进程入口：创建 cids 对应的客户端并各自在线程中连接服务器，全部结束后返回"""
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - Pool {worker_id} %(threadName)s - %(message)s')
+    allow_threaded_clients()
+    # 一个进程内有多个客户端同时训练，限制每个客户端的算子线程数以免过度订阅
+    torch.set_num_threads(options["torch_threads"])
+    if options["trace_dir"] is not None or options["metrics_port"] is not None:
+        port = None if options["metrics_port"] is None else options["metrics_port"] + worker_id
+        telemetry.enable(trace_dir=options["trace_dir"], metrics_port=port, metrics_host=options["metrics_host"],
+                         process_name=f"client-pool-{worker_id}")
+
+    from model import CNN
+    provider = Web3.HTTPProvider(options["url"])
+    use_indexer = [options["use_indexer"]]
+
+    def blockchain_factory(cid):
+        # 只有第一个客户端创建索引器，其余的在 build_clients 中共用
+        utils = BlockchainUtils(provider, options["addr"], options["abi"], account=options["account_offset"] + cid,
+                                use_indexer=use_indexer[0], cid_encoding=options["cid_encoding"])
+        use_indexer[0] = False
+        return utils
+
+    ipfs_utils = IPFSUtils(pool_size=options["ipfs_sessions"])
+    clients = build_clients(cids, blockchain_factory, ipfs_utils, CNN, num_clients=options["num_clients"],
+                            partition=options["partition"], alpha=options["alpha"], prefetch=options["prefetch"],
+                            compile_model=options["compile"], channels_last=options["channels_last"])
+    logging.info(f"工作进程 {worker_id} 已创建 {len(clients)} 个客户端: {cids[0]}..{cids[-1]}")
+
+    threads = [threading.Thread(target=_serve, args=(client, options["server_address"]), name=f"client-{client.cid}",
+                                daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 等待各客户端最后一轮内联更新的后台上链完成再退出
+    for client in clients:
+        client.flush()
+    # 共用的预取器等不属于任何客户端的 span 最后统一写出
+    telemetry.flush_trace(f"client-pool-{worker_id}-final")
+    if clients[0].prefetcher is not None:
+        clients[0].prefetcher.close()
+    ipfs_utils.close()
+
+
+def split_clients(cids, processes):
+    """把客户端编号按连续区间均分给各进程"""
+    processes = max(1, min(processes, len(cids)))
+    size, extra = divmod(len(cids), processes)
+    groups, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cids[start:end])
+        start = end
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单机多客户端模拟启动器")
+    parser.add_argument("--url", type=str, default=DEFAULT_URL, help="区块链节点URL")
+    parser.add_argument("--addr", type=str, default=DEFAULT_ADDR, help="智能合约地址")
+    parser.add_argument("--server_address", type=str, default="localhost:8081", help="Flower 服务器地址")
+    parser.add_argument("--clients", type=int, required=True, help="虚拟客户端数量")
+    parser.add_argument("--first_cid", type=int, default=1, help="第一个客户端的ID")
+    parser.add_argument("--processes", type=int, default=max(1, multiprocessing.cpu_count() // 2), help="工作进程数")
+    parser.add_argument("--account_offset", type=int, default=0, help="客户端 cid 使用第 account_offset + cid 个节点账户")
+    parser.add_argument("--torch_threads", type=int, default=1, help="每个进程的 torch 算子线程数")
+    parser.add_argument("--ipfs_sessions", type=int, default=8, help="每个进程共享的IPFS会话数")
+    parser.add_argument("--use_indexer", action="store_true", help="通过本地事件索引读取合约状态")
+    parser.add_argument("--no_prefetch", action="store_true", help="关闭全局模型预取")
+    parser.add_argument("--num_clients", type=int, default=None, help="数据划分的客户端总数，默认不划分")
+    parser.add_argument("--partition", type=str, default="iid", choices=["iid", "dirichlet"], help="训练数据划分方式")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet 划分的集中参数，越小越不均衡")
+    parser.add_argument("--compile", action="store_true", help="用 torch.compile 编译模型，不可用时退回 eager 模式")
+    parser.add_argument("--channels_last", action="store_true", help="模型与输入使用 channels_last 内存布局")
+    parser.add_argument("--trace_dir", type=str, default=None, help="按轮次写出 Chrome trace 文件的目录")
+    parser.add_argument("--metrics_port", type=int, default=None, help="第一个进程的 Prometheus 端口，其余进程依次加一")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1", help="Prometheus 指标端点监听的地址，默认只接受本机连接，0.0.0.0 表示所有网卡")
+    parser.add_argument("--compact_cids", action="store_true", help="更新CID以 bytes32 摘要上链（需重新编译部署合约）")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - Pool - %(message)s')
+
+    cids = list(range(args.first_cid, args.first_cid + args.clients))
+    w3 = Web3(Web3.HTTPProvider(args.url))
+    if not w3.is_connected():
+        print(f"错误：无法连接到 {args.url}")
+        exit(1)
+    num_accounts = len(w3.eth.accounts)
+    if args.account_offset + cids[-1] >= num_accounts:
+        print(f"错误：节点只有 {num_accounts} 个账户，客户端 {cids[-1]} 需要第 {args.account_offset + cids[-1]} 个账户")
+        exit(1)
+
+    options = {
+        "url": args.url, "addr": args.addr, "abi": load_abi(), "server_address": args.server_address,
+        "account_offset": args.account_offset, "torch_threads": args.torch_threads,
+        "ipfs_sessions": args.ipfs_sessions, "use_indexer": args.use_indexer, "prefetch": not args.no_prefetch,
+        "num_clients": args.num_clients, "partition": args.partition, "alpha": args.alpha,
+        "trace_dir": args.trace_dir, "metrics_port": args.metrics_port,
+        "metrics_host": args.metrics_host, "compile": args.compile,
+        "channels_last": args.channels_last, "cid_encoding": "bytes32" if args.compact_cids else "string",
+    }
+    # spawn 启动的子进程不继承父进程的线程与 torch 状态
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, args=(i, group, options), name=f"client-pool-{i}")
+               for i, group in enumerate(split_clients(cids, args.processes))]
+    logging.info(f"启动 {len(workers)} 个工作进程，共 {len(cids)} 个客户端")
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    main()
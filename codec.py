@@ -0,0 +1,114 @@
+import math
+import torch
+
+# 可协商的更新编码方式，"none" 表示上传完整 state_dict
+CODECS = ("none", "fp16", "int8", "topk")
+
+_CODEC_KEY = "__codec__"
+
+
+def is_encoded(obj):
+    """判断反序列化得到的对象是否为编码后的增量更新"""
+    return isinstance(obj, dict) and _CODEC_KEY in obj
+
+
+def _encode_tensor(delta, codec, topk_ratio):
+    if codec == "fp16":
+        return {"kind": "fp16", "values": delta.half()}
+    if codec == "int8":
+        scale = delta.abs().max().item() / 127.0
+        if scale == 0.0:
+            scale = 1.0
+        quantized = torch.round(delta / scale).clamp_(-127, 127).to(torch.int8)
+        return {"kind": "int8", "values": quantized, "scale": scale}
+    if codec == "topk":
+        flat = delta.reshape(-1)
+        k = max(1, math.ceil(flat.numel() * topk_ratio))
+        indices = torch.topk(flat.abs(), k, sorted=False).indices
+        return {"kind": "topk", "indices": indices.to(torch.int32), "values": flat[indices].clone(),
+                "numel": flat.numel()}
+    raise ValueError(f"未知的更新编码: {codec}")
+
+
+def _decode_tensor(entry, dtype=torch.float32):
+    """将单个编码条目还原为扁平的增量张量"""
+    kind = entry["kind"]
+    if kind == "raw":
+        return entry["values"].reshape(-1).to(dtype)
+    if kind == "fp16":
+        return entry["values"].reshape(-1).to(dtype)
+    if kind == "int8":
+        return entry["values"].reshape(-1).to(dtype) * entry["scale"]
+    if kind == "topk":
+        flat = torch.zeros(entry["numel"], dtype=dtype, device=entry["values"].device)
+        flat[entry["indices"].long()] = entry["values"].to(dtype)
+        return flat
+    raise ValueError(f"未知的编码条目类型: {kind}")
+
+
+def decode_into(entry, out, alpha=1.0):
+    """将单个编码条目乘以 alpha 后累加到扁平缓冲 out 上，稀疏条目只触及被选中的坐标"""
+    if entry["kind"] == "topk":
+        values = entry["values"].to(device=out.device, dtype=out.dtype)
+        out.index_add_(0, entry["indices"].to(out.device).long(), values, alpha=alpha)
+    else:
+        out.add_(_decode_tensor(entry, out.dtype).to(out.device), alpha=alpha)
+
+
+class UpdateEncoder:
+    """客户端增量更新编码器
+
+    上传内容为本地模型相对本轮全局模型的增量。topk 稀疏化未发送的部分保存在
+    客户端的误差反馈残差中，并在下一轮叠加到增量上，避免信息被永久丢弃。
+    非浮点条目（如 num_batches_tracked）始终原样发送增量。
+    """
+
+    def __init__(self, codec="none", topk_ratio=0.01):
+        if codec not in CODECS:
+            raise ValueError(f"未知的更新编码: {codec}")
+        self.codec = codec
+        self.topk_ratio = topk_ratio
+        self._residuals = {}
+
+    def configure(self, codec, topk_ratio=None):
+        """按服务器下发的配置切换编码方式，切换时清空残差"""
+        if codec not in CODECS:
+            raise ValueError(f"未知的更新编码: {codec}")
+        if codec != self.codec:
+            self._residuals.clear()
+        self.codec = codec
+        if topk_ratio is not None:
+            self.topk_ratio = topk_ratio
+
+    def encode(self, state_dict, base_state_dict, base_cid):
+        """编码 state_dict 相对 base_state_dict 的增量，返回可直接序列化的字典"""
+        tensors = {}
+        with torch.no_grad():
+            for name, tensor in state_dict.items():
+                tensor = tensor.detach().cpu()
+                base = base_state_dict[name].detach().cpu()
+                if not tensor.dtype.is_floating_point:
+                    tensors[name] = {"kind": "raw", "values": tensor - base}
+                    continue
+                delta = tensor.float() - base.float()
+                if self.codec == "topk":
+                    residual = self._residuals.get(name)
+                    if residual is not None:
+                        delta = delta + residual
+                    entry = _encode_tensor(delta, self.codec, self.topk_ratio)
+                    sent = torch.zeros(delta.numel())
+                    sent[entry["indices"].long()] = entry["values"]
+                    self._residuals[name] = delta - sent.reshape(delta.shape)
+                else:
+                    entry = _encode_tensor(delta, self.codec, self.topk_ratio)
+                tensors[name] = entry
+        return {_CODEC_KEY: self.codec, "base_cid": base_cid, "tensors": tensors}
+
+
+def decode_update(payload, base_state_dict):
+    """将编码后的增量还原为完整的 state_dict（用于评估等需要完整模型的场景）"""
+    result = {}
+    for name, base in base_state_dict.items():
+        delta = _decode_tensor(payload["tensors"][name])
+        result[name] = (base.reshape(-1).float() + delta.to(base.device)).to(base.dtype).reshape(base.shape)
+    return result
@@ -15,6 +15,11 @@ contract BCFL {
         mapping(address => string) updates;
         mapping(address => uint) scores;
         address[] selectedTrainers;
+        // 紧凑模式：CID 以 sha2-256 multihash 的 32 字节摘要存储（CIDv0 去掉 0x1220 前缀）
+        bytes32 globalModelDigest;
+        mapping(address => bytes32) updateDigests;
+        // 一轮全部更新的 Merkle 根，叶子为 keccak256(abi.encodePacked(trainer, round, digest))
+        bytes32 updateRoot;
     }
 
     Task public task;
@@ -25,10 +30,15 @@ contract BCFL {
     address public evaluator;
 
     event TaskInitialized(string genesisModelCID, uint totalRounds);
-    event UpdateSubmitted(address trainer, uint round, string cid);
-    event ScoreSubmitted(address trainer, uint round, uint score);
+    event UpdateSubmitted(address trainer, uint indexed round, string cid);
+    event ScoreSubmitted(address trainer, uint indexed round, uint score);
     event GlobalModelUpdated(uint round, string cid);
     event TokensDistributed(address trainer, uint amount);
+    event TrainersSelected(uint round, address[] trainers);
+    // round 为 indexed 参数，按轮次读取日志时由节点按 topic 过滤
+    event UpdateDigestSubmitted(address trainer, uint indexed round, bytes32 digest);
+    event GlobalModelDigestUpdated(uint indexed round, bytes32 digest);
+    event UpdateRootCommitted(uint indexed round, bytes32 root, bytes32 manifest, uint count);
 
     modifier onlyOwner() {
         require(msg.sender == owner, "Only owner can call this");
@@ -71,11 +81,96 @@ contract BCFL {
         emit ScoreSubmitted(trainer, round, score);
     }
 
-    function selectTrainersForRound(uint round, address[] memory trainers) external onlyOwner {
+    function submitUpdateDigest(uint round, bytes32 digest) external {
         require(round == currentRound, "Invalid round");
-        delete rounds[round].selectedTrainers;
+        rounds[round].updateDigests[msg.sender] = digest;
+        emit UpdateDigestSubmitted(msg.sender, round, digest);
+    }
+
+    function submitScores(uint round, address[] calldata trainers, uint[] calldata scores) external onlyEvaluator {
+        require(round == currentRound, "Invalid round");
+        require(trainers.length == scores.length, "Length mismatch");
         for (uint i = 0; i < trainers.length; i++) {
-            rounds[round].selectedTrainers.push(trainers[i]);
+            rounds[round].scores[trainers[i]] = scores[i];
+            emit ScoreSubmitted(trainers[i], round, scores[i]);
+        }
+    }
+
+    function selectTrainersForRound(uint round, address[] calldata trainers) external onlyOwner {
+        require(round == currentRound, "Invalid round");
+        rounds[round].selectedTrainers = trainers;
+        emit TrainersSelected(round, trainers);
+    }
+
+    function commitUpdateRoot(uint round, bytes32 root, bytes32 manifest, uint count) external onlyOwner {
+        require(round == currentRound, "Invalid round");
+        rounds[round].updateRoot = root;
+        emit UpdateRootCommitted(round, root, manifest, count);
+    }
+
+    function verifyUpdate(uint round, address trainer, bytes32 digest, bytes32[] calldata proof)
+        external view returns (bool)
+    {
+        bytes32 node = keccak256(abi.encodePacked(trainer, round, digest));
+        for (uint i = 0; i < proof.length; i++) {
+            node = node < proof[i]
+                ? keccak256(abi.encodePacked(node, proof[i]))
+                : keccak256(abi.encodePacked(proof[i], node));
+        }
+        return node == rounds[round].updateRoot;
+    }
+
+    function getUpdateDigest(uint round, address trainer) external view returns (bytes32) {
+        return rounds[round].updateDigests[trainer];
+    }
+
+    // 一次 eth_call 读取一轮的完整状态：训练者及其更新CID（字符串或摘要）、分数与全局模型CID
+    function getRoundState(uint round) external view returns (
+        address[] memory trainers,
+        string[] memory updateCIDs,
+        bytes32[] memory updateDigests,
+        uint[] memory scores,
+        string memory globalModelCID,
+        bytes32 globalModelDigest
+    ) {
+        RoundData storage data = rounds[round];
+        trainers = data.selectedTrainers;
+        (updateCIDs, updateDigests, scores) = _updatesOf(data, trainers);
+        globalModelCID = data.globalModelCID;
+        globalModelDigest = data.globalModelDigest;
+    }
+
+    // 任意一组训练者（例如未被登记的提交者）在某轮的更新与分数
+    function getUpdates(uint round, address[] calldata trainers) external view returns (
+        string[] memory updateCIDs,
+        bytes32[] memory updateDigests,
+        uint[] memory scores
+    ) {
+        return _updatesOf(rounds[round], trainers);
+    }
+
+    function _updatesOf(RoundData storage data, address[] memory trainers) private view returns (
+        string[] memory updateCIDs,
+        bytes32[] memory updateDigests,
+        uint[] memory scores
+    ) {
+        updateCIDs = new string[](trainers.length);
+        updateDigests = new bytes32[](trainers.length);
+        scores = new uint[](trainers.length);
+        for (uint i = 0; i < trainers.length; i++) {
+            updateCIDs[i] = data.updates[trainers[i]];
+            updateDigests[i] = data.updateDigests[trainers[i]];
+            scores[i] = data.scores[trainers[i]];
+        }
+    }
+
+    // 把多个只读调用打包成一次 eth_call，data 为各调用的 ABI 编码，按顺序返回各自的返回数据
+    function multicall(bytes[] calldata data) external view returns (bytes[] memory results) {
+        results = new bytes[](data.length);
+        for (uint i = 0; i < data.length; i++) {
+            (bool success, bytes memory result) = address(this).staticcall(data[i]);
+            require(success, "Multicall read failed");
+            results[i] = result;
         }
     }
 
@@ -98,6 +193,17 @@ contract BCFL {
         emit GlobalModelUpdated(round, cid);
     }
 
+    function submitGlobalModelDigest(uint round, bytes32 digest) external onlyOwner {
+        require(round == currentRound, "Invalid round");
+        rounds[round].globalModelDigest = digest;
+        currentRound++;
+        emit GlobalModelDigestUpdated(round, digest);
+    }
+
+    function getGlobalModelDigest(uint round) external view returns (bytes32) {
+        return rounds[round].globalModelDigest;
+    }
+
     function distributeTokens(uint round, uint totalReward) external onlyOwner {
         require(round < currentRound, "Round not completed");
         uint totalScore = 0;
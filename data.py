@@ -1,11 +1,206 @@
-from torch.utils.data import DataLoader
-from torchvision import datasets, transforms
-
-def load_data():
-    """加载MNIST数据集"""
-    transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))])
-    trainset = datasets.MNIST('data', train=True, download=True, transform=transform)
-    testset = datasets.MNIST('data', train=False, transform=transform)
-    trainloader = DataLoader(trainset, batch_size=32, shuffle=True)
-    testloader = DataLoader(testset, batch_size=32, shuffle=False)
-    return trainloader, testloader
\ No newline at end of file
+import os
+import tempfile
+import logging
+import threading
+import numpy as np
+import torch
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为仅依赖原子重命名
+    fcntl = None
+
+DEFAULT_DATA_DIR = "data"
+MNIST_MEAN = 0.1307
+MNIST_STD = 0.3081
+PARTITIONS = ("iid", "dirichlet")
+
+# 同一进程中的多个客户端（见 client_pool）共用一份数组与划分结果
+_shared_lock = threading.Lock()
+_shared_arrays = {}
+_shared_partitions = {}
+
+
+def _cache_paths(root, split):
+    cache_dir = os.path.join(root, "cache")
+    return (os.path.join(cache_dir, f"mnist_{split}_images.npy"),
+            os.path.join(cache_dir, f"mnist_{split}_labels.npy"))
+
+
+def _save_npy(array, path):
+    """先写临时文件再原子重命名，其他进程不会读到写了一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _build_cache(root, split):
+    """读取原始MNIST并一次性归一化为 float32 (N, 1, 28, 28) 数组写入缓存"""
+    from torchvision import datasets
+
+    dataset = datasets.MNIST(root, train=(split == "train"), download=True)
+    images = dataset.data.numpy().astype(np.float32)[:, None, :, :]
+    images /= 255.0
+    images -= MNIST_MEAN
+    images /= MNIST_STD
+    labels = dataset.targets.numpy().astype(np.int64)
+    images_path, labels_path = _cache_paths(root, split)
+    # 先写标签，图像文件存在即表示缓存完整
+    _save_npy(labels, labels_path)
+    _save_npy(images, images_path)
+    logging.info(f"已生成 {split} 数据缓存: {images_path}，共 {len(labels)} 个样本")
+
+
+def load_arrays(split="train", root=DEFAULT_DATA_DIR):
+    """返回 (images, labels)，images 为只读内存映射，同一主机上的进程共享页缓存
+
+    缓存不存在时在文件锁保护下生成，多个客户端同时启动只会处理一次原始数据。
+    同一进程内重复调用返回同一组数组。
+    """
+    key = (os.path.abspath(root), split)
+    with _shared_lock:
+        arrays = _shared_arrays.get(key)
+        if arrays is None:
+            arrays = _shared_arrays[key] = _open_arrays(split, root)
+    return arrays
+
+
+def _open_arrays(split, root):
+    images_path, labels_path = _cache_paths(root, split)
+    if not os.path.exists(images_path):
+        os.makedirs(os.path.dirname(images_path), exist_ok=True)
+        with open(images_path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(images_path):
+                    _build_cache(root, split)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return np.load(images_path, mmap_mode="r"), np.load(labels_path)
+
+
+def iid_partition(num_samples, num_clients, seed=0):
+    """随机打乱后均分，返回每个客户端的样本索引列表"""
+    permutation = np.random.default_rng(seed).permutation(num_samples)
+    return [np.sort(part) for part in np.array_split(permutation, num_clients)]
+
+
+def dirichlet_partition(labels, num_clients, alpha=0.5, seed=0, min_size=10):
+    """按 Dirichlet(alpha) 分布为每个类别分配各客户端的比例，alpha 越小数据越不均衡
+
+    若有客户端分到的样本少于 min_size 则重新采样。
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    classes = np.unique(labels)
+    min_size = min(min_size, len(labels) // num_clients)
+    while True:
+        parts = [[] for _ in range(num_clients)]
+        for label in classes:
+            indices = rng.permutation(np.flatnonzero(labels == label))
+            proportions = rng.dirichlet(np.full(num_clients, alpha))
+            cuts = (np.cumsum(proportions)[:-1] * len(indices)).astype(int)
+            for part, chunk in zip(parts, np.split(indices, cuts)):
+                part.append(chunk)
+        parts = [np.sort(np.concatenate(part)) for part in parts]
+        if min(len(part) for part in parts) >= min_size:
+            return parts
+
+
+def partition_indices(labels, num_clients, partition="iid", alpha=0.5, seed=0):
+    if partition == "iid":
+        return iid_partition(len(labels), num_clients, seed)
+    if partition == "dirichlet":
+        return dirichlet_partition(labels, num_clients, alpha, seed)
+    raise ValueError(f"未知的数据划分方式: {partition}")
+
+
+class ArrayDataset:
+    """内存映射数组上的数据集视图，indices 为 None 时表示全部样本"""
+
+    def __init__(self, images, labels, indices=None):
+        self.images = images
+        self.labels = labels
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.labels) if self.indices is None else len(self.indices)
+
+    def __getitem__(self, i):
+        index = i if self.indices is None else self.indices[i]
+        return torch.from_numpy(np.array(self.images[index])), int(self.labels[index])
+
+    def batch(self, positions):
+        """按位置批量取样本，一次向量化切片代替逐样本变换"""
+        if self.indices is not None:
+            positions = self.indices[positions]
+        if isinstance(positions, slice):
+            images = np.array(self.images[positions])
+        else:
+            images = np.take(self.images, positions, axis=0)
+        return torch.from_numpy(images), torch.from_numpy(self.labels[positions])
+
+
+class ArrayLoader:
+    """DataLoader 的轻量替代：数据已预处理，每个批次只做一次数组切片"""
+
+    def __init__(self, dataset, batch_size=32, shuffle=False, seed=None, drop_last=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        size = len(self.dataset)
+        order = self._rng.permutation(size) if self.shuffle else None
+        for b in range(len(self)):
+            start = b * self.batch_size
+            end = min(start + self.batch_size, size)
+            if order is None:
+                yield self.dataset.batch(slice(start, end) if self.dataset.indices is None
+                                         else np.arange(start, end))
+            else:
+                # 批内按索引排序，使对内存映射的读取尽量顺序
+                yield self.dataset.batch(np.sort(order[start:end]))
+
+
+def load_test_data(batch_size=32, root=DEFAULT_DATA_DIR):
+    """加载完整测试集"""
+    images, labels = load_arrays("test", root)
+    return ArrayLoader(ArrayDataset(images, labels), batch_size=batch_size, shuffle=False)
+
+
+def load_data(client_id=None, num_clients=None, partition="iid", alpha=0.5, batch_size=32, seed=0,
+              root=DEFAULT_DATA_DIR):
+    """加载MNIST数据集
+
+    指定 client_id（从0开始）与 num_clients 时训练集只包含该客户端的分片；
+    各进程使用相同的 seed 得到相同的划分，因此分片互不重叠。测试集始终完整。
+    """
+    images, labels = load_arrays("train", root)
+    indices = None
+    if num_clients:
+        if client_id is None or not 0 <= client_id < num_clients:
+            raise ValueError(f"客户端编号 {client_id} 超出范围 [0, {num_clients})")
+        key = (os.path.abspath(root), num_clients, partition, alpha, seed)
+        with _shared_lock:
+            shards = _shared_partitions.get(key)
+            if shards is None:
+                shards = _shared_partitions[key] = partition_indices(labels, num_clients, partition, alpha, seed)
+        indices = shards[client_id]
+        logging.info(f"客户端分片 {client_id}/{num_clients}（{partition}）共 {len(indices)} 个样本")
+    trainloader = ArrayLoader(ArrayDataset(images, labels, indices), batch_size=batch_size, shuffle=True)
+    return trainloader, load_test_data(batch_size, root)
@@ -0,0 +1,124 @@
+import flwr as fl
+from flwr.common import Code
+from flwr.server.history import History
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import logging
+import time
+import timeit
+
+
+class DeadlineServer(fl.server.Server):
+    """带截止时间与提前截断的同步轮次服务器
+
+    策略可以超额选择客户端（见 BCFLStrategy.over_selection）；本轮在收到 min_results 个结果
+    或到达 round_deadline 秒后立即结束，只聚合已经到达的结果，未返回的客户端计为掉队者。
+    掉队者的结果到达时仍会记录实际耗时（strategy.latency），之后的选择会优先考虑更快的客户端；
+    掉队者返回之前不会被再次选中，策略在空闲客户端不足时等待它们（见 BCFLStrategy.straggler_wait）。
+    没有任何结果的轮次同样交给 strategy.aggregate_fit，由策略保持链上轮次与服务器轮次一致。
+    min_results 为 None 时等于任务的训练者数量，round_deadline 为 None 时不设截止时间。
+    start_round 大于 1 时从该轮继续（见 server_main 的 --resume），num_rounds 仍为最后一轮的轮次。
+    """
+
+    def __init__(self, *, client_manager, strategy, round_deadline=None, min_results=None, start_round=1):
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        self.round_deadline = round_deadline
+        self.min_results = min_results
+        self.start_round = start_round
+        # 截止后仍在训练的请求，训练结束时等待它们返回
+        self._stragglers = set()
+
+    def fit(self, num_rounds, timeout):
+        """与 fl.server.Server.fit 相同的轮次循环，但从 start_round 开始；初始评估记在 start_round - 1 轮"""
+        history = History()
+        self.parameters = self._get_initial_parameters(server_round=self.start_round - 1, timeout=timeout)
+        res = self.strategy.evaluate(self.start_round - 1, parameters=self.parameters)
+        if res is not None:
+            history.add_loss_centralized(server_round=self.start_round - 1, loss=res[0])
+            history.add_metrics_centralized(server_round=self.start_round - 1, metrics=res[1])
+
+        start_time = timeit.default_timer()
+        for current_round in range(self.start_round, num_rounds + 1):
+            logging.info(f"[ROUND {current_round}]")
+            res_fit = self.fit_round(server_round=current_round, timeout=timeout)
+            if res_fit is not None:
+                parameters, fit_metrics, _ = res_fit
+                if parameters:
+                    self.parameters = parameters
+                history.add_metrics_distributed_fit(server_round=current_round, metrics=fit_metrics)
+
+            res = self.strategy.evaluate(current_round, parameters=self.parameters)
+            if res is not None:
+                history.add_loss_centralized(server_round=current_round, loss=res[0])
+                history.add_metrics_centralized(server_round=current_round, metrics=res[1])
+
+            res_fed = self.evaluate_round(server_round=current_round, timeout=timeout)
+            if res_fed is not None and res_fed[0] is not None:
+                history.add_loss_distributed(server_round=current_round, loss=res_fed[0])
+                history.add_metrics_distributed(server_round=current_round, metrics=res_fed[1])
+        if self._stragglers:
+            logging.info(f"等待 {len(self._stragglers)} 个掉队者返回")
+            wait(self._stragglers, timeout=timeout)
+        return history, timeit.default_timer() - start_time
+
+    def fit_round(self, server_round, timeout):
+        client_instructions = self.strategy.configure_fit(
+            server_round=server_round, parameters=self.parameters, client_manager=self._client_manager
+        )
+        if not client_instructions:
+            logging.warning(f"第 {server_round} 轮没有可用的客户端，跳过训练")
+            parameters, metrics = self.strategy.aggregate_fit(server_round, [], [])
+            return parameters, metrics, ([], [])
+
+        target = self.min_results
+        if target is None:
+            num_trainers = getattr(self.strategy, "num_trainers", None)
+            target = num_trainers() if num_trainers is not None else len(client_instructions)
+        target = min(target, len(client_instructions))
+        tracker = getattr(self.strategy, "latency", None)
+        logging.info(f"第 {server_round} 轮下发 {len(client_instructions)} 个训练任务，"
+                     f"收到 {target} 个结果或 {self.round_deadline}s 后截止")
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers or len(client_instructions),
+                                      thread_name_prefix=f"fit-round-{server_round}")
+        futures = {}
+        for client, ins in client_instructions:
+            if tracker is not None:
+                tracker.started(client.cid)
+            future = executor.submit(client.fit, ins, timeout, server_round)
+            if tracker is not None:
+                future.add_done_callback(lambda _, cid=client.cid: tracker.finished(cid))
+            futures[future] = client
+
+        deadline = time.monotonic() + self.round_deadline if self.round_deadline else None
+        results, failures = [], []
+        pending = set(futures)
+        while pending and len(results) < target:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                client = futures[future]
+                try:
+                    fit_res = future.result()
+                    if fit_res.status.code != Code.OK:
+                        raise RuntimeError(fit_res.status.message)
+                    results.append((client, fit_res))
+                except Exception as e:
+                    logging.warning(f"客户端 {client.cid} 训练失败: {e}")
+                    failures.append(e)
+
+        for future in pending:
+            client = futures[future]
+            if tracker is not None:
+                tracker.missed(client.cid)
+            logging.info(f"客户端 {client.cid} 未在本轮截止前返回，其结果将被丢弃")
+        # 掉队者的请求仍在后台等待返回，不阻塞本轮
+        self._stragglers = {future for future in self._stragglers | pending if not future.done()}
+        executor.shutdown(wait=False)
+
+        logging.info(f"第 {server_round} 轮收到 {len(results)} 个结果，{len(failures)} 个失败，{len(pending)} 个掉队")
+        parameters, metrics = self.strategy.aggregate_fit(server_round, results, failures)
+        metrics = dict(metrics or {})
+        metrics["stragglers"] = len(pending)
+        return parameters, metrics, (results, failures)
@@ -1,61 +1,153 @@
 import torch
-from model import load_model
-from data import load_data
-from blockchain_utils import BlockchainUtils
+from model import CNN
+from data import load_test_data
+from blockchain_utils import BlockchainUtils, cid_to_bytes32, merkle_root, update_leaf
 from ipfs_utils import IPFSUtils
+from codec import is_encoded, decode_update
+import telemetry
 import logging
 import json
+import io
+from concurrent.futures import wait
+
+
+def evaluate_models(models, testloader, device):
+    """在一次遍历测试集的过程中评估多个模型，返回每个模型的 (平均损失, 准确率)
+
+    每个输入批次只加载并搬运到设备一次，再依次交给所有模型；对每个模型执行的运算与
+    逐个模型遍历测试集完全相同，因此结果与逐模型评估逐位一致，而数据加载开销只付一次。
+    """
+    criterion = torch.nn.CrossEntropyLoss()
+    total_loss = [0.0] * len(models)
+    correct = [0] * len(models)
+    total = 0
+    num_batches = 0
+    for model in models:
+        model.eval()
+    with torch.no_grad():
+        for data, target in testloader:
+            data, target = data.to(device), target.to(device)
+            for i, model in enumerate(models):
+                outputs = model(data)
+                total_loss[i] += criterion(outputs, target).item()
+                _, predicted = torch.max(outputs.data, 1)
+                correct[i] += (predicted == target).sum().item()
+            total += target.size(0)
+            num_batches += 1
+    return [(total_loss[i] / num_batches, correct[i] / total) for i in range(len(models))]
+
 
 class Evaluator:
     """模型评估器，用于评估客户端提交的模型并提交分数"""
-    def __init__(self, blockchain_utils, ipfs_utils, round_num):
+    def __init__(self, blockchain_utils, ipfs_utils, round_num, model_class=CNN, max_models_per_pass=32):
         """初始化评估器"""
         self.blockchain_utils = blockchain_utils
         self.ipfs_utils = ipfs_utils
         self.round_num = round_num
+        self.model_class = model_class
+        # 一次遍历测试集同时评估的模型数上限，限制常驻内存的模型数量
+        self.max_models_per_pass = max_models_per_pass
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.testloader = load_data()[1]  # 加载测试数据
+        self.testloader = load_test_data()  # 加载测试数据
+
+    def _build_model(self, state_dict, base_state):
+        if is_encoded(state_dict):
+            # 编码后的增量更新需要叠加到本轮下发的全局模型上
+            if base_state is None:
+                raise ValueError("缺少基准全局模型，无法还原增量更新")
+            state_dict = decode_update(state_dict, base_state)
+        model = self.model_class().to(self.device)
+        model.load_state_dict(state_dict)
+        return model
+
+    def _base_state(self):
+        base_cid = self.blockchain_utils.get_global_model_cid(self.round_num - 1)
+        if not base_cid:
+            return None
+        return self.ipfs_utils.load_state_dict(base_cid)
+
+    @telemetry.traced("evaluator.evaluate_models")
+    def evaluate_models(self, cids):
+        """并发拉取多个CID的模型并批量评估，返回 {cid: 准确率}，失败的CID记为 0.0"""
+        scores = {cid: 0.0 for cid in cids}
+        base_state = None
+        batch = []
+
+        def flush():
+            with telemetry.span("evaluator.test_pass", models=len(batch)):
+                results = evaluate_models([model for _, model in batch], self.testloader, self.device)
+            for (cid, _), (loss, accuracy) in zip(batch, results):
+                scores[cid] = accuracy
+                logging.info(f"评估CID {cid} 的模型，损失: {loss:.4f}，准确率: {accuracy:.4f}")
+            batch.clear()
+
+        for cid, state_dict in self.ipfs_utils.fetch_state_dicts(list(scores)):
+            try:
+                if is_encoded(state_dict) and base_state is None:
+                    base_state = self._base_state()
+                batch.append((cid, self._build_model(state_dict, base_state)))
+            except Exception as e:
+                logging.error(f"评估CID {cid} 的模型失败: {e}")
+                continue
+            if len(batch) >= self.max_models_per_pass:
+                flush()
+        if batch:
+            flush()
+        return scores
 
     def evaluate_model(self, cid):
         """评估指定CID的模型，返回准确率"""
-        try:
-            model_path = f"eval_model_{cid}.pth"
-            self.ipfs_utils.download_model(cid, model_path)
-            model = load_model(model_path, map_location=self.device).to(self.device)
-            model.eval()
-            criterion = torch.nn.CrossEntropyLoss()
-            total_loss = 0.0
-            correct = 0
-            total = 0
-            with torch.no_grad():
-                for data, target in self.testloader:
-                    data, target = data.to(self.device), target.to(self.device)
-                    outputs = model(data)
-                    total_loss += criterion(outputs, target).item()
-                    _, predicted = torch.max(outputs.data, 1)
-                    total += target.size(0)
-                    correct += (predicted == target).sum().item()
-            accuracy = correct / total
-            logging.info(f"评估CID {cid} 的模型，准确率: {accuracy:.4f}")
-            return accuracy
-        except Exception as e:
-            logging.error(f"评估CID {cid} 的模型失败: {e}")
-            return 0.0
+        return self.evaluate_models([cid])[cid]
 
     def submit_scores(self):
         """为当前轮次的训练者提交分数"""
-        trainers = self.blockchain_utils.get_selected_trainers(self.round_num)
-        for trainer in trainers:
-            # 获取训练者提交的更新CID
-            cid = self.blockchain_utils.contract.functions.rounds(self.round_num).updates(trainer).call()
-            if cid and cid != "":
-                score = self.evaluate_model(cid)
-                # 将准确率转换为0-100的整数分数
-                tx = self.blockchain_utils.contract.functions.submitScore(
-                    self.round_num, trainer, int(score * 100)
-                ).transact({'from': self.blockchain_utils.account})
-                self.blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
-                logging.info(f"提交训练者 {trainer} 的分数: {score}")
+        with telemetry.span("evaluator.submit_scores", round=self.round_num):
+            self._submit_scores()
+        telemetry.flush_trace(f"evaluator-round-{self.round_num:04d}")
+
+    def committed_updates(self):
+        """读取本轮以 Merkle 根提交的更新清单 {训练者: CID}；清单与链上的根不一致时视为无效"""
+        commitment = self.blockchain_utils.get_update_root(self.round_num)
+        if commitment is None:
+            return {}
+        root, manifest_cid, _ = commitment
+        try:
+            buffer = io.BytesIO()
+            self.ipfs_utils.download_stream(manifest_cid, buffer)
+            entries = json.loads(buffer.getvalue().decode("utf-8"))["updates"]
+            leaves = [update_leaf(trainer, self.round_num, cid_to_bytes32(cid)) for trainer, cid in entries]
+        except Exception as e:
+            logging.error(f"读取轮次 {self.round_num} 的更新清单 {manifest_cid} 失败: {e}")
+            return {}
+        if merkle_root(leaves) != root:
+            logging.error(f"轮次 {self.round_num} 的更新清单 {manifest_cid} 与链上 Merkle 根不一致")
+            return {}
+        return dict(entries)
+
+    def _submit_scores(self):
+        # 训练者及其更新CID一次读取，与训练者数量无关；以 Merkle 根提交的轮次从清单中补全
+        state = self.blockchain_utils.get_round_state(self.round_num)
+        trainers = state["trainers"]
+        updates = state["updates"]
+        updates.update(self.committed_updates())
+        candidates = {trainer: updates[trainer] for trainer in trainers if updates.get(trainer)}
+        # 本轮全部候选更新在一次遍历测试集的过程中完成评估
+        scores = self.evaluate_models(list(set(candidates.values())))
+        # 将准确率转换为0-100的整数分数；合约支持时一笔 submitScores 交易提交全部分数
+        points = {trainer: int(scores[cid] * 100) for trainer, cid in candidates.items()}
+        pending = [future for future in self.blockchain_utils.submit_scores(self.round_num, points, wait=False)
+                   if future is not None]
+        wait(pending)
+        failed = 0
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                logging.error(f"提交分数失败: {e}")
+        if not failed:
+            for trainer, cid in candidates.items():
+                logging.info(f"提交训练者 {trainer} 的分数: {scores[cid]}")
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - Evaluator - %(message)s')
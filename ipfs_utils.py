@@ -1,60 +1,502 @@
-import io
 import ipfshttpclient
 import torch
+import base58
+import hashlib
+import io
 import logging
 import os
 import tempfile
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from model_cache import ModelCache, DEFAULT_CACHE_DIR
+from codec import is_encoded
+import tensor_format
+import telemetry
+
+# 流式传输的固定分块大小
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# ipfs add 的默认布局：256KiB 定长分块、balanced DAG 每个节点最多 174 个链接、dag-pb 叶子、CIDv0
+IPFS_CHUNK_SIZE = 256 * 1024
+IPFS_MAX_LINKS = 174
+# 上传预先计算过CID的数据时显式指定上述布局，不依赖节点的默认配置
+IPFS_ADD_OPTIONS = {"chunker": f"size-{IPFS_CHUNK_SIZE}", "cid-version": "0", "raw-leaves": "false",
+                    "trickle": "false"}
+
+# 这些异常说明会话本身已不可用，换一个新会话重试一次
+_RECONNECT_ERRORS = (ipfshttpclient.exceptions.ConnectionError, ipfshttpclient.exceptions.ProtocolError)
+
+
+class LatencyStats:
+    """按操作名统计调用次数、失败次数与耗时分布"""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def record(self, op, elapsed, ok=True):
+        with self._lock:
+            entry = self._ops.setdefault(op, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                                              "samples": deque(maxlen=self.window)})
+            entry["count"] += 1
+            if not ok:
+                entry["errors"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["samples"].append(elapsed)
+
+    def snapshot(self):
+        """返回 {操作: {count, errors, mean_s, p50_s, p95_s, max_s}}"""
+        with self._lock:
+            result = {}
+            for op, entry in self._ops.items():
+                samples = sorted(entry["samples"])
+                result[op] = {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "mean_s": entry["total"] / entry["count"],
+                    "p50_s": samples[len(samples) // 2],
+                    "p95_s": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                    "max_s": entry["max"],
+                }
+            return result
+
+
+class TransferProgress:
+    """一次流式传输的字节数、耗时与吞吐统计
+
+    callback(transferred_bytes, total_bytes) 在每个分块后调用，total_bytes 未知时为 None。
+    """
+
+    def __init__(self, op, total=None, callback=None):
+        self.op = op
+        self.total = total
+        self.callback = callback
+        self.bytes = 0
+        self._start = time.perf_counter()
+        self.elapsed = 0.0
+
+    def update(self, nbytes):
+        self.bytes += nbytes
+        self.elapsed = time.perf_counter() - self._start
+        if self.callback is not None:
+            self.callback(self.bytes, self.total)
+
+    @property
+    def throughput(self):
+        """吞吐量（MB/s）"""
+        return self.bytes / 2 ** 20 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._start
+        logging.info(f"{self.op} 完成：{self.bytes} 字节，耗时 {self.elapsed:.2f}s，吞吐 {self.throughput:.1f} MB/s")
+        return self
+
+
+def _rechunk(chunks, chunk_size):
+    """把任意大小的字节段切分为不超过 chunk_size 的 bytes，任意时刻只多占用一个分块的内存"""
+    pending = bytearray()
+    for chunk in chunks:
+        view = memoryview(chunk).cast("B")
+        while len(view):
+            take = min(chunk_size - len(pending), len(view))
+            pending += view[:take]
+            view = view[take:]
+            if len(pending) == chunk_size:
+                yield bytes(pending)
+                pending.clear()
+    if pending:
+        yield bytes(pending)
+
+
+def _remaining(timeout, deadline):
+    """deadline（time.monotonic() 时间点）之前剩余的秒数，不超过 timeout；已过期时抛出 TimeoutError"""
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("已超过下载截止时间")
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def _file_chunks(f, chunk_size):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _buffer_sink(buffer):
+    """返回把数据顺序写入预分配缓冲区（bytearray / memoryview / uint8 张量）的写函数"""
+    if isinstance(buffer, torch.Tensor):
+        if buffer.dtype != torch.uint8 or not buffer.is_contiguous() or buffer.device.type != "cpu":
+            raise ValueError("目标张量必须是CPU上连续的 uint8 张量")
+        view = memoryview(buffer.numpy()).cast("B")
+    else:
+        view = memoryview(buffer).cast("B")
+    offset = 0
+
+    def write(chunk):
+        nonlocal offset
+        end = offset + len(chunk)
+        if end > len(view):
+            raise ValueError(f"目标缓冲区过小：需要至少 {end} 字节，实际 {len(view)} 字节")
+        view[offset:end] = chunk
+        offset = end
+
+    return write
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _pb_bytes(field, data):
+    return _varint(field << 3 | 2) + _varint(len(data)) + data
+
+
+def _pb_uint(field, value):
+    return _varint(field << 3) + _varint(value)
+
+
+def _file_node(data, filesize, children=()):
+    """编码一个 UnixFS File 类型的 dag-pb 节点，children 为 (multihash, tsize, filesize)，返回 (multihash, tsize, filesize)
+
+    与 go-ipfs 的编码一致：先写链接（名称为空串）再写数据，叶子数据为空时省略 Data 字段。
+    """
+    unixfs = _pb_uint(1, 2) + (_pb_bytes(2, data) if data else b"") + _pb_uint(3, filesize)
+    unixfs += b"".join(_pb_uint(4, child[2]) for child in children)
+    links = b"".join(_pb_bytes(2, _pb_bytes(1, child[0]) + _pb_bytes(2, b"") + _pb_uint(3, child[1]))
+                     for child in children)
+    node = links + _pb_bytes(1, unixfs)
+    return b"\x12\x20" + hashlib.sha256(node).digest(), len(node) + sum(child[1] for child in children), filesize
+
+
+def compute_cid(data):
+    """在本地计算 ipfs add（IPFS_ADD_OPTIONS，即默认参数）对 data 返回的 CIDv0，不访问IPFS节点
+
+    内联传输的更新用它得到链上提交的CID，接收方用它校验收到的字节与CID一致。
+    """
+    view = memoryview(data).cast("B")
+    nodes = [_file_node(view[i:i + IPFS_CHUNK_SIZE], min(IPFS_CHUNK_SIZE, len(view) - i))
+             for i in range(0, len(view), IPFS_CHUNK_SIZE)] or [_file_node(b"", 0)]
+    # balanced 布局：逐层把左侧节点按 IPFS_MAX_LINKS 个一组挂到父节点下，直到只剩根节点
+    while len(nodes) > 1:
+        nodes = [_file_node(None, sum(child[2] for child in group), group)
+                 for group in (nodes[i:i + IPFS_MAX_LINKS] for i in range(0, len(nodes), IPFS_MAX_LINKS))]
+    return base58.b58encode(nodes[0][0]).decode()
+
+
+class IPFSSessionPool:
+    """线程安全的长连接IPFS会话池
+
+    每个会话在创建时完成一次版本握手，之后通过 HTTP keep-alive 复用连接；
+    会话在使用中出现连接类错误时被丢弃，并用新会话重试一次。
+    """
+
+    def __init__(self, ipfs_api, size=4, timeout=120):
+        self.ipfs_api = ipfs_api
+        self.size = size
+        self.timeout = timeout
+        self.stats = LatencyStats()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        return ipfshttpclient.connect(self.ipfs_api, session=True, timeout=self.timeout)
+
+    def _acquire(self):
+        while True:
+            if self._closed:
+                raise RuntimeError("IPFS会话池已关闭")
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            # 会话全部借出时等待归还；超时后重新检查，防止被丢弃的会话名额无人补上
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _release(self, client):
+        if self._closed:
+            client.close()
+        else:
+            self._idle.put(client)
+
+    def _discard(self, client):
+        with self._lock:
+            self._created -= 1
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def run(self, op, fn, retry=True):
+        """借出一个会话执行 fn(client)，记录耗时，连接失效时换新会话重试一次
+
+        retry=False 用于已经向不可回退的目标写入了部分数据的流式操作。
+        """
+        attempts = 2 if retry else 1
+        for attempt in range(attempts):
+            client = self._acquire()
+            start = time.perf_counter()
+            try:
+                result = fn(client)
+            except _RECONNECT_ERRORS as e:
+                self._discard(client)
+                self.stats.record(op, time.perf_counter() - start, ok=False)
+                if attempt == attempts - 1:
+                    raise
+                logging.warning(f"IPFS会话失效（{op}）: {e}，重新连接后重试")
+                continue
+            except Exception:
+                # 应用层错误（如CID不存在）不代表连接失效，会话照常归还
+                self._release(client)
+                self.stats.record(op, time.perf_counter() - start, ok=False)
+                raise
+            self._release(client)
+            self.stats.record(op, time.perf_counter() - start)
+            return result
+
+    def close(self):
+        """关闭所有空闲会话，借出中的会话在归还时关闭"""
+        self._closed = True
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            client.close()
+
 
 class IPFSUtils:
-    def __init__(self, ipfs_api="/ip4/127.0.0.1/tcp/5001/http"):
+    def __init__(self, ipfs_api="/ip4/127.0.0.1/tcp/5001/http", use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+                 pool_size=4):
         self.ipfs_api = ipfs_api
+        # CID 不可变，本地缓存命中后无需再访问IPFS节点
+        self.cache = ModelCache(cache_dir) if use_cache else None
+        # 服务器与评估器的并发上传/下载共享这些长连接会话
+        self.pool = self._make_pool(pool_size)
+        # 内联传输的更新在后台上传，见 pin_async
+        self._pin_executor = None
+        self._pin_lock = threading.Lock()
         try:
-            with ipfshttpclient.connect(self.ipfs_api) as ipfs:
-                logging.info("成功连接到IPFS节点")
+            self.pool.run("connect", lambda ipfs: ipfs.version())
+            logging.info("成功连接到IPFS节点")
         except Exception as e:
             logging.error(f"无法连接到IPFS节点: {e}")
             raise
 
+    def _make_pool(self, pool_size):
+        return IPFSSessionPool(self.ipfs_api, size=pool_size)
+
+    def close(self):
+        # 等待后台上传完成，已提交上链的CID在IPFS上都可获取
+        if self._pin_executor is not None:
+            self._pin_executor.shutdown(wait=True)
+        self.pool.close()
+
+    def session_stats(self):
+        """返回各IPFS操作的调用次数与耗时统计"""
+        return self.pool.stats.snapshot()
+
     def upload_model(self, model_or_path, use_file=False):
-        """上传模型到IPFS，支持字节流或文件路径"""
+        """上传模型到IPFS，支持模型对象或文件路径，均以固定大小分块流式上传"""
+        source = model_or_path if isinstance(model_or_path, str) else model_or_path.state_dict()
+        return self.upload_state_dict(source)
+
+    def upload_state_dict(self, state_dict):
+        """序列化 state_dict（或编码后的增量更新）并流式上传到IPFS，失败时返回 None"""
         try:
-            if use_file or not isinstance(model_or_path, torch.nn.Module):
-                # 使用文件路径
-                if isinstance(model_or_path, str):
-                    file_path = model_or_path
-                else:
-                    file_path = tempfile.mktemp(suffix=".pth")
-                    torch.save(model_or_path.state_dict(), file_path)
-                with ipfshttpclient.connect(self.ipfs_api) as ipfs:
-                    cid = ipfs.add(file_path)["Hash"]
-                if isinstance(model_or_path, torch.nn.Module):
-                    os.remove(file_path)  # 清理临时文件
-            else:
-                # 使用字节流
-                buffer = io.BytesIO()
-                torch.save(model_or_path.state_dict(), buffer)
-                buffer.seek(0)
-                with ipfshttpclient.connect(self.ipfs_api) as ipfs:
-                    cid = ipfs.add_bytes(buffer.read())
-            
-            if not cid:
-                logging.error("上传成功但未返回有效CID")
-                return None
+            cid, _ = self.upload_stream(state_dict)
             logging.info(f"上传模型到IPFS，CID={cid}")
             return cid
         except Exception as e:
             logging.error(f"上传模型到IPFS失败: {e}")
             return None
 
-    def download_model(self, cid, output_path=None):
+    def upload_stream(self, source, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, add_options=None):
+        """以固定大小分块流式上传，返回 (cid, TransferProgress)
+
+        source 可以是文件路径、可读的二进制文件对象，或可被 tensor_format 序列化的对象；
+        后者边序列化边上传，不会在内存中拼出完整副本。上传的同时写入本地缓存。
+        add_options 为传给 ipfs add 的参数（例如 IPFS_ADD_OPTIONS）。
+        """
+        total = os.path.getsize(source) if isinstance(source, str) else None
+        stats = TransferProgress("上传", total, progress)
+
+        def add(ipfs):
+            if isinstance(source, str):
+                f = open(source, "rb")
+                chunks = _file_chunks(f, chunk_size)
+            elif hasattr(source, "read"):
+                f = None
+                chunks = _file_chunks(source, chunk_size)
+            else:
+                f = None
+                chunks = tensor_format.iter_chunks(source)
+            writer = self.cache.writer() if self.cache is not None else None
+
+            def body():
+                for chunk in _rechunk(chunks, chunk_size):
+                    if writer is not None:
+                        writer.write(chunk)
+                    stats.update(len(chunk))
+                    yield chunk
+
+            try:
+                cid = ipfs.add_bytes(body(), opts=add_options) if add_options else ipfs.add_bytes(body())
+                if not cid:
+                    raise ValueError("上传成功但未返回有效CID")
+                if writer is not None:
+                    writer.commit(cid)
+                return cid
+            finally:
+                if writer is not None:
+                    writer.abort()
+                if f is not None:
+                    f.close()
+
+        # 文件对象读过之后无法回退，不做重连重试
+        with telemetry.span("ipfs.upload") as span:
+            cid = self.pool.run("add_stream", add, retry=not hasattr(source, "read"))
+            span.set(cid=cid, bytes=stats.bytes)
+        telemetry.count("ipfs_bytes", stats.bytes, direction="upload")
+        return cid, stats.finish()
+
+    def pin_async(self, data, cid):
+        """在后台线程中把已序列化的 data 上传到IPFS，返回 Future
+
+        cid 为调用方用 compute_cid 预先算出并已随结果发送或提交上链的CID，
+        节点返回的CID与之不一致时记录错误。
+        """
+        with self._pin_lock:
+            if self._pin_executor is None:
+                self._pin_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ipfs-pin")
+
+        def pin():
+            try:
+                uploaded, _ = self.upload_stream(io.BytesIO(data), add_options=IPFS_ADD_OPTIONS)
+            except Exception as e:
+                logging.error(f"后台上传CID {cid} 失败: {e}")
+                return None
+            if uploaded != cid:
+                logging.error(f"后台上传得到的CID {uploaded} 与预先计算的 {cid} 不一致，请检查IPFS节点的分块参数")
+            return uploaded
+
+        return self._pin_executor.submit(telemetry.scoped(pin))
+
+    def load_inline(self, cid, data, map_location=None):
+        """反序列化随 Flower 结果内联传输的模型字节，并写入本地磁盘缓存供之后按CID读取
+
+        调用方需先用 compute_cid 确认 data 与 cid 一致。
+        """
+        if self.cache is not None:
+            self.cache.put_bytes(cid, data)
+        with telemetry.span("model.deserialize", cid=cid):
+            return tensor_format.loads(data, map_location=map_location)
+
+    def _download_chunks(self, cid, sink, timeout, stats, deadline=None):
+        """流式读取CID内容，逐块交给 sink 处理；超过 deadline 时在下一个分块处抛出 TimeoutError"""
+        def cat(ipfs):
+            for chunk in ipfs.cat(cid, stream=True, timeout=_remaining(timeout, deadline)):
+                _remaining(timeout, deadline)
+                sink(chunk)
+                stats.update(len(chunk))
+
+        # 已写出的分块无法撤回，不做重连重试
+        start = stats.bytes
+        with telemetry.span("ipfs.download", cid=cid) as span:
+            self.pool.run("cat_stream", cat, retry=False)
+            span.set(bytes=stats.bytes - start)
+        telemetry.count("ipfs_bytes", stats.bytes - start, direction="download")
+
+    def download_stream(self, cid, destination, timeout=60, progress=None):
+        """以流式分块下载CID内容并直接写入目标，返回 TransferProgress
+
+        destination 可以是文件路径、可写的二进制文件对象，或预分配的 bytearray /
+        memoryview / CPU uint8 张量。无论模型多大，内存占用都只有一个分块。
+        """
+        if not cid or not isinstance(cid, str) or cid.strip() == "":
+            raise ValueError("CID 不能为空或无效")
+        stats = TransferProgress(f"下载 {cid}", None, progress)
+        path_out = isinstance(destination, str)
+        if path_out:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination)), prefix=".tmp-")
+            out = os.fdopen(fd, "wb")
+            write = out.write
+        elif hasattr(destination, "write"):
+            write = destination.write
+        else:
+            write = _buffer_sink(destination)
+        try:
+            cached = self.cache.get_path(cid) if self.cache is not None else None
+            if cached is not None:
+                with open(cached, "rb") as f:
+                    for chunk in _file_chunks(f, DEFAULT_CHUNK_SIZE):
+                        write(chunk)
+                        stats.update(len(chunk))
+            elif self.cache is not None:
+                with self.cache.writer() as writer:
+                    def tee(chunk):
+                        writer.write(chunk)
+                        write(chunk)
+                    self._download_chunks(cid, tee, timeout, stats)
+                    writer.commit(cid)
+            else:
+                self._download_chunks(cid, write, timeout, stats)
+            if path_out:
+                out.close()
+                os.replace(tmp_path, destination)
+        except Exception:
+            if path_out:
+                out.close()
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+        return stats.finish()
+
+    def download_model(self, cid, output_path=None, timeout=60):
         """从IPFS下载模型，支持字节流或保存到文件"""
         if not cid or not isinstance(cid, str) or cid.strip() == "":
             logging.error(f"无效的CID: {cid}")
             raise ValueError("CID 不能为空或无效")
         try:
-            with ipfshttpclient.connect(self.ipfs_api) as ipfs:
-                model_bytes = ipfs.cat(cid, timeout=60)
+            model_bytes = self.cache.get_bytes(cid) if self.cache is not None else None
+            if model_bytes is not None:
+                logging.info(f"本地缓存命中CID {cid}")
+            else:
+                with telemetry.span("ipfs.download", cid=cid) as span:
+                    model_bytes = self.pool.run("cat", lambda ipfs: ipfs.cat(cid, timeout=timeout))
+                    span.set(bytes=len(model_bytes))
+                telemetry.count("ipfs_bytes", len(model_bytes), direction="download")
                 logging.info(f"从IPFS下载CID {cid}")
+                if self.cache is not None:
+                    self.cache.put_bytes(cid, model_bytes)
             if output_path:
                 with open(output_path, 'wb') as f:
                     f.write(model_bytes)
@@ -62,4 +504,105 @@ class IPFSUtils:
             return model_bytes
         except Exception as e:
             logging.error(f"从IPFS下载模型失败: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def load_state_dict(self, cid, map_location=None, timeout=60, deadline=None):
+        """下载并反序列化指定CID的模型参数，优先使用内存缓存
+
+        缓存中的 state_dict 位于CPU且可能被多个调用方共享，调用方不得原地修改。
+        编码后的增量更新只会被读取一次，原样返回且不进入内存缓存。
+        timeout 只限制单次读取的等待；deadline 为 time.monotonic() 的时间点，下载超过该时间时抛出 TimeoutError。
+        """
+        state_dict = self.cache.get_state_dict(cid) if self.cache is not None else None
+        telemetry.count("model_loads", cache="memory" if state_dict is not None else "miss")
+        if state_dict is None and self.cache is not None:
+            # 流式下载到磁盘缓存后通过 mmap 零拷贝加载，内存占用与模型大小无关
+            path = self.cache.get_path(cid)
+            if path is None:
+                stats = TransferProgress(f"下载 {cid}")
+                with self.cache.writer() as writer:
+                    self._download_chunks(cid, writer.write, timeout, stats, deadline)
+                    path = writer.commit(cid)
+                stats.finish()
+            if path is not None:
+                with telemetry.span("model.deserialize", cid=cid):
+                    state_dict = tensor_format.load(path)
+                if is_encoded(state_dict):
+                    return state_dict
+                self.cache.put_state_dict(cid, state_dict)
+        if state_dict is None:
+            model_bytes = self.download_model(cid, timeout=_remaining(timeout, deadline))
+            if not model_bytes:
+                raise ValueError("下载模型失败，返回空字节")
+            # 张量零拷贝地指向下载的字节，旧的 .pth CID 仍可读取
+            with telemetry.span("model.deserialize", cid=cid):
+                state_dict = tensor_format.loads(model_bytes)
+            if is_encoded(state_dict):
+                return state_dict
+            if self.cache is not None:
+                self.cache.put_state_dict(cid, state_dict)
+        if map_location is not None and torch.device(map_location).type != "cpu":
+            state_dict = {name: tensor.to(map_location) for name, tensor in state_dict.items()}
+        return state_dict
+
+    def cache_stats(self):
+        """返回本地模型缓存的命中统计，未启用缓存时返回空字典"""
+        return self.cache.stats() if self.cache is not None else {}
+
+    def fetch_state_dicts(self, cids, map_location=None, max_workers=8, timeout=60, retries=2, backoff=1.0,
+                          deadline=None):
+        """并发下载并反序列化多个模型，按完成顺序逐个产出 (cid, state_dict)
+
+        每个CID单独应用超时与重试策略，多次失败的CID记录日志后跳过，不会阻塞其他CID；
+        同一时刻驻留内存的模型数不超过 max_workers。
+        timeout 只是单次读取的 socket 超时，持续慢速返回数据的节点不会触发它；deadline 为每个CID
+        从开始下载起（含重试）的总时限，默认 timeout × (retries + 1)，超时的CID同样记录日志后跳过。
+        """
+        if deadline is None:
+            deadline = timeout * (retries + 1)
+
+        def fetch(cid, expires):
+            for attempt in range(retries + 1):
+                try:
+                    return self.load_state_dict(cid, map_location=map_location, timeout=timeout, deadline=expires)
+                except Exception as e:
+                    delay = backoff * (attempt + 1)
+                    if attempt == retries or time.monotonic() + delay >= expires:
+                        raise
+                    logging.warning(f"获取CID {cid} 失败（第 {attempt + 1} 次）: {e}，{delay:.1f}s 后重试")
+                    time.sleep(delay)
+
+        if not cids:
+            return
+        max_workers = max(1, min(max_workers, len(cids)))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # 在途任务数不超过线程数，已完成但未被消费的模型不会无限堆积
+            waiting = deque(cids)
+            pending = {}
+            while waiting or pending:
+                while waiting and len(pending) < max_workers:
+                    cid = waiting.popleft()
+                    expires = time.monotonic() + deadline
+                    pending[executor.submit(fetch, cid, expires)] = (cid, expires)
+                # 工作线程在下一个分块处检查截止时间；这里再等待最近的截止时间作为兜底
+                first_expiry = min(expires for _, expires in pending.values())
+                done, _ = wait(pending, timeout=max(0.0, first_expiry - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    cid, _ = pending.pop(future)
+                    try:
+                        state_dict = future.result()
+                    except Exception as e:
+                        logging.error(f"下载或加载CID {cid} 的模型失败: {e}")
+                        continue
+                    yield cid, state_dict
+                    del state_dict
+                now = time.monotonic()
+                for future, (cid, expires) in list(pending.items()):
+                    if expires <= now:
+                        # 超时的下载在后台结束，结果被丢弃
+                        del pending[future]
+                        logging.error(f"下载CID {cid} 的模型超过 {deadline:.1f}s 截止时间，跳过")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import tensor_format
 
 class CNN(nn.Module):
     def __init__(self):
@@ -11,20 +12,22 @@ class CNN(nn.Module):
 
     def forward(self, x):
         x = self.pool(torch.relu(self.conv1(x)))
-        x = x.view(-1, 10 * 12 * 12)
+        # reshape 同时支持 channels_last 布局的特征图
+        x = x.reshape(-1, 10 * 12 * 12)
         x = torch.relu(self.fc1(x))
         x = self.fc2(x)
         return x
 
 def save_model(model, path):
-    torch.save(model.state_dict(), path)
+    tensor_format.dump(model.state_dict(), path)
 
 def load_model(source, model_class, map_location=None):
+    """从文件路径或字节串加载模型，兼容旧的 torch.save 格式"""
     model = model_class()
     if isinstance(source, str):
-        state_dict = torch.load(source, map_location=map_location)
+        state_dict = tensor_format.load(source, map_location=map_location)
     else:
-        state_dict = torch.load(source, map_location=map_location)
+        state_dict = tensor_format.loads(source, map_location=map_location)
     model.load_state_dict(state_dict)
     return model
 
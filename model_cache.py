@@ -0,0 +1,222 @@
+import os
+import re
+import threading
+import logging
+import tempfile
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为仅依赖原子重命名
+    fcntl = None
+
+DEFAULT_CACHE_DIR = "ipfs_models/cache"
+
+# CID 只包含 base58/base32 字符，其他输入不进入缓存，避免被拼接成任意路径
+_CID_PATTERN = re.compile(r"^[A-Za-z0-9]+$")
+
+
+def _state_dict_nbytes(state_dict):
+    return sum(t.numel() * t.element_size() for t in state_dict.values() if hasattr(t, "element_size"))
+
+
+class ModelCache:
+    """CID寻址的两级本地模型缓存
+
+    IPFS 的 CID 与内容一一对应且不可变，因此缓存条目永远不会过期，只会因容量被淘汰：
+      - 内存层：反序列化后的 state_dict，按字节数上限做 LRU 淘汰，供同一进程内重复读取；
+      - 磁盘层：原始模型字节，按总字节数上限淘汰最久未访问的文件，同一主机上的多个进程共享。
+    磁盘写入先写临时文件再原子重命名，淘汰过程由文件锁串行化，因此多进程并发访问是安全的。
+    内存层返回的 state_dict 在调用方之间共享，调用方不得原地修改其中的张量。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_disk_bytes=2 * 1024 ** 3, max_memory_bytes=512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(self.cache_dir, ".lock")
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._mutex = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "memory_misses": 0,
+            "disk_hits": 0,
+            "disk_misses": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def is_cacheable(cid):
+        return isinstance(cid, str) and bool(_CID_PATTERN.match(cid))
+
+    def _path(self, cid):
+        return os.path.join(self.cache_dir, cid)
+
+    def _count(self, name):
+        with self._mutex:
+            self.counters[name] += 1
+
+    def stats(self):
+        """返回命中/未命中计数以及当前内存层占用"""
+        with self._mutex:
+            stats = dict(self.counters)
+            stats["memory_items"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        return stats
+
+    # ---- 内存层 ----
+
+    def get_state_dict(self, cid):
+        with self._mutex:
+            state_dict = self._memory.get(cid)
+            if state_dict is None:
+                self.counters["memory_misses"] += 1
+                return None
+            self._memory.move_to_end(cid)
+            self.counters["memory_hits"] += 1
+            return state_dict
+
+    def put_state_dict(self, cid, state_dict):
+        if not self.is_cacheable(cid):
+            return
+        nbytes = _state_dict_nbytes(state_dict)
+        if nbytes > self.max_memory_bytes:
+            return
+        with self._mutex:
+            if cid in self._memory:
+                self._memory.move_to_end(cid)
+                return
+            self._memory[cid] = state_dict
+            self._memory_bytes += nbytes
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= _state_dict_nbytes(evicted)
+                self.counters["evictions"] += 1
+
+    # ---- 磁盘层 ----
+
+    def get_bytes(self, cid):
+        if not self.is_cacheable(cid):
+            return None
+        path = self._path(cid)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # 刷新访问时间，供 LRU 淘汰使用
+        except FileNotFoundError:
+            # 不存在，或恰好被其他进程淘汰
+            self._count("disk_misses")
+            return None
+        self._count("disk_hits")
+        return data
+
+    def get_path(self, cid):
+        """返回磁盘层中该CID的文件路径（可直接 mmap），未缓存时返回 None"""
+        if not self.is_cacheable(cid):
+            return None
+        path = self._path(cid)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._count("disk_misses")
+            return None
+        self._count("disk_hits")
+        return path
+
+    def writer(self):
+        """返回一个流式写入器，数据先写入临时文件，commit(cid) 时原子地放入磁盘层"""
+        return _CacheWriter(self)
+
+    def put_bytes(self, cid, data):
+        if not self.is_cacheable(cid) or len(data) > self.max_disk_bytes:
+            return
+        path = self._path(cid)
+        if os.path.exists(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # 缓存写入失败不影响下载结果本身
+            logging.warning(f"写入模型缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """磁盘层超过容量上限时，按访问时间从旧到新删除文件"""
+        with open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = []
+                total = 0
+                for entry in os.scandir(self.cache_dir):
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+                if total <= self.max_disk_bytes:
+                    return
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_disk_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    self._count("evictions")
+                    logging.info(f"模型缓存已满，淘汰 {os.path.basename(path)}")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _CacheWriter:
+    """ModelCache 的流式写入器，用作上下文管理器，未 commit 的临时文件在退出时删除"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.cache_dir, prefix=".tmp-")
+        self._file = os.fdopen(fd, "wb")
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.abort()
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, cid):
+        """写入完成后以CID命名，返回缓存文件路径；CID不可缓存或超出容量时返回 None"""
+        self._file.close()
+        if not self.cache.is_cacheable(cid) or self.size > self.cache.max_disk_bytes:
+            self.abort()
+            return None
+        path = self.cache._path(cid)
+        os.replace(self.tmp_path, path)
+        self.tmp_path = None
+        self.cache._evict_disk()
+        return path
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.tmp_path is not None and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.tmp_path = None
@@ -0,0 +1,106 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from blockchain_utils import bytes32_to_cid
+
+
+class GlobalModelPrefetcher:
+    """客户端全局模型预取器
+
+    订阅合约的 GlobalModelUpdated（紧凑模式下为 GlobalModelDigestUpdated）事件，全局模型一经上链就在后台线程中下载、反序列化并
+    校验其参数名与形状，fit 开始时直接取用已驻留内存的 state_dict。只保留最新一轮的模型，
+    旧轮次的事件被忽略。
+    """
+
+    def __init__(self, blockchain_utils, ipfs_utils, template=None, map_location=None, poll_interval=1.0,
+                 timeout=60, trace_scope=None):
+        """template 为本地模型的 state_dict，用于校验下载的模型结构；trace_scope 为后台下载 span 所归属的 scope"""
+        self.blockchain_utils = blockchain_utils
+        self.ipfs_utils = ipfs_utils
+        self.map_location = map_location
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.trace_scope = trace_scope
+        self._shapes = None
+        if template is not None:
+            self._shapes = {name: tuple(tensor.shape) for name, tensor in template.items()}
+        self._lock = threading.Lock()
+        self._round = None
+        self._cid = None
+        self._future = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-prefetch")
+        self._watchers = []
+
+    def start(self):
+        """先订阅事件再读取当前最新的全局模型，两者之间提交的模型不会被遗漏"""
+        if not self._watchers:
+            events = ["GlobalModelUpdated"]
+            if self.blockchain_utils.has_event("GlobalModelDigestUpdated"):
+                events.append("GlobalModelDigestUpdated")
+            self._watchers = [self.blockchain_utils.subscribe(event, self._on_event, poll_interval=self.poll_interval)
+                              for event in events]
+        try:
+            current_round = self.blockchain_utils.get_current_round()
+            if current_round > 0:
+                self._schedule(current_round - 1, self.blockchain_utils.get_global_model_cid(current_round - 1))
+        except Exception as e:
+            logging.warning(f"读取当前全局模型失败，等待 GlobalModelUpdated 事件: {e}")
+        return self
+
+    def close(self):
+        for watcher in self._watchers:
+            watcher.stop()
+        self._watchers = []
+        self._executor.shutdown(wait=False)
+
+    def _on_event(self, args, log=None):
+        self._schedule(args["round"], args["cid"] if "cid" in args else bytes32_to_cid(args["digest"]))
+
+    def _schedule(self, round_num, cid):
+        if not cid:
+            return
+        with self._lock:
+            if self._round is not None and round_num < self._round:
+                return
+            if cid == self._cid:
+                self._round = round_num
+                return
+            self._round, self._cid = round_num, cid
+            self._future = self._executor.submit(telemetry.scoped(self._load, self.trace_scope), cid)
+        logging.info(f"开始预取轮次 {round_num} 的全局模型，CID={cid}")
+
+    def _load(self, cid):
+        state_dict = self.ipfs_utils.load_state_dict(cid, map_location=self.map_location, timeout=self.timeout)
+        if state_dict is None:
+            raise RuntimeError(f"下载全局模型 {cid} 失败")
+        if self._shapes is not None:
+            shapes = {name: tuple(tensor.shape) for name, tensor in state_dict.items()}
+            if shapes != self._shapes:
+                raise ValueError(f"全局模型 {cid} 的结构与本地模型不一致")
+        logging.info(f"全局模型预取完成，CID={cid}")
+        return state_dict
+
+    def latest(self, refresh=True):
+        """返回已知的最新 (全局模型轮次, CID)；refresh 时先同步拉取一次新事件"""
+        if refresh:
+            for watcher in self._watchers:
+                try:
+                    watcher.poll()
+                except Exception as e:
+                    logging.warning(f"拉取 {watcher.event_name} 事件失败: {e}")
+        with self._lock:
+            return self._round, self._cid
+
+    def get(self, cid, timeout=None):
+        """返回预取的 state_dict；CID 不是正在预取的模型或预取失败时返回 None"""
+        with self._lock:
+            future = self._future if cid == self._cid else None
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            logging.warning(f"预取全局模型 {cid} 失败: {e}")
+            return None
@@ -0,0 +1,233 @@
+"""分块向量化的鲁棒聚合
+
+客户端更新被展平为相对基准模型的增量向量，按到达顺序逐行追加写入磁盘上的 N×P float32
+矩阵，内存中同时只有一个更新；聚合时用 np.memmap 按列分块读取（每块 N×C，C 由 chunk_bytes
+决定），在每块上做向量化的逐坐标运算，因此峰值内存与客户端数 N 和参数量 P 的乘积无关。
+workers > 0 时各块分发到进程池，子进程直接按路径打开内存映射，不传输更新数据。
+
+支持的规则：
+    mean          按权重加权平均（等价于 FedAvg）
+    median        逐坐标中位数
+    trimmed_mean  逐坐标去掉最大、最小各 trim_ratio 比例后取平均
+    krum          选出与最近的 N - f - 2 个更新距离平方和最小的一个更新（f 为 num_byzantine）
+    multi_krum    取 Krum 分数最小的 m 个更新求平均
+clip_norm 非空时先将每个增量的 L2 范数裁剪到 clip_norm 以内，再应用上述规则。
+median / trimmed_mean / krum 不使用样本数权重。
+"""
+import os
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from codec import decode_into
+
+RULES = ("mean", "median", "trimmed_mean", "krum", "multi_krum")
+
+
+def _open_rows(path, shape):
+    return np.memmap(path, dtype=np.float32, mode="r", shape=shape)
+
+
+def _reduce_chunk(path, shape, start, stop, rule, scales, weights, trim):
+    """对第 [start, stop) 列做逐坐标聚合，scales 为每行的裁剪系数"""
+    block = np.asarray(_open_rows(path, shape)[:, start:stop])
+    if scales is not None:
+        block = block * scales[:, None]
+    if rule == "mean":
+        return weights @ block / weights.sum()
+    # 沿客户端维度整体排序比 np.median 的逐列选择快数倍
+    if rule == "median":
+        block = np.sort(block, axis=0)
+        n = shape[0]
+        return block[n // 2] if n % 2 else (block[n // 2 - 1] + block[n // 2]) / 2
+    if rule == "trimmed_mean":
+        block = np.sort(block, axis=0)
+        return block[trim:shape[0] - trim].mean(axis=0)
+    raise ValueError(f"未知的聚合规则: {rule}")
+
+
+def _gram_chunk(path, shape, start, stop):
+    """第 [start, stop) 列对 Gram 矩阵 XXᵀ 的贡献"""
+    block = np.asarray(_open_rows(path, shape)[:, start:stop], dtype=np.float64)
+    return block @ block.T
+
+
+def krum_scores(gram, num_byzantine):
+    """由 Gram 矩阵计算每个更新的 Krum 分数：到最近 N - f - 2 个其他更新的距离平方和"""
+    n = gram.shape[0]
+    diag = np.diag(gram)
+    distances = np.maximum(diag[:, None] + diag[None, :] - 2 * gram, 0.0)
+    np.fill_diagonal(distances, np.inf)
+    closest = max(1, n - num_byzantine - 2)
+    closest = min(closest, n - 1)
+    if closest <= 0:
+        return np.zeros(n)
+    return np.sort(distances, axis=1)[:, :closest].sum(axis=1)
+
+
+class RobustAggregator:
+    """与 StreamingFedAvg 接口一致（reset / add / add_encoded / result）的分块鲁棒聚合器"""
+
+    def __init__(self, template, rule="median", trim_ratio=0.1, num_byzantine=0, multi_krum_m=None, clip_norm=None,
+                 chunk_bytes=64 * 1024 * 1024, workers=0, tmp_dir=None):
+        if rule not in RULES:
+            raise ValueError(f"未知的聚合规则: {rule}")
+        if not 0 <= trim_ratio < 0.5:
+            raise ValueError(f"trim_ratio 必须在 [0, 0.5) 内，收到 {trim_ratio}")
+        self.rule = rule
+        self.trim_ratio = trim_ratio
+        self.num_byzantine = num_byzantine
+        self.multi_krum_m = multi_krum_m
+        self.clip_norm = clip_norm
+        self.chunk_bytes = chunk_bytes
+        self.workers = workers
+        self.tmp_dir = tmp_dir
+        self._layout = []
+        offset = 0
+        for name, tensor in template.items():
+            numel = tensor.numel()
+            self._layout.append((name, offset, numel, tuple(tensor.shape), tensor.dtype))
+            offset += numel
+        self._numel = offset
+        self._base = None
+        self._file = None
+        self._path = None
+        self._norms = []
+        self._weights = []
+        self.total_weight = 0.0
+        self.num_updates = 0
+
+    @property
+    def numel(self):
+        return self._numel
+
+    def reset(self, base=None):
+        """丢弃已写入的更新开始新一轮聚合；传入 base 时累加的是相对 base 的增量"""
+        self.close()
+        fd, self._path = tempfile.mkstemp(dir=self.tmp_dir, prefix="bcfl-updates-", suffix=".f32")
+        self._file = os.fdopen(fd, "wb")
+        self._norms = []
+        self._weights = []
+        self.total_weight = 0.0
+        self.num_updates = 0
+        self._base = None if base is None else self._flatten(base)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._path is not None and os.path.exists(self._path):
+            os.remove(self._path)
+        self._path = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _flatten(self, state_dict):
+        missing = [name for name, *_ in self._layout if name not in state_dict]
+        if missing or len(state_dict) != len(self._layout):
+            raise KeyError(f"state_dict 与模板不一致，缺失: {missing}")
+        flat = torch.empty(self._numel, dtype=torch.float32)
+        with torch.no_grad():
+            for name, offset, numel, shape, _ in self._layout:
+                tensor = state_dict[name]
+                if tuple(tensor.shape) != shape:
+                    raise ValueError(f"参数 {name} 形状不匹配: {tuple(tensor.shape)} != {shape}")
+                flat[offset:offset + numel].copy_(tensor.detach().reshape(-1))
+        return flat
+
+    def _append(self, row, weight):
+        if weight <= 0:
+            raise ValueError(f"聚合权重必须为正数，收到 {weight}")
+        if self._file is None:
+            raise RuntimeError("添加更新前必须先调用 reset()")
+        self._file.write(row.numpy().tobytes())
+        self._norms.append(float(row.norm()))
+        self._weights.append(float(weight))
+        self.total_weight += weight
+        self.num_updates += 1
+
+    def add(self, state_dict, weight=1.0, base=None):
+        """写入一个客户端更新；base 为该更新的训练起点（默认使用 reset 时的基准）"""
+        row = self._flatten(state_dict)
+        if base is not None:
+            if self._base is None:
+                raise RuntimeError("指定更新的基准模型前必须通过 reset(base=...) 进入增量模式")
+            row -= self._flatten(base)
+        elif self._base is not None:
+            row -= self._base
+        self._append(row, weight)
+
+    def add_encoded(self, payload, weight=1.0):
+        """写入编码后的增量更新（见 codec.UpdateEncoder）"""
+        if self._base is None:
+            raise RuntimeError("累加编码增量前必须通过 reset(base=...) 设置基准模型")
+        tensors = payload["tensors"]
+        missing = [name for name, *_ in self._layout if name not in tensors]
+        if missing:
+            raise KeyError(f"编码更新与模板不一致，缺失: {missing}")
+        row = torch.zeros(self._numel, dtype=torch.float32)
+        for name, offset, numel, _, _ in self._layout:
+            decode_into(tensors[name], row[offset:offset + numel])
+        self._append(row, weight)
+
+    def _chunks(self, num_rows):
+        columns = max(1, self.chunk_bytes // (4 * max(1, num_rows)))
+        return [(start, min(start + columns, self._numel)) for start in range(0, self._numel, columns)]
+
+    def _map(self, fn, chunks, *args):
+        if self.workers and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                return list(pool.map(fn, *zip(*[(self._path, (self.num_updates, self._numel), start, stop) + args
+                                                  for start, stop in chunks])))
+        return [fn(self._path, (self.num_updates, self._numel), start, stop, *args) for start, stop in chunks]
+
+    def aggregate_flat(self):
+        """返回聚合后的扁平增量（numpy float32）"""
+        if self.num_updates == 0:
+            raise RuntimeError("尚未添加任何客户端更新")
+        self._file.flush()
+        n = self.num_updates
+        scales = None
+        if self.clip_norm is not None:
+            norms = np.asarray(self._norms)
+            scales = np.minimum(1.0, self.clip_norm / np.maximum(norms, 1e-12)).astype(np.float32)
+        weights = np.asarray(self._weights, dtype=np.float32)
+        rule = self.rule
+
+        if rule in ("krum", "multi_krum"):
+            gram = sum(self._map(_gram_chunk, self._chunks(n)))
+            if scales is not None:
+                gram = gram * np.outer(scales, scales)
+            scores = krum_scores(gram, self.num_byzantine)
+            m = 1 if rule == "krum" else (self.multi_krum_m or max(1, n - self.num_byzantine))
+            selected = np.argsort(scores, kind="stable")[:m]
+            logging.info(f"Krum 选中的更新序号: {selected.tolist()}")
+            # 选中的更新等权平均
+            mask = np.zeros(n, dtype=np.float32)
+            mask[selected] = 1.0
+            rule, weights = "mean", mask
+
+        trim = int(n * self.trim_ratio)
+        parts = self._map(_reduce_chunk, self._chunks(n), rule, scales, weights, trim)
+        return np.concatenate(parts).astype(np.float32, copy=False)
+
+    def result(self):
+        """返回聚合后的 state_dict，整数类型的缓冲区四舍五入后还原原始类型"""
+        flat = torch.from_numpy(self.aggregate_flat())
+        if self._base is not None:
+            flat = flat + self._base
+        averaged = {}
+        for name, offset, numel, shape, dtype in self._layout:
+            value = flat[offset:offset + numel]
+            if not dtype.is_floating_point:
+                value = value.round()
+            averaged[name] = value.to(dtype).reshape(shape).clone()
+        logging.info(f"完成 {self.num_updates} 个更新的 {self.rule} 聚合")
+        return averaged
@@ -0,0 +1,88 @@
+import math
+import random
+import threading
+import time
+
+
+class LatencyTracker:
+    """按客户端记录训练往返耗时的指数滑动平均（EWMA），用于选择训练者
+
+    从未参与过的客户端排在最前面以便获得测量值；其余按 EWMA 从快到慢排序。截止时间后才返回的
+    结果在到达时按实际耗时记录，因此反复拖后腿的客户端的 EWMA 会持续偏大而被排到后面。
+    仍在训练中的客户端不能再下发新任务（Flower 的连接一次只能处理一条指令），wait_idle 等待掉队者返回。
+    客户端在训练指标中报告的 samples_per_sec 同样按 EWMA 记录，供调度参考。
+    """
+
+    def __init__(self, alpha=0.3, seed=None):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._ewma = {}
+        self._misses = {}
+        self._started = {}
+        self._throughput = {}
+        self._random = random.Random(seed)
+
+    def started(self, client_id):
+        with self._lock:
+            self._started[client_id] = time.monotonic()
+
+    def finished(self, client_id):
+        """客户端返回结果（无论是否赶上截止时间），记录本次耗时并返回"""
+        with self._lock:
+            start = self._started.pop(client_id, None)
+            if start is None:
+                return None
+            self._idle.notify_all()
+            latency = time.monotonic() - start
+            previous = self._ewma.get(client_id)
+            self._ewma[client_id] = latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+            return latency
+
+    def observe_throughput(self, client_id, samples_per_sec):
+        """记录客户端报告的本地训练吞吐（样本/秒），未报告时忽略"""
+        if not samples_per_sec:
+            return
+        with self._lock:
+            previous = self._throughput.get(client_id)
+            self._throughput[client_id] = (samples_per_sec if previous is None
+                                           else self.alpha * samples_per_sec + (1 - self.alpha) * previous)
+
+    def missed(self, client_id):
+        """客户端未赶上本轮截止时间"""
+        with self._lock:
+            self._misses[client_id] = self._misses.get(client_id, 0) + 1
+
+    def in_flight(self, client_id):
+        with self._lock:
+            return client_id in self._started
+
+    def wait_idle(self, client_ids, count, timeout=None):
+        """等待 client_ids 中至少 count 个客户端空闲，timeout 秒内未达到时返回 False"""
+        with self._idle:
+            return self._idle.wait_for(lambda: sum(client_id not in self._started for client_id in client_ids) >= count,
+                                       timeout)
+
+    def expected(self, client_id):
+        with self._lock:
+            return self._ewma.get(client_id)
+
+    def stats(self):
+        with self._lock:
+            return {client_id: {"ewma": self._ewma.get(client_id), "misses": self._misses.get(client_id, 0),
+                                "samples_per_sec": self._throughput.get(client_id)}
+                    for client_id in set(self._ewma) | set(self._throughput)}
+
+    def rank(self, client_ids):
+        """返回空闲客户端按优先级排序的列表：未测量的（随机顺序）在前，其余按 EWMA 升序"""
+        with self._lock:
+            idle = [client_id for client_id in client_ids if client_id not in self._started]
+            unknown = [client_id for client_id in idle if client_id not in self._ewma]
+            known = sorted((client_id for client_id in idle if client_id in self._ewma), key=self._ewma.__getitem__)
+        self._random.shuffle(unknown)
+        return unknown + known
+
+
+def over_selected(num_trainers, factor):
+    """超额选择的客户端数：ceil(num_trainers * factor)，至少为 num_trainers"""
+    return max(num_trainers, math.ceil(num_trainers * factor))
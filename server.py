@@ -1,10 +1,20 @@
 import flwr as fl
-from blockchain_utils import BlockchainUtils
-from ipfs_utils import IPFSUtils
+from blockchain_utils import BlockchainUtils, cid_to_bytes32, merkle_root, update_leaf
+from ipfs_utils import IPFSUtils, compute_cid
 from model import load_model, save_model, CNN  # 导入 CNN 作为示例模型
+from aggregation import StreamingFedAvg, STALENESS_FUNCTIONS, staleness_weight
+from robust_aggregation import RobustAggregator, RULES as ROBUST_RULES
+from codec import CODECS, is_encoded
+from evaluator import evaluate_models
+from selection import LatencyTracker, over_selected
+from training import training_config
+import telemetry
 import torch
 import logging
 import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Optional, Tuple, Dict, Type
 from flwr.common import Parameters, Scalar, NDArrays
 from web3 import Web3
@@ -15,84 +25,482 @@ import json
 DEFAULT_URL = "http://127.0.0.1:7545"
 DEFAULT_ADDR = "0xe78A0F7E598Cc8b0Bb87894B0F60dD2a88d6a8Ab"
 DEFAULT_PATH = "ipfs_models/initial_model.pth"
+# 客户端更新上链方式：transaction 为每个客户端一笔 submitUpdate，merkle 为服务器每轮一笔 commitUpdateRoot
+UPDATE_COMMITS = ("transaction", "merkle")
+# 客户端更新的传输方式：ipfs 为上传IPFS后只回传CID，inline 为不超过 inline_max_bytes 的更新随 FitRes 直接发送
+TRANSPORTS = ("ipfs", "inline")
+# 等待内联更新的链上提交时查询的间隔（秒）
+COMMIT_POLL_INTERVAL = 0.2
 
 class BCFLStrategy(fl.server.strategy.Strategy):
-    def __init__(self, blockchain_utils, ipfs_utils, model_class: Type[torch.nn.Module]):
+    def __init__(self, blockchain_utils, ipfs_utils, model_class: Type[torch.nn.Module],
+                 fetch_workers: int = 8, fetch_timeout: float = 60, fetch_retries: int = 2,
+                 update_codec: str = "none", topk_ratio: float = 0.01, async_evaluate: bool = True,
+                 staleness: str = "polynomial", staleness_a: float = 0.5, staleness_b: int = 4,
+                 over_selection: float = 1.0, latency_alpha: float = 0.3, straggler_wait: Optional[float] = None,
+                 aggregation: str = "fedavg", clip_norm: Optional[float] = None, trim_ratio: float = 0.1,
+                 num_byzantine: int = 0, aggregation_workers: int = 0,
+                 training: Optional[Dict[str, Scalar]] = None, lr_decay: float = 1.0,
+                 update_commit: str = "transaction", transport: str = "ipfs", inline_max_bytes: int = 4 * 1024 * 1024,
+                 commit_timeout: float = 30):
         super().__init__()
+        if update_codec not in CODECS:
+            raise ValueError(f"未知的更新编码: {update_codec}")
+        if aggregation != "fedavg" and aggregation not in ROBUST_RULES:
+            raise ValueError(f"未知的聚合规则: {aggregation}")
+        if staleness not in STALENESS_FUNCTIONS:
+            raise ValueError(f"未知的陈旧度函数: {staleness}")
+        if update_commit not in UPDATE_COMMITS:
+            raise ValueError(f"未知的更新提交方式: {update_commit}")
+        if transport not in TRANSPORTS:
+            raise ValueError(f"未知的更新传输方式: {transport}")
         self.blockchain_utils = blockchain_utils
         self.ipfs_utils = ipfs_utils
         self.model_class = model_class  # 必须传入模型类
+        # 客户端更新的并发拉取参数：线程池大小、单个CID超时（秒）与重试次数
+        self.fetch_workers = fetch_workers
+        self.fetch_timeout = fetch_timeout
+        self.fetch_retries = fetch_retries
+        # 客户端上传的更新编码方式（通过 FitIns.config 下发），非 "none" 时上传相对全局模型的增量
+        self.update_codec = update_codec
+        self.topk_ratio = topk_ratio
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        from data import load_data
-        self.testloader = load_data()[1]
+        # fedavg 使用预分配的扁平累加缓冲，各轮复用；其余规则（见 robust_aggregation）
+        # 将相对本轮全局模型的增量写入磁盘后分块聚合，可选先做范数裁剪
+        self.aggregation = aggregation
+        if aggregation == "fedavg":
+            self._aggregator = StreamingFedAvg(self.model_class().state_dict(), device=self.device)
+        else:
+            self._aggregator = RobustAggregator(self.model_class().state_dict(), rule=aggregation,
+                                                trim_ratio=trim_ratio, num_byzantine=num_byzantine,
+                                                clip_norm=clip_norm, workers=aggregation_workers)
+        from data import load_test_data
+        self.testloader = load_test_data()
+        # 本轮聚合得到的全局模型 (CID, 模型)，evaluate 直接使用，无需再从IPFS下载
+        self._latest_global = None
+        # async_evaluate 时评估在单线程后台执行，不阻塞下一轮的 configure_fit；
+        # 结果通过 collect_evaluations 写入 start_server 返回的 History
+        self.async_evaluate = async_evaluate
+        self._eval_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bcfl-eval") if async_evaluate else None
+        self._eval_futures = {}
+        self._eval_lock = threading.Lock()
+        # 异步缓冲聚合（见 async_server.BufferedAsyncServer）中陈旧更新的降权方式
+        self.staleness = staleness
+        self.staleness_a = staleness_a
+        self.staleness_b = staleness_b
+        # 各轮全局模型CID，避免异步聚合时重复查询链上
+        self._global_cids = {}
+        # 每轮下发任务的客户端数为训练者数量乘以 over_selection，按历史耗时优先选择快的客户端；
+        # 截止时间与提前截断由 deadline_server.DeadlineServer 执行
+        self.over_selection = over_selection
+        self.latency = LatencyTracker(alpha=latency_alpha)
+        # 上一轮的掉队者仍在训练、空闲客户端不足训练者数量时，最多等待它们返回的时间（秒），None 为一直等待；
+        # 超时后只要有一个空闲客户端就开始本轮
+        self.straggler_wait = straggler_wait
+        # Flower 客户端ID -> 训练者账户，来自训练结果的 account 指标或 get_properties，见 register_trainers
+        self._accounts = {}
+        # 客户端本地训练超参数（见 training.DEFAULT_TRAINING），每轮随 config 下发；
+        # 学习率按轮次乘以 lr_decay ** (server_round - 1)
+        self.training = training_config(training or {})
+        self.lr_decay = lr_decay
+        # merkle 时客户端不再各自发送 submitUpdate 交易，服务器在聚合后以一笔 commitUpdateRoot
+        # 提交本轮全部被采纳更新的 Merkle 根，并把 (训练者, CID) 清单上传IPFS供评估器与训练者校验
+        if update_commit == "merkle" and not blockchain_utils.has_function("commitUpdateRoot"):
+            logging.warning("合约ABI中没有 commitUpdateRoot，请重新编译部署合约；更新仍由客户端逐笔提交")
+            update_commit = "transaction"
+        self.update_commit = update_commit
+        # inline 时客户端把序列化后的更新与本地计算的CID一起返回，服务器校验两者一致后直接反序列化，
+        # 不再等待客户端的IPFS上传与交易回执；客户端在后台完成上传与上链
+        self.transport = transport
+        self.inline_max_bytes = inline_max_bytes
+        # 提交全局模型前等待内联更新的 submitUpdate 上链的最长时间（秒），见 _await_commitments
+        self.commit_timeout = commit_timeout
 
     def initialize_parameters(self, client_manager):
+        # 恢复运行时以已提交的全局模型CID作为初始参数，服务器启动时先评估该模型
+        if self._latest_global is not None:
+            return fl.common.ndarrays_to_parameters([self._latest_global[0].encode('utf-8')])
         return fl.common.ndarrays_to_parameters([])
 
+    def resume(self, round_num, cid):
+        """从链上已提交的第 round_num 轮全局模型继续训练
+
+        模型通过 IPFSUtils 的本地缓存加载：本机上传过的全局模型已写入磁盘缓存，无需访问IPFS节点。
+        加载失败返回 False，此时下一轮仍会在需要时按CID从IPFS拉取。
+        """
+        self._global_cids[round_num] = cid
+        try:
+            model = self.model_class().to(self.device)
+            model.load_state_dict(self.ipfs_utils.load_state_dict(cid, map_location=self.device))
+            model.eval()
+        except Exception as e:
+            logging.error(f"加载轮次 {round_num} 的全局模型 {cid} 失败: {e}")
+            return False
+        self._latest_global = (cid, model)
+        logging.info(f"已加载轮次 {round_num} 的全局模型，CID={cid}")
+        return True
+
+    def num_trainers(self):
+        return self.blockchain_utils.get_task()[3]
+
+    def _fit_config(self, server_round):
+        config = {"server_round": server_round, "codec": self.update_codec, "commit": self.update_commit,
+                  "transport": self.transport}
+        if self.transport == "inline":
+            config["inline_max_bytes"] = self.inline_max_bytes
+        config.update(self.training)
+        config["lr"] = self.training["lr"] * self.lr_decay ** max(0, server_round - 1)
+        if self.update_codec == "topk":
+            config["topk_ratio"] = self.topk_ratio
+        return config
+
+    @telemetry.traced("server.configure_fit")
     def configure_fit(self, server_round, parameters, client_manager):
-        num_clients = self.blockchain_utils.contract.functions.task().call()[3]
-        available_clients = client_manager.sample(
-            num_clients=num_clients,
-            min_num_clients=num_clients
+        num_clients = self.num_trainers()
+        client_manager.wait_for(num_clients)
+        clients = client_manager.all()
+        # 仍在训练上一轮任务的掉队者不参与选择；空闲客户端不足时先等待掉队者返回，每轮至少有一个客户端训练
+        if not self.latency.wait_idle(list(clients), num_clients, timeout=self.straggler_wait):
+            self.latency.wait_idle(list(clients), 1)
+        ranked = self.latency.rank(list(clients))
+        selected = ranked[:over_selected(num_clients, self.over_selection)]
+        if len(selected) < num_clients:
+            logging.warning(f"第 {server_round} 轮只有 {len(selected)} 个空闲客户端，少于训练者数量 {num_clients}")
+        self.register_trainers(server_round, [clients[cid] for cid in selected])
+        fit_ins = fl.common.FitIns(parameters, self._fit_config(server_round))
+        return [(clients[cid], fit_ins) for cid in selected]
+
+    def register_trainers(self, server_round, clients, timeout=None):
+        """在本轮开始时把下发任务的客户端账户登记为训练者，返回登记的账户列表
+
+        评估器在本轮提交全局模型之前读取训练者并提交分数，distributeTokens 按登记的训练者分配奖励。
+        账户取自客户端上次训练结果的 account 指标，未知时通过 get_properties 查询一次（只查询空闲的客户端）。
+        """
+        accounts = []
+        for client in clients:
+            if client.cid not in self._accounts:
+                account = None
+                try:
+                    res = client.get_properties(fl.common.GetPropertiesIns({}), timeout, server_round)
+                    account = res.properties.get("account")
+                except Exception as e:
+                    logging.warning(f"查询客户端 {client.cid} 的账户失败: {e}")
+                self._accounts[client.cid] = account
+            if self._accounts[client.cid]:
+                accounts.append(self._accounts[client.cid])
+        accounts = list(dict.fromkeys(accounts))
+        if len(accounts) < len(clients):
+            logging.warning(f"第 {server_round} 轮有 {len(clients) - len(accounts)} 个客户端未报告账户，未登记为训练者")
+        # 等待回执：未上链的交易之后发送的交易会按尚未生效的状态估算 gas
+        if accounts and not self.blockchain_utils.select_trainers(server_round, accounts):
+            logging.warning(f"第 {server_round} 轮登记训练者失败")
+        return accounts
+
+    def configure_async_fit(self, version, parameters, client):
+        """异步模式下给单个客户端的训练指令；客户端提交更新时按链上的当前轮次提交"""
+        config = self._fit_config(version)
+        config["async"] = True
+        return fl.common.FitIns(parameters, config)
+
+    def _global_cid(self, round_num):
+        cid = self._global_cids.get(round_num)
+        if not cid:
+            cid = self.blockchain_utils.get_global_model_cid(round_num)
+            if cid:
+                self._global_cids[round_num] = cid
+        return cid
+
+    def _result_update(self, client, fit_res):
+        """从客户端结果中取出 (更新CID, 内联的模型字节)，未内联时字节为 None，无效结果返回 (None, None)"""
+        ndarrays = fl.common.parameters_to_ndarrays(fit_res.parameters)
+        if not ndarrays or len(ndarrays) == 0 or len(ndarrays[0]) == 0:
+            logging.warning(f"客户端 {client} 返回空参数")
+            return None, None
+        cid = ndarrays[0].tobytes().decode('utf-8')
+        if not cid:
+            logging.warning(f"客户端 {client} 返回无效CID")
+            return None, None
+        if fit_res.num_examples <= 0:
+            logging.warning(f"客户端 {client} 的样本数为 {fit_res.num_examples}，忽略其更新")
+            return None, None
+        data = None
+        if len(ndarrays) > 1:
+            # 内联的字节必须与客户端提交上链的CID一致
+            data = ndarrays[1].tobytes()
+            if compute_cid(data) != cid:
+                logging.warning(f"客户端 {client} 内联发送的更新与CID {cid} 不一致，忽略其更新")
+                return None, None
+        return cid, data
+
+    def _fetch_updates(self, cids, inline):
+        """产出 (cid, state_dict)：内联发送的更新直接反序列化，其余从IPFS并发拉取"""
+        for cid in cids:
+            if cid in inline:
+                try:
+                    state_dict = self.ipfs_utils.load_inline(cid, inline[cid], map_location=self.device)
+                except Exception as e:
+                    logging.error(f"解析CID {cid} 的内联更新失败: {e}")
+                    continue
+                yield cid, state_dict
+        yield from self.ipfs_utils.fetch_state_dicts(
+            [cid for cid in cids if cid not in inline],
+            map_location=self.device,
+            max_workers=self.fetch_workers,
+            timeout=self.fetch_timeout,
+            retries=self.fetch_retries,
         )
-        config = {"server_round": server_round}
-        fit_ins = fl.common.FitIns(parameters, config)
-        trainer_addresses = [self.blockchain_utils.web3.eth.accounts[i+1] for i in range(num_clients)]
-        self.blockchain_utils.contract.functions.selectTrainersForRound(server_round, trainer_addresses).transact({'from': self.blockchain_utils.account})
-        return [(client, fit_ins) for client in available_clients]
 
+    def _pin_inline(self, inline):
+        """服务器也把内联收到的更新上传一份，返回 Future 列表
+
+        客户端的后台上传可能晚于评估器按CID下载，提交全局模型前等待这些上传完成（见 _await_pins）。
+        """
+        return [self.ipfs_utils.pin_async(data, cid) for cid, data in inline.items()]
+
+    def _await_pins(self, pins):
+        if pins:
+            wait(pins, timeout=self.fetch_timeout)
+
+    def _await_commitments(self, server_round, inline, accounts, first_round):
+        """transaction 模式下等待内联更新的 submitUpdate 上链，返回超时仍未上链、需从聚合中去掉的CID
+
+        内联传输的客户端在后台提交更新CID，服务器提交全局模型（推进轮次）之后才到达的交易会因轮次
+        不符而失败，链上记录与实际聚合的更新不再一致。异步聚合下客户端在 first_round 到 server_round
+        之间的某一轮提交；未报告账户的更新只要求其CID出现在链上。
+        """
+        if self.update_commit != "transaction" or not inline:
+            return set()
+        pending = set(inline)
+        deadline = time.monotonic() + self.commit_timeout
+        # 首次读取部署以来的提交，之后每次只扫描上次读取之后的新区块
+        committed, from_block = set(), None
+        while True:
+            try:
+                entries, from_block = self.blockchain_utils.get_update_commitments(first_round, server_round,
+                                                                                   from_block)
+                committed |= entries
+            except Exception as e:
+                logging.warning(f"读取第 {server_round} 轮的更新提交失败: {e}")
+            cids = {cid for _, cid in committed}
+            pending = {cid for cid in pending
+                       if cid not in cids or any((account, cid) not in committed for account in accounts.get(cid, []))}
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(COMMIT_POLL_INTERVAL)
+        for cid in pending:
+            logging.warning(f"内联更新 {cid} 在 {self.commit_timeout}s 内未上链，不参与第 {server_round} 轮聚合")
+        return pending
+
+    def _commit_updates(self, server_round, entries):
+        """merkle 模式下提交本轮被采纳更新 [(训练者, CID)] 的 Merkle 根，不等待回执"""
+        if self.update_commit != "merkle":
+            return
+        entries = [(trainer, cid) for trainer, cid in dict.fromkeys(entries)]
+        try:
+            leaves = [update_leaf(trainer, server_round, cid_to_bytes32(cid)) for trainer, cid in entries]
+        except ValueError as e:
+            logging.error(f"无法为第 {server_round} 轮的更新构建 Merkle 树: {e}")
+            return
+        manifest = json.dumps({"round": server_round, "updates": entries}).encode("utf-8")
+        try:
+            manifest_cid, _ = self.ipfs_utils.upload_stream(io.BytesIO(manifest))
+        except Exception as e:
+            logging.error(f"上传第 {server_round} 轮的更新清单失败: {e}")
+            return
+        self.blockchain_utils.commit_update_root(server_round, merkle_root(leaves), manifest_cid, len(entries),
+                                                 wait=False)
+        logging.info(f"提交第 {server_round} 轮 {len(entries)} 个更新的 Merkle 根，清单CID={manifest_cid}")
+
+    @telemetry.traced("server.commit_global")
+    def _commit_global(self, server_round, aggregator):
+        """由聚合结果构建全局模型，上传IPFS并在链上提交，返回新CID，失败返回 None"""
+        global_model = self.model_class().to(self.device)
+        global_model.load_state_dict(aggregator.result())
+        global_model.eval()
+
+        new_cid = self.ipfs_utils.upload_model(global_model)
+        if not new_cid:
+            logging.error("上传全局模型到IPFS失败")
+            return None
+
+        if not self.blockchain_utils.submit_global_model(server_round, new_cid):
+            logging.error(f"第 {server_round} 轮的全局模型 {new_cid} 上链失败")
+            return None
+        logging.info(f"上传全局模型，CID={new_cid}")
+        self._latest_global = (new_cid, global_model)
+        self._global_cids[server_round] = new_cid
+        return new_cid
+
+    def _carry_over(self, server_round):
+        """本轮没有新的全局模型时把上一轮的全局模型作为本轮结果提交
+
+        submitGlobalModel 推进链上的 currentRound，跳过提交会使之后各轮的交易都因轮次不符而失败。
+        """
+        cid = self._global_cid(server_round - 1)
+        if not cid or self.blockchain_utils.get_current_round() != server_round:
+            return
+        if not self.blockchain_utils.submit_global_model(server_round, cid):
+            logging.error(f"第 {server_round} 轮沿用上一轮的全局模型失败，链上轮次未推进")
+            return
+        self._global_cids[server_round] = cid
+        logging.warning(f"第 {server_round} 轮沿用上一轮的全局模型，CID={cid}")
+
+    @telemetry.traced("server.aggregate_fit")
     def aggregate_fit(self, server_round, results, failures):
+        parameters, metrics = self._aggregate_fit(server_round, results, failures)
+        if parameters is None:
+            self._carry_over(server_round)
+        return parameters, metrics
+
+    def _aggregate_fit(self, server_round, results, failures):
         if not results:
             logging.warning("未收到客户端结果")
             return None, {}
 
-        cids = []
+        # CID -> 样本数权重，相同CID（内容完全一致的更新）的权重合并
+        weights = {}
+        # CID -> 提交该更新的训练者账户（客户端在指标 account 中报告）
+        accounts = {}
+        # CID -> 随结果内联发送的模型字节
+        inline = {}
         for client, fit_res in results:
-            ndarrays = fl.common.parameters_to_ndarrays(fit_res.parameters)
-            if not ndarrays or len(ndarrays) == 0 or len(ndarrays[0]) == 0:
-                logging.warning(f"客户端 {client} 返回空参数")
+            cid, data = self._result_update(client, fit_res)
+            if cid is None:
                 continue
-            cid = ndarrays[0].tobytes().decode('utf-8')
-            if not cid:
-                logging.warning(f"客户端 {client} 返回无效CID")
-                continue
-            cids.append(cid)
-
-        models = []
-        for i, cid in enumerate(cids):
+            if data is not None:
+                inline[cid] = data
+            weights[cid] = weights.get(cid, 0) + fit_res.num_examples
+            self.latency.observe_throughput(client.cid, fit_res.metrics.get("samples_per_sec"))
+            accounts.setdefault(cid, [])
+            if fit_res.metrics.get("account"):
+                accounts[cid].append(fit_res.metrics["account"])
+                self._accounts[client.cid] = fit_res.metrics["account"]
+        pins = self._pin_inline(inline)
+        for cid in self._await_commitments(server_round, inline, accounts, server_round):
+            del weights[cid], inline[cid]
+
+        aggregator = self._aggregator
+        base_cid = None
+        if self.update_codec != "none" or self.aggregation != "fedavg":
+            # 增量编码与鲁棒聚合都以本轮下发的全局模型为基准
+            base_cid = self._global_cid(server_round - 1)
             try:
-                model_bytes = self.ipfs_utils.download_model(cid)
-                buffer = io.BytesIO(model_bytes)
-                state_dict = torch.load(buffer, map_location=self.device)
-                model = self.model_class().to(self.device)
-                model.load_state_dict(state_dict)
-                models.append(model)
-                logging.info(f"加载客户端模型，CID={cid}")
+                aggregator.reset(base=self.ipfs_utils.load_state_dict(base_cid, map_location=self.device))
             except Exception as e:
-                logging.error(f"下载或加载CID {cid} 的模型失败: {e}")
-                continue
+                logging.error(f"加载基准全局模型 {base_cid} 失败: {e}")
+                return None, {}
+        else:
+            aggregator.reset()
+        contributed = []
+        # 并发下载与反序列化，按完成顺序流式累加，累加后立即释放该更新
+        for cid, state_dict in self._fetch_updates(list(weights), inline):
+            try:
+                if is_encoded(state_dict):
+                    if state_dict["base_cid"] != base_cid:
+                        raise ValueError(f"增量基准 {state_dict['base_cid']} 与本轮全局模型 {base_cid} 不一致")
+                    aggregator.add_encoded(state_dict, weight=weights[cid])
+                else:
+                    aggregator.add(state_dict, weight=weights[cid])
+                contributed.append(cid)
+                logging.info(f"累加客户端模型，CID={cid}，权重={weights[cid]}")
+            except Exception as e:
+                logging.error(f"累加CID {cid} 的模型失败: {e}")
+            finally:
+                del state_dict
 
-        if not models:
+        if aggregator.num_updates == 0:
             logging.error("无有效模型可聚合")
             return None, {}
 
-        global_model = self.model_class().to(self.device)
-        with torch.no_grad():
-            for param in global_model.parameters():
-                param.data.zero_()
-            for model in models:
-                for global_param, client_param in zip(global_model.parameters(), model.parameters()):
-                    global_param.data += client_param.data / len(models)
-
-        new_cid = self.ipfs_utils.upload_model(global_model)
+        self._commit_updates(server_round, [(account, cid) for cid in contributed for account in accounts[cid]])
+        unattributed = {cid for cid in contributed if not accounts[cid]}
+        if unattributed and self.update_commit == "merkle":
+            logging.warning(f"{len(unattributed)} 个更新未报告训练者账户，未计入 Merkle 根")
+        self._await_pins(pins)
+        new_cid = self._commit_global(server_round, aggregator)
         if not new_cid:
-            logging.error("上传全局模型到IPFS失败")
+            return None, {}
+        # 本轮各客户端本地训练吞吐之和（样本/秒）
+        samples_per_sec = sum(fit_res.metrics.get("samples_per_sec", 0.0) for _, fit_res in results)
+        return fl.common.ndarrays_to_parameters([new_cid.encode('utf-8')]), {"num_updates": aggregator.num_updates,
+                                                                             "samples_per_sec": samples_per_sec}
+
+    @telemetry.traced("server.aggregate_buffered")
+    def aggregate_buffered(self, version, results, failures):
+        """异步模式下聚合缓冲区中的更新并提交第 version 次全局模型
+
+        每个更新相对其训练起点（客户端在指标 base_round 中报告）的全局模型计算增量，
+        按 样本数 × s(陈旧度) 加权平均后叠加到当前全局模型上（FedBuff）。
+        """
+        if not results:
+            return None, {}
+        current_cid = self._global_cid(version - 1)
+        try:
+            current_state = self.ipfs_utils.load_state_dict(current_cid, map_location=self.device)
+        except Exception as e:
+            logging.error(f"加载当前全局模型 {current_cid} 失败: {e}")
             return None, {}
 
-        self.blockchain_utils.submit_global_model(server_round, new_cid)
-        logging.info(f"上传全局模型，CID={new_cid}")
+        # CID -> (权重, 训练起点轮次)
+        entries = {}
+        accounts = {}
+        inline = {}
+        stalenesses = []
+        first_round = version
+        for client, fit_res in results:
+            cid, data = self._result_update(client, fit_res)
+            if cid is None:
+                continue
+            if data is not None:
+                inline[cid] = data
+                first_round = min(first_round, int(fit_res.metrics.get("commit_round", version)))
+            if fit_res.metrics.get("account"):
+                accounts.setdefault(cid, []).append(fit_res.metrics["account"])
+                self._accounts[client.cid] = fit_res.metrics["account"]
+            self.latency.observe_throughput(client.cid, fit_res.metrics.get("samples_per_sec"))
+            base_round = int(fit_res.metrics.get("base_round", version - 1))
+            staleness = version - 1 - base_round
+            weight = fit_res.num_examples * staleness_weight(staleness, self.staleness, self.staleness_a,
+                                                             self.staleness_b)
+            entries[cid] = (entries.get(cid, (0, base_round))[0] + weight, base_round)
+            stalenesses.append(staleness)
+        pins = self._pin_inline(inline)
+        for cid in self._await_commitments(version, inline, accounts, first_round):
+            del entries[cid], inline[cid]
+
+        aggregator = self._aggregator
+        aggregator.reset(base=current_state)
+        bases = {version - 1: current_state}
+        committed = []
+        for cid, state_dict in self._fetch_updates(list(entries), inline):
+            weight, base_round = entries[cid]
+            try:
+                if is_encoded(state_dict):
+                    if state_dict["base_cid"] != self._global_cid(base_round):
+                        raise ValueError(f"增量基准 {state_dict['base_cid']} 与轮次 {base_round} 的全局模型不一致")
+                    aggregator.add_encoded(state_dict, weight=weight)
+                else:
+                    if base_round not in bases:
+                        bases[base_round] = self.ipfs_utils.load_state_dict(self._global_cid(base_round),
+                                                                            map_location=self.device)
+                    aggregator.add(state_dict, weight=weight, base=bases[base_round])
+                committed += [(account, cid) for account in accounts.get(cid, [])]
+                logging.info(f"累加客户端模型，CID={cid}，陈旧度={version - 1 - base_round}，权重={weight:.2f}")
+            except Exception as e:
+                logging.error(f"累加CID {cid} 的模型失败: {e}")
+            finally:
+                del state_dict
 
-        return fl.common.ndarrays_to_parameters([new_cid.encode('utf-8')]), {}
+        if aggregator.num_updates == 0:
+            logging.error("无有效模型可聚合")
+            return None, {}
+        self._commit_updates(version, committed)
+        self._await_pins(pins)
+        new_cid = self._commit_global(version, aggregator)
+        if not new_cid:
+            return None, {}
+        metrics = {"num_updates": aggregator.num_updates, "max_staleness": max(stalenesses, default=0)}
+        return fl.common.ndarrays_to_parameters([new_cid.encode('utf-8')]), metrics
 
     def configure_evaluate(self, server_round, parameters, client_manager):
         return []
@@ -101,47 +509,40 @@ class BCFLStrategy(fl.server.strategy.Strategy):
         return None, {}
 
     def evaluate(self, server_round: int, parameters: Parameters) -> Optional[Tuple[float, Dict[str, Scalar]]]:
+        # Flower 在每轮聚合之后调用 evaluate，此时写出本轮的 trace；后台评估的 span 落在下一轮的文件中
+        telemetry.flush_trace(f"server-round-{server_round:04d}")
         # Check if parameters contain tensors
         if not parameters.tensors:
             logging.info(f"Server Round {server_round} - No parameters provided for evaluation")
-            return None, {}
+            return None
 
         # Convert Parameters to list of numpy.ndarray
         ndarrays = fl.common.parameters_to_ndarrays(parameters)
         if not ndarrays:
             logging.info(f"Server Round {server_round} - Empty ndarray list after conversion")
-            return None, {}
+            return None
 
         # Extract CID: convert ndarray to bytes, then decode to string
-        cid_bytes = ndarrays[0].tobytes()  # Convert numpy.ndarray to bytes
-        cid = cid_bytes.decode('utf-8')    # Decode bytes to string
+        cid = ndarrays[0].tobytes().decode('utf-8')
 
-        try:
-            # Download the model from IPFS using the CID
-            self.ipfs_utils.download_model(cid, "global_model_eval.pth")
-            # Load the model
-            model = load_model("global_model_eval.pth", model_class=self.model_class, map_location=self.device).to(self.device)
-            model.eval()
+        # aggregate_fit 刚产生的全局模型直接复用，否则（如恢复运行）从IPFS加载
+        latest = self._latest_global
+        model = latest[1] if latest is not None and latest[0] == cid else None
 
-            # Define loss function
-            criterion = torch.nn.CrossEntropyLoss()
-            total_loss = 0.0
-            correct = 0
-            total = 0
-
-            # Evaluate the model
-            with torch.no_grad():
-                for data, target in self.testloader:
-                    data, target = data.to(self.device), target.to(self.device)
-                    outputs = model(data)
-                    total_loss += criterion(outputs, target).item()
-                    _, predicted = torch.max(outputs.data, 1)
-                    total += target.size(0)
-                    correct += (predicted == target).sum().item()
-
-            # Calculate average loss and accuracy
-            avg_loss = total_loss / len(self.testloader)
-            accuracy = correct / total
+        if not self.async_evaluate:
+            return self._evaluate_global(server_round, cid, model)
+        with self._eval_lock:
+            self._eval_futures[server_round] = self._eval_executor.submit(self._evaluate_global, server_round, cid, model)
+        # 返回 None 时 Flower 不记录集中评估结果，实际结果由 collect_evaluations 补入 History
+        return None
+
+    @telemetry.traced("server.evaluate")
+    def _evaluate_global(self, server_round, cid, model=None):
+        try:
+            if model is None:
+                model = self.model_class().to(self.device)
+                model.load_state_dict(self.ipfs_utils.load_state_dict(cid, map_location=self.device))
+            avg_loss, accuracy = evaluate_models([model], self.testloader, self.device)[0]
 
             # Log results
             logging.info(f"Server Round {server_round} - Loss: {avg_loss:.4f}, Accuracy: {accuracy:.4f}")
@@ -149,7 +550,38 @@ class BCFLStrategy(fl.server.strategy.Strategy):
 
         except Exception as e:
             logging.error(f"Failed to evaluate global model: {e}")
-            return None, {}
+            return None
+
+    def collect_evaluations(self, history=None, wait=True):
+        """收集后台评估结果，写入 history 并返回 {轮次: (loss, metrics)}
+
+        wait=False 时只收集已经完成的评估；已收集的轮次不会重复写入。
+        """
+        with self._eval_lock:
+            rounds = sorted(self._eval_futures)
+        collected = {}
+        for server_round in rounds:
+            with self._eval_lock:
+                future = self._eval_futures.get(server_round)
+            if future is None or (not wait and not future.done()):
+                continue
+            result = future.result()
+            with self._eval_lock:
+                self._eval_futures.pop(server_round, None)
+            if result is None:
+                continue
+            loss, metrics = result
+            collected[server_round] = result
+            if history is not None:
+                history.add_loss_centralized(server_round=server_round, loss=loss)
+                history.add_metrics_centralized(server_round=server_round, metrics=metrics)
+        return collected
+
+    def shutdown(self):
+        """等待未完成的评估结束并关闭后台线程"""
+        if self._eval_executor is not None:
+            self._eval_executor.shutdown(wait=True)
+        telemetry.flush_trace("server-final")
 
 def load_abi(path="build/contracts/BCFL.json"):
     try:
@@ -171,35 +603,29 @@ def get_genesis_cid(path, ipfs_utils):
     return cid
 
 def is_task_initialized(blockchain_utils):
-    return blockchain_utils.contract.functions.task().call()[4]
+    return blockchain_utils.get_task()[4]
 
 def initialize_task(blockchain_utils, cid, rounds, trainers):
-    accounts = blockchain_utils.web3.eth.accounts
     if is_task_initialized(blockchain_utils):
         print("任务已初始化，无需重复操作")
         return
-    tx = blockchain_utils.contract.functions.initialize(cid, rounds, trainers).transact({'from': accounts[0]})
-    blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
+    blockchain_utils.transact(blockchain_utils.contract.functions.initialize(cid, rounds, trainers))
     print(f"任务已初始化：CID={cid}, 总轮次={rounds}, 训练者数量={trainers}")
 
 def advance_to_next_round(blockchain_utils, round_num, cid):
-    accounts = blockchain_utils.web3.eth.accounts
-    current_round = blockchain_utils.contract.functions.currentRound().call()
+    current_round = blockchain_utils.get_current_round()
     if current_round > round_num:
         print(f"当前轮次已是 {current_round}，无需推进到 {round_num + 1}")
         return
-    tx = blockchain_utils.contract.functions.submitGlobalModel(round_num, cid).transact({'from': accounts[0]})
-    blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
+    blockchain_utils.transact(blockchain_utils.contract.functions.submitGlobalModel(round_num, cid))
     print(f"已推进到轮次 {round_num + 1}")
 
 def select_trainers_for_round(blockchain_utils, round_num, trainer_addresses):
-    accounts = blockchain_utils.web3.eth.accounts
-    current_round = blockchain_utils.contract.functions.currentRound().call()
+    current_round = blockchain_utils.get_current_round()
     if current_round != round_num:
         print(f"错误：当前轮次为 {current_round}，无法为轮次 {round_num} 选择训练者")
         return
-    tx = blockchain_utils.contract.functions.selectTrainersForRound(round_num, trainer_addresses).transact({'from': accounts[0]})
-    blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
+    blockchain_utils.transact(blockchain_utils.contract.functions.selectTrainersForRound(round_num, trainer_addresses))
     print(f"已为轮次 {round_num} 选择训练者")
 
 def run_server(url, addr, abi, rounds, clients, model_class):
@@ -222,11 +648,14 @@ def run_server(url, addr, abi, rounds, clients, model_class):
     select_trainers_for_round(blockchain_utils, 1, trainer_addresses)
 
     strategy = BCFLStrategy(blockchain_utils, ipfs_utils, model_class=model_class)
-    fl.server.start_server(
+    history = fl.server.start_server(
         server_address="localhost:8081",
         config=fl.server.ServerConfig(num_rounds=rounds),
         strategy=strategy
     )
+    strategy.collect_evaluations(history)
+    strategy.shutdown()
+    return history
 
 def main():
     parser = argparse.ArgumentParser(description="区块链联邦学习服务器")
@@ -1,7 +1,10 @@
 import flwr as fl
-from blockchain_utils import BlockchainUtils
+from blockchain_utils import BlockchainUtils, abi_drift
 from ipfs_utils import IPFSUtils
 from server import BCFLStrategy
+from async_server import BufferedAsyncServer
+from deadline_server import DeadlineServer
+import telemetry
 import argparse
 import os
 import json
@@ -17,10 +20,15 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - Server - %(message
 def load_abi(path="build/contracts/BCFL.json"):
     try:
         with open(path, "r") as f:
-            return json.load(f)["abi"]
+            abi = json.load(f)["abi"]
     except FileNotFoundError:
         print(f"错误：找不到 {path} 文件，请先编译并部署合约。")
         exit(1)
+    drift = abi_drift(abi)
+    if drift:
+        print(f"警告：{path} 与 contracts/BCFL.sol 不一致，缺少 {', '.join(drift)}；"
+              f"请运行 truffle compile 重新编译并部署，否则只能使用旧接口")
+    return abi
 
 def get_genesis_cid(path, ipfs_utils):
     if not os.path.exists(path):
@@ -34,39 +42,58 @@ def get_genesis_cid(path, ipfs_utils):
     return cid
 
 def is_task_initialized(blockchain_utils):
-    return blockchain_utils.contract.functions.task().call()[4]
+    return blockchain_utils.get_task()[4]
 
 def initialize_task(blockchain_utils, cid, rounds, trainers):
-    accounts = blockchain_utils.web3.eth.accounts
     if is_task_initialized(blockchain_utils):
         print("任务已初始化，无需重复操作")
         return
-    tx = blockchain_utils.contract.functions.initialize(cid, rounds, trainers).transact({'from': accounts[0]})
-    blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
+    blockchain_utils.transact(blockchain_utils.contract.functions.initialize(cid, rounds, trainers))
     print(f"任务已初始化：CID={cid}, 总轮次={rounds}, 训练者数量={trainers}")
 
 def advance_to_next_round(blockchain_utils, round_num, cid):
-    accounts = blockchain_utils.web3.eth.accounts
-    current_round = blockchain_utils.contract.functions.getCurrentRound().call()
+    current_round = blockchain_utils.get_current_round()
     if current_round > round_num:
         print(f"当前轮次已是 {current_round}，无需推进到 {round_num + 1}")
         return
-    tx = blockchain_utils.contract.functions.submitGlobalModel(round_num, cid).transact({'from': accounts[0]})
-    blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
+    blockchain_utils.transact(blockchain_utils.contract.functions.submitGlobalModel(round_num, cid))
     print(f"已推进到轮次 {round_num + 1}")
 
 def select_trainers_for_round(blockchain_utils, round_num, trainer_addresses):
-    accounts = blockchain_utils.web3.eth.accounts
-    current_round = blockchain_utils.contract.functions.getCurrentRound().call()
+    current_round = blockchain_utils.get_current_round()
     if current_round != round_num:
         print(f"错误：当前轮次为 {current_round}，无法为轮次 {round_num} 选择训练者")
         return
-    tx = blockchain_utils.contract.functions.selectTrainersForRound(round_num, trainer_addresses).transact({'from': accounts[0]})
-    blockchain_utils.web3.eth.wait_for_transaction_receipt(tx)
+    blockchain_utils.transact(blockchain_utils.contract.functions.selectTrainersForRound(round_num, trainer_addresses))
     print(f"已为轮次 {round_num} 选择训练者")
 
-def run_server(url, addr, abi, rounds, clients, model_class):
-    blockchain_utils = BlockchainUtils(url, addr, abi)
+def read_resume_state(blockchain_utils):
+    """读取链上的恢复点 (下一轮次, 上一轮全局模型CID, 总轮次, 训练者数量)，任务未初始化时返回 None"""
+    if not is_task_initialized(blockchain_utils):
+        return None
+    _, _, total_rounds, trainer_count, _ = blockchain_utils.get_task()
+    start_round = blockchain_utils.get_current_round()
+    cid = blockchain_utils.get_global_model_cid(start_round - 1) if start_round <= total_rounds else None
+    return start_round, cid, total_rounds, trainer_count
+
+def run_server(url, addr, abi, rounds, clients, model_class, use_indexer=False, async_buffer=0, staleness="polynomial",
+               over_selection=1.0, round_deadline=None, min_results=None, aggregation="fedavg", clip_norm=None,
+               trim_ratio=0.1, num_byzantine=0, aggregation_workers=0, trace_dir=None, metrics_port=None,
+               metrics_host="127.0.0.1", training=None, lr_decay=1.0, cid_encoding="string", update_commit="transaction", resume=False,
+               transport="ipfs", inline_max_bytes=4 * 1024 * 1024):
+    """async_buffer > 0 时使用异步缓冲聚合，每攒满 async_buffer 个更新提交一次全局模型；
+    否则按同步轮次训练，每轮超额选择 over_selection 倍的客户端，
+    收到 min_results 个结果或到达 round_deadline 秒后结束本轮；
+    trace_dir / metrics_port 开启埋点（见 telemetry），按轮次写出 Chrome trace 并在 metrics_host 上提供 Prometheus 端点；
+    training 为下发给客户端的本地训练超参数（见 training.DEFAULT_TRAINING）；
+    cid_encoding="bytes32" 时全局模型CID以32字节摘要上链，update_commit="merkle" 时每轮以一笔交易提交更新的 Merkle 根；
+    resume 时从链上的 currentRound 与最新全局模型继续，不重新上传初始模型、不重复初始化交易，
+    总轮次与训练者数量以链上任务为准；
+    transport="inline" 时不超过 inline_max_bytes 字节的客户端更新随结果直接发送，IPFS上传与上链在客户端后台完成"""
+    if trace_dir is not None or metrics_port is not None:
+        telemetry.enable(trace_dir=trace_dir, metrics_port=metrics_port, metrics_host=metrics_host,
+                         process_name="server")
+    blockchain_utils = BlockchainUtils(url, addr, abi, use_indexer=use_indexer, cid_encoding=cid_encoding)
     ipfs_utils = IPFSUtils()
 
     w3 = Web3(Web3.HTTPProvider(url))
@@ -77,19 +104,58 @@ def run_server(url, addr, abi, rounds, clients, model_class):
         print(f"错误：在 {addr} 未找到已部署的合约")
         exit(1)
 
-    genesis_cid = get_genesis_cid(DEFAULT_PATH, ipfs_utils)
-    initialize_task(blockchain_utils, genesis_cid, rounds, clients)
-    advance_to_next_round(blockchain_utils, 0, genesis_cid)
-
-    trainer_addresses = w3.eth.accounts[1:clients+1]
-    select_trainers_for_round(blockchain_utils, 1, trainer_addresses)
-
-    strategy = BCFLStrategy(blockchain_utils, ipfs_utils, model_class=model_class)
-    fl.server.start_server(
+    start_round, resume_cid = 1, None
+    resume_state = read_resume_state(blockchain_utils) if resume else None
+    if resume_state is not None:
+        start_round, resume_cid, total_rounds, trainer_count = resume_state
+        if start_round > total_rounds:
+            print(f"链上任务的 {total_rounds} 轮已全部完成，无需恢复")
+            return None
+        if not resume_cid:
+            print(f"错误：链上没有轮次 {start_round - 1} 的全局模型，无法恢复")
+            exit(1)
+        if (rounds, clients) != (total_rounds, trainer_count):
+            logging.warning(f"按链上任务恢复：总轮次 {total_rounds}，训练者数量 {trainer_count}")
+        rounds, clients = total_rounds, trainer_count
+        print(f"从链上状态恢复：第 {start_round} 轮，全局模型 CID={resume_cid}")
+    else:
+        if resume:
+            print("链上任务尚未初始化，按新任务启动")
+        if is_task_initialized(blockchain_utils):
+            # 任务已在链上初始化，初始模型无需再次上传
+            genesis_cid = blockchain_utils.get_task()[1]
+        else:
+            genesis_cid = get_genesis_cid(DEFAULT_PATH, ipfs_utils)
+        initialize_task(blockchain_utils, genesis_cid, rounds, clients)
+        advance_to_next_round(blockchain_utils, 0, genesis_cid)
+
+        trainer_addresses = w3.eth.accounts[1:clients+1]
+        select_trainers_for_round(blockchain_utils, 1, trainer_addresses)
+
+    strategy = BCFLStrategy(blockchain_utils, ipfs_utils, model_class=model_class, staleness=staleness,
+                            over_selection=over_selection, straggler_wait=round_deadline, aggregation=aggregation,
+                            clip_norm=clip_norm, trim_ratio=trim_ratio, num_byzantine=num_byzantine,
+                            aggregation_workers=aggregation_workers,
+                            training=training, lr_decay=lr_decay, update_commit=update_commit,
+                            transport=transport, inline_max_bytes=inline_max_bytes)
+    if resume_cid is not None:
+        strategy.resume(start_round - 1, resume_cid)
+    if async_buffer > 0:
+        server = BufferedAsyncServer(client_manager=fl.server.SimpleClientManager(), strategy=strategy,
+                                     buffer_size=async_buffer, start_version=start_round)
+    else:
+        server = DeadlineServer(client_manager=fl.server.SimpleClientManager(), strategy=strategy,
+                                round_deadline=round_deadline, min_results=min_results, start_round=start_round)
+    history = fl.server.start_server(
         server_address="localhost:8081",
+        server=server,
         config=fl.server.ServerConfig(num_rounds=rounds),
         strategy=strategy
     )
+    # 后台评估的结果在训练结束后补入 History
+    strategy.collect_evaluations(history)
+    strategy.shutdown()
+    return history
 
 def main():
     parser = argparse.ArgumentParser(description="区块链联邦学习服务器")
@@ -98,11 +164,54 @@ def main():
     parser.add_argument("--url", type=str, default=DEFAULT_URL, help="区块链节点URL")
     parser.add_argument("--addr", type=str, default=DEFAULT_ADDR, help="智能合约地址")
     parser.add_argument("--path", type=str, default=DEFAULT_PATH, help="初始模型路径")
+    parser.add_argument("--use_indexer", action="store_true", help="通过本地事件索引读取合约状态")
+    parser.add_argument("--async_buffer", type=int, default=0, help="异步缓冲聚合的缓冲区大小，0 表示同步轮次")
+    parser.add_argument("--staleness", type=str, default="polynomial", choices=["constant", "polynomial", "hinge"],
+                        help="异步聚合中陈旧更新的降权函数")
+    parser.add_argument("--over_selection", type=float, default=1.0, help="每轮下发任务的客户端数相对训练者数量的倍数")
+    parser.add_argument("--round_deadline", type=float, default=None, help="每轮的截止时间（秒），到时只聚合已收到的结果")
+    parser.add_argument("--min_results", type=int, default=None, help="收到该数量的结果后立即结束本轮，默认为训练者数量")
+    parser.add_argument("--aggregation", type=str, default="fedavg",
+                        choices=["fedavg", "mean", "median", "trimmed_mean", "krum", "multi_krum"], help="聚合规则")
+    parser.add_argument("--clip_norm", type=float, default=None, help="鲁棒聚合前将每个增量的L2范数裁剪到该值")
+    parser.add_argument("--trim_ratio", type=float, default=0.1, help="trimmed_mean 两端各去掉的比例")
+    parser.add_argument("--num_byzantine", type=int, default=0, help="Krum 假定的恶意训练者数量")
+    parser.add_argument("--aggregation_workers", type=int, default=0, help="鲁棒聚合按块并行的进程数，0 表示在主进程中计算")
+    parser.add_argument("--trace_dir", type=str, default=None, help="按轮次写出 Chrome trace 文件的目录")
+    parser.add_argument("--metrics_port", type=int, default=None, help="Prometheus 指标端点的端口")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1", help="Prometheus 指标端点监听的地址，默认只接受本机连接，0.0.0.0 表示所有网卡")
+    parser.add_argument("--local_epochs", type=int, default=2, help="客户端每轮本地训练的epoch数")
+    parser.add_argument("--batch_size", type=int, default=32, help="客户端训练的批大小")
+    parser.add_argument("--grad_accum", type=int, default=1, help="梯度累积的批次数，有效批大小为 batch_size * grad_accum")
+    parser.add_argument("--optimizer", type=str, default="sgd", choices=["sgd", "adam", "adamw"], help="客户端优化器")
+    parser.add_argument("--lr", type=float, default=0.01, help="客户端学习率")
+    parser.add_argument("--momentum", type=float, default=0.0, help="SGD 动量")
+    parser.add_argument("--weight_decay", type=float, default=0.0, help="权重衰减")
+    parser.add_argument("--lr_schedule", type=str, default="constant", choices=["constant", "cosine", "exponential"],
+                        help="客户端轮内学习率调度")
+    parser.add_argument("--lr_decay", type=float, default=1.0, help="每轮学习率相对上一轮的倍数")
+    parser.add_argument("--compact_cids", action="store_true", help="全局模型CID以 bytes32 摘要上链（需重新编译部署合约）")
+    parser.add_argument("--update_commit", type=str, default="transaction", choices=["transaction", "merkle"],
+                        help="客户端更新的上链方式：每个客户端一笔交易，或服务器每轮提交一个 Merkle 根")
+    parser.add_argument("--resume", action="store_true", help="崩溃或停止后从链上的当前轮次与最新全局模型继续训练")
+    parser.add_argument("--transport", type=str, default="ipfs", choices=["ipfs", "inline"],
+                        help="客户端更新的传输方式：上传IPFS后只回传CID，或小于上限的更新随结果直接发送")
+    parser.add_argument("--inline_max_bytes", type=int, default=4 * 1024 * 1024, help="内联发送的更新大小上限（字节）")
     args = parser.parse_args()
+    training = {"local_epochs": args.local_epochs, "batch_size": args.batch_size, "grad_accum": args.grad_accum,
+                "optimizer": args.optimizer, "lr": args.lr, "momentum": args.momentum,
+                "weight_decay": args.weight_decay, "lr_schedule": args.lr_schedule}
 
     from model import CNN
     abi = load_abi()
-    run_server(args.url, args.addr, abi, args.rounds, args.clients, model_class=CNN)
+    run_server(args.url, args.addr, abi, args.rounds, args.clients, model_class=CNN, use_indexer=args.use_indexer,
+               async_buffer=args.async_buffer, staleness=args.staleness, over_selection=args.over_selection,
+               round_deadline=args.round_deadline, min_results=args.min_results, aggregation=args.aggregation,
+               clip_norm=args.clip_norm, trim_ratio=args.trim_ratio, num_byzantine=args.num_byzantine,
+               aggregation_workers=args.aggregation_workers, trace_dir=args.trace_dir, metrics_port=args.metrics_port,
+               metrics_host=args.metrics_host, training=training, lr_decay=args.lr_decay, cid_encoding="bytes32" if args.compact_cids else "string",
+               update_commit=args.update_commit, resume=args.resume, transport=args.transport,
+               inline_max_bytes=args.inline_max_bytes)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
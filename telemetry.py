@@ -0,0 +1,299 @@
+"""轻量级埋点：span 计时、计数器、Prometheus 文本格式导出与按轮次写出的 Chrome trace
+
+默认关闭，此时 span() 返回共享的空上下文、count() 直接返回，开销只有一次布尔判断。
+enable() 之后每个 span 的耗时计入按名称区分的直方图（bcfl_span_duration_seconds），
+出错的 span 计入 bcfl_span_errors_total；指定 trace_dir 时同时记录 Chrome trace 事件，
+由 flush_trace() 写出为 chrome://tracing / Perfetto 可直接打开的 JSON 文件。
+一个进程承载多个客户端时（client_pool），各客户端在 trace_scope(cid) 中运行，
+flush_trace(label, scope=cid) 只写出该客户端线程记录的事件，进程级的事件在 scope 为空时写出。
+时间戳使用墙钟微秒，服务器与客户端各自写出的文件可以合并到同一时间轴上查看。
+未写出的 trace 事件最多保留 MAX_TRACE_EVENTS 个，超出时丢弃最早的事件并计入 bcfl_trace_events_dropped_total。
+指标端点默认只监听 127.0.0.1，需要从其他主机抓取时显式传入 metrics_host。
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+MAX_TRACE_EVENTS = 100000
+
+
+class _Registry:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+        self.counters = {}
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+        self.trace_dir = None
+        self.process_name = None
+        self.server = None
+
+    def record(self, name, start, elapsed, args, failed):
+        with self.lock:
+            entry = self.histograms.get(name)
+            if entry is None:
+                entry = self.histograms[name] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "max": 0.0}
+            for i, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    entry["buckets"][i] += 1
+                    break
+            entry["sum"] += elapsed
+            entry["count"] += 1
+            entry["max"] = max(entry["max"], elapsed)
+            if failed:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            if self.trace_dir is not None:
+                event = {"name": name, "cat": name.split(".", 1)[0], "ph": "X", "ts": start * 1e6,
+                         "dur": elapsed * 1e6, "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+                # 事件按记录线程的 trace_scope 归属，见 flush_trace；
+                # 归属者迟迟不写出（例如客户端已退出）时缓冲区已满，丢弃最早的事件
+                if len(self.events) == self.events.maxlen:
+                    key = ("trace_events_dropped", ())
+                    self.counters[key] = self.counters.get(key, 0) + 1
+                self.events.append((current_scope(), event))
+
+
+_registry = _Registry()
+_local = threading.local()
+
+
+class _Span:
+    __slots__ = ("name", "args", "_wall", "_start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        """补充 span 的属性（例如传输的字节数）"""
+        self.args.update(args)
+
+    def __enter__(self):
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _registry.record(self.name, self._wall, elapsed, self.args, exc_type is not None)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def enabled():
+    return _registry.enabled
+
+
+def enable(trace_dir=None, metrics_port=None, process_name=None, metrics_host="127.0.0.1"):
+    """开启埋点；trace_dir 非空时记录 Chrome trace，metrics_port 非空时在 metrics_host 上启动 Prometheus 端点"""
+    _registry.trace_dir = trace_dir
+    _registry.process_name = process_name
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    _registry.enabled = True
+    if metrics_port is not None and _registry.server is None:
+        _registry.server = start_metrics_server(metrics_port, metrics_host)
+
+
+def disable():
+    _registry.enabled = False
+    if _registry.server is not None:
+        _registry.server.shutdown()
+        _registry.server.server_close()
+        _registry.server = None
+
+
+def reset():
+    """清空已记录的直方图、计数器与未写出的 trace 事件"""
+    with _registry.lock:
+        _registry.histograms.clear()
+        _registry.errors.clear()
+        _registry.counters.clear()
+        _registry.events.clear()
+
+
+def current_scope():
+    """当前线程记录的 trace 事件所归属的 scope，未设置时为 None"""
+    return getattr(_local, "scope", None)
+
+
+@contextmanager
+def trace_scope(scope):
+    """把当前线程中记录的 trace 事件归属到 scope（例如客户端ID）"""
+    previous = current_scope()
+    _local.scope = scope
+    try:
+        yield
+    finally:
+        _local.scope = previous
+
+
+def scoped(fn, scope=None):
+    """返回在 scope（默认为调用时线程的 scope）中执行 fn 的包装，用于提交到其他线程的任务"""
+    scope = current_scope() if scope is None else scope
+    if scope is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with trace_scope(scope):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def span(name, **args):
+    """计时上下文：with telemetry.span("ipfs.download", cid=cid) as s: ...; s.set(bytes=n)"""
+    if not _registry.enabled:
+        return _NOOP
+    return _Span(name, args)
+
+
+def traced(name):
+    """把整个函数调用记录为名为 name 的 span"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _registry.enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    """计数器 bcfl_<name>_total 加 value，labels 为 Prometheus 标签"""
+    if not _registry.enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _registry.lock:
+        _registry.counters[key] = _registry.counters.get(key, 0) + value
+
+
+def snapshot():
+    """返回 {span: {count, errors, total_s, mean_s, max_s}}"""
+    with _registry.lock:
+        return {name: {"count": entry["count"], "errors": _registry.errors.get(name, 0), "total_s": entry["sum"],
+                       "mean_s": entry["sum"] / entry["count"], "max_s": entry["max"]}
+                for name, entry in _registry.histograms.items()}
+
+
+def _metric_name(name):
+    return "bcfl_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    """按 Prometheus 文本格式（0.0.4）导出全部直方图与计数器"""
+    lines = []
+    with _registry.lock:
+        if _registry.histograms:
+            lines.append("# HELP bcfl_span_duration_seconds Duration of instrumented phases.")
+            lines.append("# TYPE bcfl_span_duration_seconds histogram")
+            for name, entry in sorted(_registry.histograms.items()):
+                label = f'span="{_label_value(name)}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS, entry["buckets"]):
+                    cumulative += n
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    lines.append(f'bcfl_span_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+                lines.append(f"bcfl_span_duration_seconds_sum{{{label}}} {entry['sum']}")
+                lines.append(f"bcfl_span_duration_seconds_count{{{label}}} {entry['count']}")
+            lines.append("# HELP bcfl_span_errors_total Instrumented phases that raised.")
+            lines.append("# TYPE bcfl_span_errors_total counter")
+            for name in sorted(_registry.histograms):
+                lines.append(f'bcfl_span_errors_total{{span="{_label_value(name)}"}} {_registry.errors.get(name, 0)}')
+        declared = set()
+        for (name, labels), value in sorted(_registry.counters.items()):
+            metric = _metric_name(name) + "_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            label_text = ",".join(f'{key}="{_label_value(val)}"' for key, val in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def flush_trace(label, scope=None):
+    """把上次写出之后记录的 trace 事件写入 trace_dir/<label>.trace.json，返回文件路径
+
+    只写出归属于 scope 的事件（scope 为空时即未设置 trace_scope 的线程记录的事件），
+    其他 scope 的事件留给各自的归属者写出。未开启 trace 或没有新事件时返回 None。
+    """
+    if not _registry.enabled or _registry.trace_dir is None:
+        return None
+    with _registry.lock:
+        taken = [entry for entry in _registry.events if entry[0] == scope]
+        _registry.events = deque((entry for entry in _registry.events if entry[0] != scope),
+                                 maxlen=_registry.events.maxlen)
+    events = [event for _, event in taken]
+    if not events:
+        return None
+    if _registry.process_name:
+        events.insert(0, {"name": "process_name", "ph": "M", "pid": os.getpid(),
+                          "args": {"name": _registry.process_name}})
+    path = os.path.join(_registry.trace_dir, f"{label}.trace.json")
+    try:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    except OSError as e:
+        logging.error(f"写出 trace 文件 {path} 失败: {e}")
+        return None
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """在后台线程中提供 http://host:port/metrics，返回 HTTP 服务器对象
+
+    默认只接受本机连接；端点不做认证，host 为 0.0.0.0 时同一网络中的任何主机都能读取指标。
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logging.info(f"Prometheus 指标端点已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,200 @@
+"""扁平张量文件格式
+
+替代 torch.save 的 pickle 序列化，用于在IPFS上存储模型参数与编码后的增量更新：
+
+    MAGIC(8 字节) | 头部长度(uint64, 小端) | JSON 头部 | 填充 | 数据区
+
+JSON 头部包含对象树（张量以占位符表示，其余为 JSON 标量）以及每个张量的 dtype、
+shape、在数据区中的偏移和字节数；数据区为一整块连续内存，每个张量按 ALIGNMENT 字节对齐。
+读取时张量通过 torch.frombuffer 直接指向输入缓冲区或 mmap 映射，不做任何拷贝；
+解析过程不执行任何代码，因此可以安全地加载不可信训练者上传的内容。
+不带 MAGIC 的输入按旧的 .pth 格式读取（仅允许张量，weights_only=True），兼容已有的CID。
+"""
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import warnings
+
+import torch
+
+MAGIC = b"BCFLTNS1"
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sQ")
+_MAX_HEADER_BYTES = 64 * 1024 * 1024
+
+_DTYPES = {
+    "float64": torch.float64,
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "int64": torch.int64,
+    "int32": torch.int32,
+    "int16": torch.int16,
+    "int8": torch.int8,
+    "uint8": torch.uint8,
+    "bool": torch.bool,
+}
+_DTYPE_NAMES = {dtype: name for name, dtype in _DTYPES.items()}
+
+if sys.byteorder != "little":
+    raise ImportError("tensor_format 仅支持小端字节序的主机")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _build_header(obj):
+    """将对象树拆分为 JSON 头部与按顺序排列的张量列表"""
+    tensors = []
+    entries = []
+    offset = 0
+
+    def walk(node):
+        nonlocal offset
+        if isinstance(node, torch.Tensor):
+            tensor = node.detach().cpu().contiguous()
+            if tensor.dtype not in _DTYPE_NAMES:
+                raise TypeError(f"不支持的张量类型: {tensor.dtype}")
+            nbytes = tensor.numel() * tensor.element_size()
+            offset = _align(offset)
+            entries.append({
+                "dtype": _DTYPE_NAMES[tensor.dtype],
+                "shape": list(tensor.shape),
+                "offset": offset,
+                "nbytes": nbytes,
+            })
+            tensors.append(tensor)
+            offset += nbytes
+            return {"__tensor__": len(entries) - 1}
+        if isinstance(node, dict):
+            if not all(isinstance(key, str) for key in node):
+                raise TypeError("只支持以字符串为键的字典")
+            return {key: walk(value) for key, value in node.items()}
+        if isinstance(node, (list, tuple)):
+            return [walk(value) for value in node]
+        if node is None or isinstance(node, (bool, int, float, str)):
+            return node
+        raise TypeError(f"不支持序列化的类型: {type(node).__name__}")
+
+    tree = walk(obj)
+    header = json.dumps({"tree": tree, "tensors": entries}, separators=(",", ":")).encode("utf-8")
+    return header, tensors, entries, _align(offset)
+
+
+def _tensor_bytes(tensor):
+    if tensor.numel() == 0:
+        return b""
+    return tensor.reshape(-1).view(torch.uint8).numpy()
+
+
+def iter_chunks(obj):
+    """按顺序产出序列化后的各段字节，供流式写入文件或上传使用，不会拼出完整副本"""
+    header, tensors, entries, _ = _build_header(obj)
+    yield _PREFIX.pack(MAGIC, len(header))
+    yield header
+    position = _PREFIX.size + len(header)
+    data_start = _align(position)
+    yield b"\0" * (data_start - position)
+    position = 0
+    for tensor, entry in zip(tensors, entries):
+        yield b"\0" * (entry["offset"] - position)
+        yield _tensor_bytes(tensor)
+        position = entry["offset"] + entry["nbytes"]
+
+
+def dump(obj, target):
+    """将对象写入文件路径或可写的二进制文件对象"""
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, "wb") as f:
+            dump(obj, f)
+        return
+    for chunk in iter_chunks(obj):
+        target.write(chunk)
+
+
+def dumps(obj):
+    buffer = io.BytesIO()
+    dump(obj, buffer)
+    return buffer.getvalue()
+
+
+def is_flat(data):
+    """判断字节串（或其前缀）是否为扁平张量格式"""
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def _parse(buffer):
+    size = len(buffer)
+    if size < _PREFIX.size:
+        raise ValueError("数据过短，不是有效的扁平张量格式")
+    magic, header_len = _PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC or header_len > min(_MAX_HEADER_BYTES, size - _PREFIX.size):
+        raise ValueError("扁平张量格式头部无效")
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_len]).decode("utf-8"))
+    data_start = _align(_PREFIX.size + header_len)
+
+    tensors = []
+    with warnings.catch_warnings():
+        # 只读缓冲区（bytes / ACCESS_READ）会触发不可写警告，返回的张量按只读使用
+        warnings.simplefilter("ignore", UserWarning)
+        for entry in header["tensors"]:
+            dtype = _DTYPES[entry["dtype"]]
+            shape = [int(dim) for dim in entry["shape"]]
+            numel = 1
+            for dim in shape:
+                numel *= dim
+            start = data_start + int(entry["offset"])
+            itemsize = torch.empty((), dtype=dtype).element_size()
+            if entry["nbytes"] != numel * itemsize or start + entry["nbytes"] > size:
+                raise ValueError("扁平张量格式中的张量越界")
+            if numel == 0:
+                tensors.append(torch.empty(shape, dtype=dtype))
+                continue
+            tensors.append(torch.frombuffer(buffer, dtype=dtype, count=numel, offset=start).reshape(shape))
+
+    def build(node):
+        if isinstance(node, dict):
+            if set(node) == {"__tensor__"}:
+                return tensors[node["__tensor__"]]
+            return {key: build(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [build(value) for value in node]
+        return node
+
+    return build(header["tree"])
+
+
+def _move(obj, map_location):
+    if map_location is None:
+        return obj
+    if isinstance(obj, torch.Tensor):
+        return obj.to(map_location)
+    if isinstance(obj, dict):
+        return {key: _move(value, map_location) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_move(value, map_location) for value in obj]
+    return obj
+
+
+def loads(data, map_location=None):
+    """从字节串解析对象，张量零拷贝地指向 data；旧 .pth 格式回退到 torch.load"""
+    if not is_flat(data):
+        return torch.load(io.BytesIO(data), map_location=map_location, weights_only=True)
+    return _move(_parse(memoryview(data)), map_location)
+
+
+def load(path, map_location=None, use_mmap=True):
+    """从文件加载对象；use_mmap 时张量直接指向写时复制的内存映射，按需换入"""
+    with open(path, "rb") as f:
+        if not is_flat(f.read(len(MAGIC))):
+            f.seek(0)
+            return torch.load(f, map_location=map_location, weights_only=True)
+        f.seek(0)
+        if not use_mmap:
+            return _move(_parse(memoryview(f.read())), map_location)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return _move(_parse(mapped), map_location)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 仓库模块位于根目录，与 benchmarks/ 中的脚本一样直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def synthetic_data(tmp_path, monkeypatch):
+    """在临时目录中按 data.load_arrays 的缓存格式写入随机的类 MNIST 数组并切换到该目录，
+    策略与客户端按相对路径 data/ 读取（同 benchmarks/bench_rounds.py 的 --data synthetic）"""
+    from data import _cache_paths, _save_npy
+
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    for split, n in (("train", 400), ("test", 200)):
+        images_path, labels_path = _cache_paths("data", split)
+        os.makedirs(os.path.dirname(images_path), exist_ok=True)
+        _save_npy(rng.integers(0, 10, size=n, dtype=np.int64), labels_path)
+        _save_npy(rng.standard_normal((n, 1, 28, 28), dtype=np.float32), images_path)
+    return tmp_path
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from aggregation import StreamingFedAvg
+
+
+def state(value, batches=0):
+    return {"weight": torch.full((2, 3), float(value)), "bias": torch.tensor([value, -value], dtype=torch.float32),
+            "num_batches_tracked": torch.tensor(batches)}
+
+
+def test_weighted_average_matches_reference():
+    updates = [(state(1.0, 10), 1.0), (state(4.0, 20), 3.0), (state(-2.0, 31), 2.0)]
+    aggregator = StreamingFedAvg(state(0.0))
+    aggregator.reset()
+    for update, weight in updates:
+        aggregator.add(update, weight=weight)
+    result = aggregator.result()
+    total = sum(weight for _, weight in updates)
+    for name in ("weight", "bias"):
+        expected = sum(update[name] * weight for update, weight in updates) / total
+        assert torch.allclose(result[name], expected)
+    assert result["num_batches_tracked"].dtype == torch.int64
+    assert result["num_batches_tracked"].item() == round((10 * 1 + 20 * 3 + 31 * 2) / total)
+
+
+def test_reset_reuses_buffer_and_delta_mode_adds_to_base():
+    aggregator = StreamingFedAvg(state(0.0))
+    aggregator.reset()
+    aggregator.add(state(100.0))
+    aggregator.reset(base=state(1.0))
+    aggregator.add(state(2.0), weight=1.0)
+    # 相对陈旧基准的增量：3 - 0 = 3，叠加到当前基准 1 上
+    aggregator.add(state(3.0), weight=1.0, base=state(0.0))
+    result = aggregator.result()
+    assert aggregator.num_updates == 2
+    assert torch.allclose(result["weight"], torch.full((2, 3), 1.0 + (1.0 + 3.0) / 2))
+
+
+def test_rejects_mismatched_updates_and_bad_weights():
+    aggregator = StreamingFedAvg(state(0.0))
+    aggregator.reset()
+    with pytest.raises(ValueError):
+        aggregator.add(state(1.0), weight=0)
+    with pytest.raises(KeyError):
+        aggregator.add({"weight": torch.zeros(2, 3)})
+    bad = state(1.0)
+    bad["bias"] = torch.zeros(3)
+    with pytest.raises(ValueError):
+        aggregator.add(bad)
+    with pytest.raises(RuntimeError):
+        aggregator.result()
+
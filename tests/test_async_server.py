@@ -0,0 +1,70 @@
+import flwr as fl
+from flwr.common import Code, Status, ndarrays_to_parameters
+from flwr.server.client_proxy import ClientProxy
+import numpy as np
+
+from async_server import BufferedAsyncServer
+
+
+class InstantClient(ClientProxy):
+    def fit(self, ins, timeout, group_id):
+        return fl.common.FitRes(Status(Code.OK, ""), ndarrays_to_parameters([np.frombuffer(b"QmUpdate", np.uint8)]),
+                                10, {})
+
+    def get_properties(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def get_parameters(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def evaluate(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def reconnect(self, ins, timeout, group_id):
+        return fl.common.DisconnectRes(reason="")
+
+
+class FailingStrategy(fl.server.strategy.FedAvg):
+    """聚合总是失败，例如IPFS节点不可用；前 successes 次聚合成功"""
+
+    def __init__(self, successes=0):
+        super().__init__(initial_parameters=ndarrays_to_parameters([]))
+        self.successes = successes
+        self.versions = []
+
+    def num_trainers(self):
+        return 2
+
+    def configure_async_fit(self, version, parameters, client):
+        return fl.common.FitIns(parameters, {"server_round": version})
+
+    def aggregate_buffered(self, version, results, failures):
+        self.versions.append(version)
+        if len(self.versions) <= self.successes:
+            return ndarrays_to_parameters([]), {}
+        return None, {}
+
+    def evaluate(self, server_round, parameters):
+        return None
+
+
+def run(strategy, num_rounds=5):
+    client_manager = fl.server.SimpleClientManager()
+    for cid in ("1", "2"):
+        client_manager.register(InstantClient(cid))
+    server = BufferedAsyncServer(client_manager=client_manager, strategy=strategy, buffer_size=2,
+                                 max_aggregation_failures=3)
+    server.set_max_workers(2)
+    server.fit(num_rounds=num_rounds, timeout=None)
+
+
+def test_consecutive_aggregation_failures_stop_the_run():
+    strategy = FailingStrategy()
+    run(strategy)
+    assert strategy.versions == [1, 1, 1]
+
+
+def test_successful_aggregation_resets_the_failure_count():
+    strategy = FailingStrategy(successes=2)
+    run(strategy)
+    assert strategy.versions == [1, 2, 3, 3, 3]
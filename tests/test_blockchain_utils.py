@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.fakes import DEFAULT_ARTIFACT, InProcessChain
+from blockchain_utils import abi_drift, abi_signatures, source_signatures
+
+
+class FakeEvent:
+    def __init__(self, logs):
+        self.logs = logs
+        self.calls = []
+
+    def get_logs(self, argument_filters=None, from_block=None, to_block=None):
+        self.calls.append((argument_filters, from_block))
+        if argument_filters is None:
+            return list(self.logs)
+        rounds = argument_filters["round"]
+        rounds = rounds if isinstance(rounds, list) else [rounds]
+        return [log for log in self.logs if log["args"]["round"] in rounds]
+
+
+def event_abi(name, indexed):
+    return {"type": "event", "name": name, "inputs": [
+        {"name": "trainer", "type": "address", "indexed": False},
+        {"name": "round", "type": "uint256", "indexed": indexed},
+        {"name": "digest", "type": "bytes32", "indexed": False}]}
+
+
+def test_deployment_block_is_found_and_cached():
+    chain = InProcessChain()
+    deployed = chain.web3.eth.block_number
+    for _ in range(5):
+        chain.web3.eth.send_transaction({"from": chain.accounts[1], "to": chain.accounts[2], "value": 1})
+    utils = chain.utils()
+    assert utils.deployment_block() == deployed
+    assert chain.utils(deployment_block=2).deployment_block() == 2
+
+
+def test_round_logs_uses_topic_filter_only_for_indexed_round():
+    chain = InProcessChain()
+    utils = chain.utils(deployment_block=7)
+    logs = [{"args": {"round": r}, "blockNumber": block, "logIndex": 0} for r, block in ((1, 10), (2, 9), (1, 8))]
+    for indexed in (True, False):
+        event = FakeEvent(logs)
+        utils.contract.abi = [event_abi("UpdateDigestSubmitted", indexed)]
+        utils.contract.events = type("Events", (), {"UpdateDigestSubmitted": event})()
+        result = utils._round_logs("UpdateDigestSubmitted", 1)
+        assert [log["blockNumber"] for log in result] == [8, 10]
+        assert event.calls == [({"round": 1} if indexed else None, 7)]
+
+
+def test_update_commitments_scan_only_new_blocks():
+    chain = InProcessChain()
+    server, alice, bob = chain.utils(0), chain.utils(1), chain.utils(2)
+    server.transact(server.contract.functions.initialize("QmGenesis", 3, 2))
+    server.submit_global_model(0, "QmGenesis")
+    alice.submit_update_cid(1, "QmAlice")
+    entries, next_block = server.get_update_commitments(1, 1)
+    assert entries == {(alice.account, "QmAlice")}
+    assert next_block == chain.web3.eth.block_number + 1
+    assert server.get_update_commitments(1, 1, next_block) == (set(), next_block)
+    bob.submit_update_cid(1, "QmBob")
+    assert server.get_update_commitments(1, 1, next_block)[0] == {(bob.account, "QmBob")}
+
+
+def test_update_commitments_filter_indexed_rounds_by_topic():
+    chain = InProcessChain()
+    utils = chain.utils(deployment_block=0)
+    logs = [{"args": {"trainer": "0x1", "round": r, "cid": f"Qm{r}"}, "blockNumber": 1, "logIndex": r}
+            for r in (1, 2, 3)]
+    event = FakeEvent(logs)
+    utils.contract.abi = [{"type": "event", "name": "UpdateSubmitted", "inputs": [
+        {"name": "trainer", "type": "address", "indexed": True},
+        {"name": "round", "type": "uint256", "indexed": True},
+        {"name": "cid", "type": "string", "indexed": False}]}]
+    utils.contract.events = type("Events", (), {"UpdateSubmitted": event})()
+    entries, _ = utils.get_update_commitments(2, 3, from_block=1)
+    assert entries == {("0x1", "Qm2"), ("0x1", "Qm3")}
+    assert event.calls == [({"round": [2, 3]}, 1)]
+
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "contracts", "BCFL.sol")
+
+
+def test_source_signatures_match_what_solc_would_export():
+    source = """
+        event UpdateSubmitted(address trainer, uint indexed round, string cid);
+        function submitScores(uint round, address[] calldata trainers, uint[] calldata scores) external onlyEvaluator {
+        function verifyUpdate(uint round, bytes32[] calldata proof)
+            external view returns (bool) {
+        function _updatesOf(RoundData storage data, address[] memory trainers) private view returns (
+    """
+    assert source_signatures(source) == {"UpdateSubmitted(address,uint256 indexed,string)",
+                                         "submitScores(uint256,address[],uint256[])",
+                                         "verifyUpdate(uint256,bytes32[])"}
+    abi = [event_abi("UpdateSubmitted", False), {"type": "function", "name": "submitScores", "inputs": [
+        {"type": "uint256"}, {"type": "address[]"}, {"type": "uint256[]"}]}]
+    assert "submitScores(uint256,address[],uint256[])" in abi_signatures(abi)
+
+
+def load_artifact_abi():
+    with open(DEFAULT_ARTIFACT) as f:
+        return json.load(f)["abi"]
+
+
+def test_drift_reports_functions_and_event_layouts_missing_from_the_artifact():
+    drift = abi_drift(load_artifact_abi(), SOURCE)
+    # 旧产物缺少紧凑模式的函数，round 也未被 indexed
+    assert "submitUpdateDigest(uint256,bytes32)" in drift
+    assert "UpdateSubmitted(address,uint256 indexed,string)" in drift
+    assert "submitUpdate(uint256,string)" not in drift
+    assert abi_drift(load_artifact_abi(), "missing.sol") == []
+
+
+@pytest.mark.xfail(strict=True, reason="build/contracts/BCFL.json 尚未用当前 contracts/BCFL.sol 重新编译（truffle compile）")
+def test_artifact_is_built_from_current_source():
+    # 重新编译后本用例通过，strict 使其报错，提醒删除 xfail 标记
+    assert abi_drift(load_artifact_abi(), SOURCE) == []
@@ -0,0 +1,71 @@
+import contextlib
+import io
+
+import flwr as fl
+from flwr.common import Code, Status
+import numpy as np
+import pytest
+import torch
+
+from aggregation import staleness_weight
+from benchmarks.fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain, InProcessClientProxy
+from model import CNN
+from server import BCFLStrategy
+from server_main import advance_to_next_round, initialize_task
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("constant", [1.0, 1.0, 1.0, 1.0]),
+    ("polynomial", [1.0, 2 ** -0.5, 5 ** -0.5, 6 ** -0.5]),
+    ("hinge", [1.0, 1.0, 1.0, 1 / (0.5 * 1 + 1)]),
+])
+def test_staleness_weight_modes(mode, expected):
+    assert [staleness_weight(tau, mode, a=0.5, b=4) for tau in (0, 1, 4, 5)] == pytest.approx(expected)
+    # 负的陈旧度（时钟或轮次回退）按 0 处理
+    assert staleness_weight(-3, mode) == 1.0
+
+
+def _model(state):
+    model = CNN()
+    model.load_state_dict(state)
+    return model
+
+
+def shifted(state, offset):
+    return {name: tensor + offset for name, tensor in state.items()}
+
+
+def fit_res(ipfs, state, num_examples, base_round):
+    cid = ipfs.upload_model(_model(state))
+    parameters = fl.common.ndarrays_to_parameters([np.frombuffer(cid.encode(), np.uint8)])
+    return fl.common.FitRes(Status(Code.OK, ""), parameters, num_examples, {"base_round": base_round})
+
+
+def test_stale_updates_are_down_weighted_against_their_own_base(synthetic_data):
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server_chain, ipfs = chain.utils(0), InMemoryIPFSUtils(store)
+    torch.manual_seed(0)
+    genesis_state = CNN().state_dict()
+    current_state = shifted(genesis_state, 1.0)
+    genesis, current = ipfs.upload_model(_model(genesis_state)), ipfs.upload_model(_model(current_state))
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_task(server_chain, genesis, 3, 2)
+        advance_to_next_round(server_chain, 0, genesis)
+    assert server_chain.submit_global_model(1, current)
+
+    strategy = BCFLStrategy(server_chain, ipfs, model_class=CNN, async_evaluate=False, staleness="polynomial")
+    # 账户 1 基于第 0 轮的模型训练（陈旧度 1），账户 2 基于当前模型训练（陈旧度 0）
+    stale, fresh = shifted(genesis_state, 0.5), shifted(current_state, -0.25)
+    results = [(InProcessClientProxy("1", None), fit_res(ipfs, stale, 10, 0)),
+               (InProcessClientProxy("2", None), fit_res(ipfs, fresh, 20, 1))]
+    parameters, metrics = strategy.aggregate_buffered(2, results, [])
+
+    assert metrics == {"num_updates": 2, "max_staleness": 1}
+    new_cid = fl.common.parameters_to_ndarrays(parameters)[0].tobytes().decode()
+    assert server_chain.get_global_model_cid(2) == new_cid
+    w_stale, w_fresh = 10 * 2 ** -0.5, 20.0
+    aggregated = ipfs.load_state_dict(new_cid)
+    for name, tensor in aggregated.items():
+        delta = (w_stale * (stale[name] - genesis_state[name]) + w_fresh * (fresh[name] - current_state[name]))
+        expected = current_state[name] + delta / (w_stale + w_fresh)
+        assert torch.allclose(tensor, expected, atol=1e-5)
@@ -0,0 +1,77 @@
+from benchmarks.fakes import InProcessChain
+from chain_indexer import ChainIndexer
+
+
+def setup_task():
+    chain = InProcessChain()
+    server, alice, bob, evaluator = (chain.utils(i) for i in range(4))
+    server.transact(server.contract.functions.initialize("QmGenesis", 3, 2))
+    server.transact(server.contract.functions.setEvaluator(evaluator.account))
+    server.submit_global_model(0, "QmGenesis")
+    alice.submit_update_cid(1, "QmAlice")
+    evaluator.submit_score(1, alice.account, 80)
+    return chain, server, alice, bob
+
+
+def test_sync_indexes_events_in_block_ranges(tmp_path):
+    chain, server, alice, _ = setup_task()
+    indexer = ChainIndexer(chain.web3, server.contract, db_path=str(tmp_path / "index.sqlite"), max_block_range=2)
+    assert indexer.sync() == 4
+    assert indexer.last_block() == chain.web3.eth.block_number
+    assert indexer.current_round() == server.contract.functions.getCurrentRound().call() == 1
+    assert indexer.global_model_cid(0) == "QmGenesis"
+    assert indexer.global_model_cid(1) == ""
+    assert indexer.update_cids(1) == {alice.account: "QmAlice"}
+    assert indexer.scores(1) == {alice.account: 80}
+    assert indexer.task()[1:] == ("QmGenesis", 3, 2, True)
+    # 当前合约不发出 TrainersSelected，选择结果需从合约读取
+    assert indexer.selected_trainers(1) is None
+    indexer.close()
+
+
+def test_incremental_sync_only_applies_new_events(tmp_path):
+    chain, server, alice, bob = setup_task()
+    db_path = str(tmp_path / "index.sqlite")
+    indexer = ChainIndexer(chain.web3, server.contract, db_path=db_path)
+    indexer.sync()
+    seen = []
+    indexer.add_listener("UpdateSubmitted", lambda args, log: seen.append((args["trainer"], args["cid"])))
+    assert indexer.sync(force=True) == 0
+    bob.submit_update_cid(1, "QmBob")
+    server.submit_global_model(1, "QmRound1")
+    assert indexer.sync(force=True) == 2
+    assert seen == [(bob.account, "QmBob")]
+    assert indexer.update_cids(1) == {alice.account: "QmAlice", bob.account: "QmBob"}
+    assert indexer.current_round() == server.contract.functions.getCurrentRound().call() == 2
+    assert indexer.global_model_cid(1) == "QmRound1"
+
+    # 同一库文件上的另一个索引器（如同一主机上的其他进程）从已同步的区块继续
+    other = ChainIndexer(chain.web3, server.contract, db_path=db_path)
+    assert other.sync() == 0
+    assert other.current_round() == 2
+    other.close()
+    indexer.close()
+
+
+def test_min_sync_interval_skips_reads_until_marked_dirty(tmp_path):
+    chain, server, _, bob = setup_task()
+    indexer = ChainIndexer(chain.web3, server.contract, db_path=str(tmp_path / "index.sqlite"),
+                           min_sync_interval=3600)
+    indexer.sync()
+    bob.submit_update_cid(1, "QmBob")
+    assert indexer.sync() == 0
+    indexer.mark_dirty()
+    assert indexer.sync() == 1
+    indexer.close()
+
+
+def test_blockchain_utils_reads_through_the_index(tmp_path):
+    chain, _, alice, _ = setup_task()
+    utils = chain.utils(0, use_indexer=True, index_path=str(tmp_path / "index.sqlite"))
+    assert utils.get_current_round() == 1
+    assert utils.get_update_cids(1) == {alice.account: "QmAlice"}
+    assert utils.get_scores(1) == {alice.account: 80}
+    utils.submit_global_model(1, "QmRound1")
+    # 本进程发送交易后，下一次读取前先同步
+    assert utils.get_current_round() == 2
+    assert utils.get_global_model_cid(1) == "QmRound1"
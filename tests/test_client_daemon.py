@@ -0,0 +1,38 @@
+import os
+import stat
+import threading
+
+from benchmarks.fakes import InProcessChain
+from client_daemon import ClientDaemon, ControlServer, request
+
+
+def test_control_socket_is_private_from_creation(tmp_path):
+    path = str(tmp_path / "daemon.sock")
+    before = os.umask(0o022)
+    try:
+        server = ControlServer(path, daemon=None)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(before)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert request(path, {"cmd": "unknown"})["ok"] is False
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_tasks_on_the_same_account_share_one_nonce_manager():
+    chain = InProcessChain()
+    daemon = object.__new__(ClientDaemon)
+    daemon._lock = threading.Lock()
+    daemon._pipelines = {}
+    first, second, other = chain.utils(1), chain.utils(1), chain.utils(2)
+    for utils in (first, second, other):
+        daemon._share_pipeline("memory", utils)
+    assert first.tx_pipeline is second.tx_pipeline
+    assert first.tx_pipeline is not other.tx_pipeline
+    nonces = [first.tx_pipeline.nonces.allocate(), second.tx_pipeline.nonces.allocate()]
+    assert nonces[1] == nonces[0] + 1
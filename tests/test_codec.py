@@ -0,0 +1,65 @@
+import pytest
+import torch
+
+from aggregation import StreamingFedAvg
+from codec import UpdateEncoder, decode_update, is_encoded
+
+
+@pytest.fixture
+def models():
+    torch.manual_seed(0)
+    base = {"weight": torch.randn(8, 16), "bias": torch.randn(16), "num_batches_tracked": torch.tensor(5)}
+    local = {"weight": base["weight"] + 0.01 * torch.randn(8, 16), "bias": base["bias"] + 0.01 * torch.randn(16),
+             "num_batches_tracked": torch.tensor(9)}
+    return base, local
+
+
+@pytest.mark.parametrize("codec, tolerance", [("fp16", 1e-3), ("int8", 2e-4)])
+def test_dense_codecs_round_trip(models, codec, tolerance):
+    base, local = models
+    payload = UpdateEncoder(codec).encode(local, base, "QmBase")
+    assert is_encoded(payload) and payload["base_cid"] == "QmBase"
+    decoded = decode_update(payload, base)
+    for name in ("weight", "bias"):
+        assert (decoded[name] - local[name]).abs().max().item() <= tolerance
+    assert decoded["num_batches_tracked"].item() == 9
+
+
+def test_topk_keeps_largest_and_feeds_back_the_rest(models):
+    base, local = models
+    encoder = UpdateEncoder("topk", topk_ratio=0.25)
+    payload = encoder.encode(local, base, "QmBase")
+    delta = (local["weight"] - base["weight"]).reshape(-1)
+    entry = payload["tensors"]["weight"]
+    assert entry["values"].numel() == delta.numel() // 4
+    assert entry["values"].abs().min() >= delta.abs().kthvalue(delta.numel() - delta.numel() // 4).values
+    sent = decode_update(payload, base)["weight"] - base["weight"]
+    # 两轮发送的增量之和加上残差等于两轮真实增量之和
+    second = encoder.encode(local, base, "QmBase")
+    sent = sent + (decode_update(second, base)["weight"] - base["weight"])
+    residual = encoder._residuals["weight"]
+    assert torch.allclose(sent + residual, 2 * (local["weight"] - base["weight"]), atol=1e-6)
+
+
+@pytest.mark.parametrize("codec", ["fp16", "int8", "topk"])
+def test_encoded_updates_aggregate_like_decoded_ones(models, codec):
+    base, local = models
+    payload = UpdateEncoder(codec, topk_ratio=0.5).encode(local, base, "QmBase")
+    encoded = StreamingFedAvg(base)
+    encoded.reset(base=base)
+    encoded.add_encoded(payload, weight=2.0)
+    decoded = StreamingFedAvg(base)
+    decoded.reset(base=base)
+    decoded.add(decode_update(payload, base), weight=2.0)
+    for name, tensor in encoded.result().items():
+        assert torch.allclose(tensor.float(), decoded.result()[name].float(), atol=1e-6)
+
+
+def test_switching_codec_clears_residuals(models):
+    base, local = models
+    encoder = UpdateEncoder("topk", topk_ratio=0.1)
+    encoder.encode(local, base, "QmBase")
+    encoder.configure("int8")
+    assert encoder._residuals == {}
+    with pytest.raises(ValueError):
+        encoder.configure("zip")
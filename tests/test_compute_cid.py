@@ -0,0 +1,59 @@
+import os
+import random
+
+import pytest
+
+from benchmarks.fakes import content_cid
+from ipfs_utils import IPFS_CHUNK_SIZE, IPFS_MAX_LINKS, compute_cid
+
+# `ipfs add`（默认参数）的输出
+KNOWN_CIDS = {
+    b"": "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH",
+    b"hello world\n": "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o",
+    b"Mary had a little lamb": "QmZfF6C9j4VtoCsTp4KSrhYH47QMd3DNXVZBKaxJdhaPab",
+}
+
+
+@pytest.mark.parametrize("data, cid", KNOWN_CIDS.items())
+def test_single_chunk_matches_ipfs_add(data, cid):
+    assert compute_cid(data) == cid
+    assert content_cid(data) == cid
+
+
+# kubo `ipfs add --only-hash`（默认参数）对 random.Random(size).randbytes(size) 的输出，
+# 覆盖多个分块、满 174 个链接的单层中间节点以及需要两层中间节点的情况
+KNOWN_MULTI_CHUNK_CIDS = {
+    IPFS_CHUNK_SIZE: "Qmbd9VNLTfpBW2arj1AkAJnVRYBq1WEY6Uu6wLEiemGipi",
+    IPFS_CHUNK_SIZE + 1: "QmdkAszdeWKht9nXSzPKGUYvUqpMfm325GuCn1pZnTa9ja",
+    3 * IPFS_CHUNK_SIZE - 7: "QmZDH6hDdURhfhQfV4f2bTQZ1gWzVEPxPxreZveAB7yB2o",
+    IPFS_MAX_LINKS * IPFS_CHUNK_SIZE: "QmNWRuH9CkAYPi3Gf99g1nB74Cw3y5NuPKohRs7KX2KsJz",
+    IPFS_MAX_LINKS * IPFS_CHUNK_SIZE + 1: "QmWvAUzQsaCFMPzTTFKwGmTmijHZ5aVRwJqGwrSHF89cuy",
+    (IPFS_MAX_LINKS + 3) * IPFS_CHUNK_SIZE + 5: "QmeQx3bmBMFxY798sZ64Cyk7XXZ6vNnq6TtJkFs7nsq8RF",
+}
+
+
+@pytest.mark.parametrize("size, cid", KNOWN_MULTI_CHUNK_CIDS.items())
+def test_multi_chunk_matches_ipfs_add(size, cid):
+    data = random.Random(size).randbytes(size)
+    assert compute_cid(data) == cid
+    assert content_cid(data) == cid
+
+
+@pytest.mark.parametrize("size", [
+    IPFS_CHUNK_SIZE,
+    IPFS_CHUNK_SIZE + 1,
+    3 * IPFS_CHUNK_SIZE - 7,
+    IPFS_MAX_LINKS * IPFS_CHUNK_SIZE,
+    IPFS_MAX_LINKS * IPFS_CHUNK_SIZE + 1,
+    (IPFS_MAX_LINKS + 3) * IPFS_CHUNK_SIZE + 5,
+])
+def test_multi_chunk_matches_reference_builder(size):
+    data = os.urandom(size)
+    assert compute_cid(data) == content_cid(data)
+
+
+def test_cid_depends_on_every_chunk():
+    data = bytearray(os.urandom(3 * IPFS_CHUNK_SIZE))
+    before = compute_cid(bytes(data))
+    data[-1] ^= 1
+    assert compute_cid(bytes(data)) != before
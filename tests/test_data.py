@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from data import dirichlet_partition, iid_partition, load_arrays, load_data, partition_indices
+
+LABELS = np.random.default_rng(0).integers(0, 10, size=2000)
+
+
+def assert_disjoint_and_covering(parts, num_samples):
+    merged = np.concatenate(parts)
+    assert len(merged) == num_samples
+    assert np.array_equal(np.sort(merged), np.arange(num_samples))
+    assert all(np.all(np.diff(part) > 0) for part in parts)
+
+
+@pytest.mark.parametrize("partition", ["iid", "dirichlet"])
+def test_partitions_are_disjoint_covering_and_deterministic(partition):
+    parts = partition_indices(LABELS, 7, partition=partition, alpha=0.3, seed=5)
+    assert len(parts) == 7
+    assert_disjoint_and_covering(parts, len(LABELS))
+    again = partition_indices(LABELS, 7, partition=partition, alpha=0.3, seed=5)
+    assert all(np.array_equal(a, b) for a, b in zip(parts, again))
+    other = partition_indices(LABELS, 7, partition=partition, alpha=0.3, seed=6)
+    assert not all(np.array_equal(a, b) for a, b in zip(parts, other))
+
+
+def test_iid_shards_are_balanced():
+    sizes = [len(part) for part in iid_partition(1003, 4)]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_dirichlet_skews_labels_and_respects_min_size():
+    parts = dirichlet_partition(LABELS, 5, alpha=0.1, seed=1, min_size=20)
+    assert min(len(part) for part in parts) >= 20
+    histograms = np.array([np.bincount(LABELS[part], minlength=10) / len(part) for part in parts])
+    uniform = np.bincount(LABELS, minlength=10) / len(LABELS)
+    # 小 alpha 下至少有一个客户端的标签分布明显偏离全局分布
+    assert np.abs(histograms - uniform).sum(axis=1).max() > 0.5
+    with pytest.raises(ValueError):
+        partition_indices(LABELS, 5, partition="shards")
+
+
+def test_client_shards_from_load_data_do_not_overlap(synthetic_data):
+    _, labels = load_arrays("train")
+    shards = [load_data(client_id=i, num_clients=3, partition="dirichlet")[0].dataset.indices for i in range(3)]
+    assert_disjoint_and_covering(shards, len(labels))
+    with pytest.raises(ValueError):
+        load_data(client_id=3, num_clients=3)
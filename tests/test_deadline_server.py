@@ -0,0 +1,84 @@
+import contextlib
+import io
+import threading
+import time
+
+import flwr as fl
+from flwr.common import Code, Status, ndarrays_to_parameters
+from flwr.server.client_proxy import ClientProxy
+import numpy as np
+
+from benchmarks.fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain
+from deadline_server import DeadlineServer
+from model import CNN
+from server import BCFLStrategy
+from server_main import advance_to_next_round, initialize_task
+
+
+class SlowClient(ClientProxy):
+    """第 server_round 轮训练 delays[server_round] 秒后返回一个新模型的CID，并记录下发时链上登记的训练者"""
+
+    def __init__(self, cid, chain, store, account, delays):
+        super().__init__(cid)
+        self.chain = chain.utils(account)
+        self.ipfs = InMemoryIPFSUtils(store)
+        self.delays = delays
+        self.rounds = []
+        self.registered = {}
+        self.busy = threading.Lock()
+
+    def fit(self, ins, timeout, group_id):
+        # 同一客户端不能同时处理两条指令
+        assert self.busy.acquire(blocking=False)
+        try:
+            server_round = ins.config["server_round"]
+            self.rounds.append(server_round)
+            self.registered[server_round] = self.chain.get_selected_trainers(server_round)
+            time.sleep(self.delays.get(server_round, 0))
+            cid = self.ipfs.upload_model(CNN())
+            return fl.common.FitRes(Status(Code.OK, ""), ndarrays_to_parameters([np.frombuffer(cid.encode(), np.uint8)]),
+                                    10, {"account": self.chain.account})
+        finally:
+            self.busy.release()
+
+    def get_properties(self, ins, timeout, group_id):
+        return fl.common.GetPropertiesRes(Status(Code.OK, ""), {"account": self.chain.account})
+
+    def get_parameters(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def evaluate(self, ins, timeout, group_id):
+        raise NotImplementedError
+
+    def reconnect(self, ins, timeout, group_id):
+        return fl.common.DisconnectRes(reason="")
+
+
+def test_missed_deadline_keeps_chain_in_step_and_releases_stragglers(synthetic_data):
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server_chain = chain.utils(0)
+    genesis = InMemoryIPFSUtils(store).upload_model(CNN())
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_task(server_chain, genesis, 2, 2)
+        advance_to_next_round(server_chain, 0, genesis)
+    strategy = BCFLStrategy(server_chain, InMemoryIPFSUtils(store), model_class=CNN, async_evaluate=False)
+    client_manager = fl.server.SimpleClientManager()
+    # 两个客户端都赶不上第 1 轮的截止时间，第 2 轮开始时仍在训练
+    clients = [SlowClient(str(i), chain, store, i, {1: 0.6}) for i in (1, 2)]
+    for client in clients:
+        client_manager.register(client)
+
+    server = DeadlineServer(client_manager=client_manager, strategy=strategy, round_deadline=0.2)
+    server.fit(num_rounds=2, timeout=None)
+
+    # 第 1 轮没有结果：沿用初始模型推进链上轮次，第 2 轮等掉队者返回后正常训练并提交
+    assert server_chain.get_current_round() == 3
+    assert server_chain.get_global_model_cid(1) == genesis
+    assert server_chain.get_global_model_cid(2) not in ("", genesis)
+    accounts = [client.chain.account for client in clients]
+    for client in clients:
+        assert client.rounds == [1, 2]
+        # 训练者在下发任务之前登记，评估器在整轮中都能读取
+        assert sorted(client.registered[2]) == sorted(accounts)
+    assert all(entry["misses"] == 1 for entry in strategy.latency.stats().values())
+    assert not server._stragglers or all(future.done() for future in server._stragglers)
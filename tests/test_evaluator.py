@@ -0,0 +1,30 @@
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from benchmarks.fakes import InMemoryIPFSUtils, InProcessChain
+from evaluator import Evaluator, evaluate_models
+from model import CNN
+
+
+def models(count):
+    torch.manual_seed(0)
+    return [CNN() for _ in range(count)]
+
+
+def test_single_pass_matches_per_model_loop():
+    generator = torch.Generator().manual_seed(1)
+    dataset = TensorDataset(torch.randn(130, 1, 28, 28, generator=generator),
+                            torch.randint(0, 10, (130,), generator=generator))
+    testloader = DataLoader(dataset, batch_size=32)
+    batch = models(3)
+    expected = [evaluate_models([model], testloader, torch.device("cpu"))[0] for model in batch]
+    assert evaluate_models(batch, testloader, torch.device("cpu")) == expected
+
+
+def test_evaluator_batches_match_single_cid_scores(synthetic_data):
+    ipfs_utils = InMemoryIPFSUtils()
+    cids = [ipfs_utils.upload_model(model) for model in models(5)]
+    evaluator = Evaluator(InProcessChain().utils(), ipfs_utils, 1, max_models_per_pass=2)
+    scores = evaluator.evaluate_models(cids)
+    assert scores == {cid: evaluator.evaluate_model(cid) for cid in cids}
+    assert evaluator.evaluate_models(cids + ["QmMissing"])["QmMissing"] == 0.0
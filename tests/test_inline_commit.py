@@ -0,0 +1,117 @@
+import contextlib
+import io
+
+import flwr as fl
+import pytest
+
+from benchmarks.fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain, InProcessClientProxy
+from client import BCFLClient
+from model import CNN
+from server import BCFLStrategy
+from server_main import advance_to_next_round, initialize_task
+
+
+@pytest.fixture
+def task(synthetic_data):
+    """已初始化并进入第 1 轮的链上任务，训练者为账户 1、2"""
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server_chain = chain.utils(0)
+    genesis = InMemoryIPFSUtils(store).upload_model(CNN())
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_task(server_chain, genesis, 3, 2)
+        advance_to_next_round(server_chain, 0, genesis)
+    return chain, store, genesis
+
+
+def make_strategy(task, commit_timeout=10):
+    chain, store, _ = task
+    return BCFLStrategy(chain.utils(0), InMemoryIPFSUtils(store), model_class=CNN, async_evaluate=False,
+                        transport="inline", commit_timeout=commit_timeout)
+
+
+def make_client(task, cid):
+    chain, store, _ = task
+    return BCFLClient(chain.utils(cid), InMemoryIPFSUtils(store), cid, CNN, num_clients=2, prefetch=False)
+
+
+def fit(strategy, client, server_round=1):
+    ins = fl.common.FitIns(fl.common.ndarrays_to_parameters([]), strategy._fit_config(server_round))
+    proxy = InProcessClientProxy(str(client.cid), client)
+    return proxy, proxy.fit(ins, None, server_round)
+
+
+def test_inline_updates_are_aggregated_once_committed(task):
+    strategy = make_strategy(task)
+    clients = [make_client(task, cid) for cid in (1, 2)]
+    results = [fit(strategy, client) for client in clients]
+    # 结果随 FitRes 内联返回，客户端在后台提交更新CID
+    assert all(len(fl.common.parameters_to_ndarrays(res.parameters)) == 2 for _, res in results)
+    parameters, metrics = strategy.aggregate_fit(1, results, [])
+    assert parameters is not None and metrics["num_updates"] == 2
+    server_chain = strategy.blockchain_utils
+    assert server_chain.get_current_round() == 2
+    assert set(server_chain.get_update_cids(1)) == {client.blockchain_utils.account for client in clients}
+    for client in clients:
+        client.flush()
+
+
+def test_updates_never_committed_are_dropped(task, monkeypatch):
+    strategy = make_strategy(task, commit_timeout=0.5)
+    committed, lost = make_client(task, 1), make_client(task, 2)
+    monkeypatch.setattr(lost.blockchain_utils, "submit_update_cid", lambda round_num, cid: None)
+    results = [fit(strategy, client) for client in (committed, lost)]
+    lost.flush()
+    parameters, metrics = strategy.aggregate_fit(1, results, [])
+    assert parameters is not None and metrics["num_updates"] == 1
+    assert list(strategy.blockchain_utils.get_update_cids(1)) == [committed.blockchain_utils.account]
+    committed.flush()
+
+
+def test_async_commitments_may_land_in_an_earlier_round(task):
+    _, _, genesis = task
+    strategy = make_strategy(task, commit_timeout=0.5)
+    client = make_client(task, 1)
+    assert client._submit_update(1, "QmLate")
+    strategy.blockchain_utils.submit_global_model(1, genesis)
+    accounts = {"QmLate": [client.blockchain_utils.account]}
+    assert strategy._await_commitments(2, {"QmLate": b""}, accounts, 1) == set()
+    assert strategy._await_commitments(2, {"QmLate": b""}, accounts, 2) == {"QmLate"}
+
+
+def flaky_submit(monkeypatch, utils, failures=1):
+    """前 failures 次 submit_update_cid 返回 None，记录每次提交的轮次"""
+    submit, rounds = utils.submit_update_cid, []
+
+    def flaky(round_num, cid):
+        rounds.append(round_num)
+        return None if len(rounds) <= failures else submit(round_num, cid)
+
+    monkeypatch.setattr(utils, "submit_update_cid", flaky)
+    return rounds
+
+
+def test_sync_submit_retries_transient_failure_in_same_round(task, monkeypatch):
+    client = make_client(task, 1)
+    rounds = flaky_submit(monkeypatch, client.blockchain_utils)
+    assert client._submit_update(1, "Qm1") is not None
+    assert rounds == [1, 1]
+    assert client.blockchain_utils.get_update_cids(1) == {client.blockchain_utils.account: "Qm1"}
+
+
+def test_sync_submit_gives_up_after_server_moved_on(task, monkeypatch):
+    _, _, genesis = task
+    client = make_client(task, 1)
+    make_strategy(task).blockchain_utils.submit_global_model(1, genesis)
+    rounds = flaky_submit(monkeypatch, client.blockchain_utils)
+    assert client._submit_update(1, "Qm1") is None
+    assert rounds == [1]
+
+
+def test_async_submit_follows_the_new_round(task, monkeypatch):
+    _, _, genesis = task
+    client = make_client(task, 1)
+    make_strategy(task).blockchain_utils.submit_global_model(1, genesis)
+    rounds = flaky_submit(monkeypatch, client.blockchain_utils)
+    assert client._submit_update(1, "Qm1", is_async=True) is not None
+    assert rounds == [1, 2]
+    assert client.blockchain_utils.get_update_cids(2) == {client.blockchain_utils.account: "Qm1"}
@@ -0,0 +1,39 @@
+import time
+
+import torch
+
+from benchmarks.fakes import InMemoryIPFSClient, InMemoryIPFSStore, InMemoryIPFSUtils
+import tensor_format
+
+
+def test_slow_download_is_dropped_at_the_deadline(tmp_path, monkeypatch):
+    store = InMemoryIPFSStore()
+    fast = store.put(tensor_format.dumps({"w": torch.ones(4)}))
+    slow = store.put(tensor_format.dumps({"w": torch.zeros(64 * 1024)}))
+    served = []
+    cat = InMemoryIPFSClient.cat
+
+    def trickle(self, cid, stream=False, timeout=None):
+        if cid != slow or not stream:
+            return cat(self, cid, stream=stream, timeout=timeout)
+        data = self.store.get(cid)
+
+        def slowly():
+            # 每个分块都在 socket 超时之内到达，只有总时限能截断
+            for i in range(0, len(data), 1024):
+                time.sleep(0.02)
+                served.append(len(data[i:i + 1024]))
+                yield data[i:i + 1024]
+        return slowly()
+
+    monkeypatch.setattr(InMemoryIPFSClient, "cat", trickle)
+    ipfs = InMemoryIPFSUtils(store, use_cache=True, cache_dir=str(tmp_path))
+    start = time.monotonic()
+    fetched = dict(ipfs.fetch_state_dicts([slow, fast], timeout=1, retries=1, backoff=0.05, deadline=0.3))
+    elapsed = time.monotonic() - start
+
+    assert list(fetched) == [fast] and torch.equal(fetched[fast]["w"], torch.ones(4))
+    assert elapsed < 1.0
+    # 工作线程在截止时间后的下一个分块处停止，不会把整个模型拉完
+    time.sleep(0.1)
+    assert sum(served) < len(store.get(slow)) // 2
@@ -0,0 +1,62 @@
+import hashlib
+
+import pytest
+from eth_abi.packed import encode_packed
+from eth_utils import keccak
+
+from blockchain_utils import merkle_proof, merkle_root, update_leaf, verify_merkle_proof
+
+TRAINERS = ["0x" + f"{i:040x}" for i in range(1, 12)]
+
+
+def solidity_leaf(trainer, round_num, digest):
+    """keccak256(abi.encodePacked(address trainer, uint round, bytes32 digest))，逐字节按 Solidity 规则拼接"""
+    packed = bytes.fromhex(trainer[2:]) + round_num.to_bytes(32, "big") + digest
+    assert packed == encode_packed(["address", "uint256", "bytes32"], [trainer, round_num, digest])
+    return keccak(packed)
+
+
+def solidity_verify(leaf, proof, root):
+    """BCFL.verifyUpdate 中循环的逐行转写"""
+    node = leaf
+    for sibling in proof:
+        node = keccak(node + sibling) if node < sibling else keccak(sibling + node)
+    return node == root
+
+
+def leaves(count, round_num=3):
+    return [solidity_leaf(trainer, round_num, hashlib.sha256(trainer.encode()).digest())
+            for trainer in TRAINERS[:count]]
+
+
+def test_update_leaf_matches_solidity_encoding():
+    digest = hashlib.sha256(b"update").digest()
+    for round_num in (0, 1, 255, 2 ** 40):
+        assert update_leaf(TRAINERS[0], round_num, digest) == solidity_leaf(TRAINERS[0], round_num, digest)
+
+
+@pytest.mark.parametrize("count", range(1, 12))
+def test_every_proof_verifies_against_contract_loop(count):
+    tree = leaves(count)
+    root = merkle_root(tree)
+    for index, leaf in enumerate(tree):
+        proof = merkle_proof(tree, index)
+        assert solidity_verify(leaf, proof, root)
+        assert verify_merkle_proof(leaf, proof, root)
+
+
+def test_single_leaf_is_its_own_root():
+    tree = leaves(1)
+    assert merkle_root(tree) == tree[0]
+    assert merkle_proof(tree, 0) == []
+
+
+def test_tampered_proof_or_leaf_is_rejected():
+    tree = leaves(5)
+    root = merkle_root(tree)
+    proof = merkle_proof(tree, 2)
+    assert not solidity_verify(tree[3], proof, root)
+    other_round = leaves(5, round_num=4)[2]
+    assert not solidity_verify(other_round, proof, root)
+    tampered = [bytes(32)] + proof[1:]
+    assert not solidity_verify(tree[2], tampered, root)
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+
+import torch
+
+from model_cache import ModelCache
+
+
+def tensor_state(value):
+    return {"w": torch.full((25,), float(value))}  # 100 字节
+
+
+def test_memory_layer_evicts_least_recently_used(tmp_path):
+    cache = ModelCache(str(tmp_path), max_memory_bytes=250)
+    cache.put_state_dict("QmA", tensor_state(1))
+    cache.put_state_dict("QmB", tensor_state(2))
+    assert cache.get_state_dict("QmA")["w"][0].item() == 1
+    cache.put_state_dict("QmC", tensor_state(3))
+    assert cache.get_state_dict("QmB") is None
+    assert cache.get_state_dict("QmA") is not None and cache.get_state_dict("QmC") is not None
+    stats = cache.stats()
+    assert (stats["memory_items"], stats["memory_bytes"], stats["evictions"]) == (2, 200, 1)
+    # 超过整个内存层容量的条目不缓存
+    cache.put_state_dict("QmHuge", {"w": torch.zeros(100)})
+    assert cache.get_state_dict("QmHuge") is None
+
+
+def test_disk_layer_evicts_least_recently_accessed(tmp_path):
+    cache = ModelCache(str(tmp_path), max_disk_bytes=250)
+    for age, cid in ((200, "QmA"), (100, "QmB")):
+        cache.put_bytes(cid, bytes(100))
+        os.utime(cache.get_path(cid), (0, 1_000_000 - age))
+    assert cache.get_bytes("QmA") == bytes(100)  # 刷新访问时间，QmB 成为最久未访问的条目
+    cache.put_bytes("QmC", bytes(100))
+    assert cache.get_path("QmB") is None
+    assert cache.get_path("QmA") and cache.get_path("QmC")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_rejects_cids_that_are_not_plain_names(tmp_path):
+    cache = ModelCache(str(tmp_path / "cache"))
+    cache.put_bytes("../escape", b"x")
+    assert not (tmp_path / "escape").exists()
+    assert cache.get_bytes("../escape") is None
+    with cache.writer() as writer:
+        writer.write(b"x")
+        assert writer.commit("a/b") is None
+    assert os.listdir(cache.cache_dir) == []
+
+
+def _write_entries(cache_dir, worker):
+    cache = ModelCache(cache_dir, max_disk_bytes=1000)
+    for i in range(20):
+        with cache.writer() as writer:
+            writer.write(bytes([worker]) * 100)
+            writer.commit(f"Qm{worker}x{i}")
+
+
+def test_processes_share_the_disk_layer_and_respect_its_limit(tmp_path):
+    cache_dir = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    process = context.Process(target=_write_entries, args=(cache_dir, 7))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    # 另一个进程写入的条目在本进程中直接命中
+    reader = ModelCache(cache_dir, max_disk_bytes=1000)
+    assert reader.get_bytes("Qm7x19") == bytes([7]) * 100
+
+    processes = [context.Process(target=_write_entries, args=(cache_dir, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    names = [name for name in os.listdir(cache_dir) if not name.startswith(".")]
+    assert sum(os.path.getsize(os.path.join(cache_dir, name)) for name in names) <= 1000
+    assert not [name for name in os.listdir(cache_dir) if name.startswith(".tmp-")]
+    for name in names:
+        assert reader.get_bytes(name) == bytes([int(name[2:].split("x")[0])]) * 100
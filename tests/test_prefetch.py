@@ -0,0 +1,63 @@
+import torch
+
+from benchmarks.fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain
+from model import CNN
+from prefetch import GlobalModelPrefetcher
+
+
+def setup():
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server = chain.utils(0)
+    genesis = CNN()
+    genesis_cid = InMemoryIPFSUtils(store).upload_model(genesis)
+    server.transact(server.contract.functions.initialize(genesis_cid, 5, 1))
+    server.submit_global_model(0, genesis_cid)
+    # poll_interval 足够长，新事件只在 latest(refresh=True) 时拉取
+    prefetcher = GlobalModelPrefetcher(chain.utils(1), InMemoryIPFSUtils(store), template=CNN().state_dict(),
+                                       poll_interval=3600).start()
+    return server, store, genesis, genesis_cid, prefetcher
+
+
+def same_weights(state_dict, model):
+    return all(torch.equal(state_dict[name], tensor) for name, tensor in model.state_dict().items())
+
+
+def test_start_loads_the_current_global_model():
+    _, _, genesis, genesis_cid, prefetcher = setup()
+    assert prefetcher.latest(refresh=False) == (0, genesis_cid)
+    assert same_weights(prefetcher.get(genesis_cid, timeout=30), genesis)
+    assert prefetcher.get("QmOther", timeout=30) is None
+    prefetcher.close()
+
+
+def test_latest_refresh_picks_up_new_commits():
+    server, store, _, genesis_cid, prefetcher = setup()
+    model = CNN()
+    cid = InMemoryIPFSUtils(store).upload_model(model)
+    server.submit_global_model(1, cid)
+    assert prefetcher.latest(refresh=False) == (0, genesis_cid)
+    assert prefetcher.latest() == (1, cid)
+    assert same_weights(prefetcher.get(cid, timeout=30), model)
+    # 只保留最新一轮的模型，旧轮次的事件被忽略
+    assert prefetcher.get(genesis_cid, timeout=30) is None
+    prefetcher._on_event({"round": 0, "cid": genesis_cid})
+    assert prefetcher.latest(refresh=False) == (1, cid)
+    prefetcher.close()
+
+
+def test_recommitted_cid_reuses_the_loaded_model():
+    server, _, _, genesis_cid, prefetcher = setup()
+    loaded = prefetcher.get(genesis_cid, timeout=30)
+    server.submit_global_model(1, genesis_cid)
+    assert prefetcher.latest() == (1, genesis_cid)
+    assert prefetcher.get(genesis_cid, timeout=30) is loaded
+    prefetcher.close()
+
+
+def test_model_with_another_structure_is_rejected():
+    server, store, _, _, prefetcher = setup()
+    cid = InMemoryIPFSUtils(store).upload_state_dict({"weight": torch.zeros(3)})
+    server.submit_global_model(1, cid)
+    assert prefetcher.latest() == (1, cid)
+    assert prefetcher.get(cid, timeout=30) is None
+    prefetcher.close()
@@ -0,0 +1,63 @@
+import contextlib
+import io
+
+import flwr as fl
+
+from benchmarks.fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain, InProcessClientProxy
+from client import BCFLClient
+from deadline_server import DeadlineServer
+from model import CNN
+from server import BCFLStrategy
+from server_main import advance_to_next_round, initialize_task, read_resume_state
+
+
+def test_resume_state_is_read_from_the_chain(synthetic_data):
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server_chain, ipfs = chain.utils(0), InMemoryIPFSUtils(store)
+    assert read_resume_state(server_chain) is None
+
+    genesis, first = ipfs.upload_model(CNN()), ipfs.upload_model(CNN())
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_task(server_chain, genesis, 2, 1)
+        advance_to_next_round(server_chain, 0, genesis)
+    assert read_resume_state(server_chain) == (1, genesis, 2, 1)
+    assert server_chain.submit_global_model(1, first)
+    assert read_resume_state(server_chain) == (2, first, 2, 1)
+    assert server_chain.submit_global_model(2, first)
+    # 全部轮次完成后没有可恢复的全局模型
+    assert read_resume_state(server_chain) == (3, None, 2, 1)
+
+
+def test_resumed_server_continues_from_the_committed_round(synthetic_data):
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server_chain, ipfs = chain.utils(0), InMemoryIPFSUtils(store)
+    genesis, first = ipfs.upload_model(CNN()), ipfs.upload_model(CNN())
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_task(server_chain, genesis, 3, 1)
+        advance_to_next_round(server_chain, 0, genesis)
+    # 上一次运行在提交第 1 轮全局模型后退出
+    assert server_chain.submit_global_model(1, first)
+
+    start_round, resume_cid, total_rounds, _ = read_resume_state(server_chain)
+    strategy = BCFLStrategy(server_chain, InMemoryIPFSUtils(store), model_class=CNN, async_evaluate=False,
+                            training={"local_epochs": 1})
+    assert strategy.resume(start_round - 1, resume_cid)
+    client = BCFLClient(chain.utils(1), InMemoryIPFSUtils(store), 1, CNN, num_clients=1, prefetch=False)
+    rounds = []
+    fit = client.fit
+
+    def recording_fit(parameters, config):
+        rounds.append(config["server_round"])
+        return fit(parameters, config)
+
+    client.fit = recording_fit
+    client_manager = fl.server.SimpleClientManager()
+    client_manager.register(InProcessClientProxy("1", client))
+    server = DeadlineServer(client_manager=client_manager, strategy=strategy, start_round=start_round)
+    server.fit(num_rounds=total_rounds, timeout=None)
+    client.flush()
+
+    assert rounds == [2, 3]
+    assert server_chain.get_current_round() == 4
+    assert server_chain.get_global_model_cid(1) == first
+    assert server_chain.get_global_model_cid(3) not in ("", first)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import torch
+
+from robust_aggregation import RobustAggregator
+
+
+def state(values):
+    return {"w": torch.tensor(values, dtype=torch.float32)}
+
+
+HONEST = [[1.0, 2.0, 3.0], [1.2, 2.1, 2.9], [0.9, 1.9, 3.1], [1.1, 2.0, 3.0]]
+ATTACKER = [100.0, -100.0, 100.0]
+
+
+def aggregate(rule, updates, weights=None, chunk_bytes=8, **kwargs):
+    aggregator = RobustAggregator(state([0.0, 0.0, 0.0]), rule=rule, chunk_bytes=chunk_bytes, **kwargs)
+    aggregator.reset()
+    for update, weight in zip(updates, weights or [1.0] * len(updates)):
+        aggregator.add(state(update), weight=weight)
+    try:
+        return aggregator.result()["w"].numpy()
+    finally:
+        aggregator.close()
+
+
+def test_mean_is_weighted_and_matches_numpy():
+    weights = [1.0, 2.0, 3.0, 4.0]
+    expected = np.average(np.array(HONEST), axis=0, weights=weights)
+    assert np.allclose(aggregate("mean", HONEST, weights), expected)
+
+
+def test_median_and_trimmed_mean_ignore_one_attacker():
+    updates = HONEST + [ATTACKER]
+    assert np.allclose(aggregate("median", updates), np.median(np.array(updates), axis=0))
+    trimmed = aggregate("trimmed_mean", updates, trim_ratio=0.2)
+    expected = np.sort(np.array(updates), axis=0)[1:-1].mean(axis=0)
+    assert np.allclose(trimmed, expected)
+    assert np.abs(trimmed - np.array(HONEST).mean(axis=0)).max() < 0.2
+
+
+def test_krum_selects_an_honest_update():
+    updates = HONEST + [ATTACKER]
+    selected = aggregate("krum", updates, num_byzantine=1)
+    assert any(np.allclose(selected, honest) for honest in HONEST)
+    multi = aggregate("multi_krum", updates, num_byzantine=1)
+    assert np.abs(multi - np.array(HONEST).mean(axis=0)).max() < 0.2
+
+
+def test_clip_norm_bounds_each_delta_and_chunking_is_exact():
+    clipped = aggregate("mean", [ATTACKER], clip_norm=1.0)
+    assert np.linalg.norm(clipped) == pytest.approx(1.0, rel=1e-5)
+    assert np.allclose(aggregate("median", HONEST, chunk_bytes=4), aggregate("median", HONEST, chunk_bytes=1 << 20))
+
+
+def test_delta_mode_adds_back_the_base():
+    aggregator = RobustAggregator(state([0.0, 0.0, 0.0]), rule="median")
+    aggregator.reset(base=state([1.0, 1.0, 1.0]))
+    for update in ([2.0, 2.0, 2.0], [3.0, 3.0, 3.0], [10.0, 10.0, 10.0]):
+        aggregator.add(state(update))
+    assert np.allclose(aggregator.result()["w"].numpy(), [3.0, 3.0, 3.0])
+    aggregator.close()
@@ -0,0 +1,88 @@
+import json
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import telemetry
+
+
+@pytest.fixture
+def trace_dir(tmp_path):
+    telemetry.reset()
+    telemetry.enable(trace_dir=str(tmp_path))
+    yield tmp_path
+    telemetry.disable()
+    telemetry.reset()
+    telemetry._registry.trace_dir = None
+
+
+def span_names(path):
+    with open(path) as f:
+        return sorted(event["name"] for event in json.load(f)["traceEvents"])
+
+
+def test_flush_trace_only_takes_own_scope(trace_dir):
+    def client(cid):
+        with telemetry.trace_scope(cid):
+            with telemetry.span(f"client.fit.{cid}"):
+                pass
+
+    threads = [threading.Thread(target=client, args=(cid,)) for cid in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with telemetry.span("server.aggregate"):
+        pass
+
+    assert span_names(telemetry.flush_trace("client-1", scope=1)) == ["client.fit.1"]
+    assert span_names(telemetry.flush_trace("server")) == ["server.aggregate"]
+    assert span_names(telemetry.flush_trace("client-2", scope=2)) == ["client.fit.2"]
+    assert telemetry.flush_trace("client-1-again", scope=1) is None
+
+
+def test_scoped_carries_scope_to_worker_thread(trace_dir):
+    def background():
+        with telemetry.span("ipfs.upload"):
+            pass
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with telemetry.trace_scope(7):
+            executor.submit(telemetry.scoped(background)).result()
+        executor.submit(background).result()
+
+    assert span_names(telemetry.flush_trace("client-7", scope=7)) == ["ipfs.upload"]
+    assert span_names(telemetry.flush_trace("unscoped")) == ["ipfs.upload"]
+
+
+def test_trace_buffer_drops_oldest_events_when_full(trace_dir, monkeypatch):
+    monkeypatch.setattr(telemetry._registry, "events", deque(maxlen=3))
+    # scope 9 的归属者从不写出，其事件不能无限堆积
+    with telemetry.trace_scope(9):
+        for i in range(5):
+            with telemetry.span(f"client.fit.{i}"):
+                pass
+    assert "bcfl_trace_events_dropped_total 2" in telemetry.render_prometheus()
+    assert span_names(telemetry.flush_trace("client-9", scope=9)) == ["client.fit.2", "client.fit.3", "client.fit.4"]
+    assert telemetry._registry.events.maxlen == 3
+
+
+def test_metrics_endpoint_listens_on_loopback_by_default():
+    telemetry.reset()
+    telemetry.enable(metrics_port=0)
+    try:
+        with telemetry.span("server.aggregate"):
+            pass
+        telemetry.count("ipfs_bytes", 10, direction="download")
+        host, port = telemetry._registry.server.server_address[:2]
+        assert host == "127.0.0.1"
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    finally:
+        telemetry.disable()
+        telemetry.reset()
+    assert 'bcfl_span_duration_seconds_count{span="server.aggregate"} 1' in body
+    assert 'bcfl_span_errors_total{span="server.aggregate"} 0' in body
+    assert 'bcfl_ipfs_bytes_total{direction="download"} 10' in body
@@ -0,0 +1,81 @@
+import io
+import struct
+
+import pytest
+import torch
+
+import tensor_format
+
+
+def sample():
+    return {
+        "__codec__": "topk",
+        "base_cid": "QmBase",
+        "tensors": {
+            "weight": torch.randn(3, 5),
+            "half": torch.randn(7).half(),
+            "indices": torch.tensor([1, 4, 9], dtype=torch.int32),
+            "flags": torch.tensor([True, False]),
+            "empty": torch.empty(0, 4),
+            "scalar": torch.tensor(3),
+        },
+        "meta": [1, 2.5, None, "x", True],
+    }
+
+
+def assert_same(a, b):
+    if isinstance(a, torch.Tensor):
+        assert a.dtype == b.dtype and a.shape == b.shape and torch.equal(a, b)
+    elif isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for key in a:
+            assert_same(a[key], b[key])
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert_same(x, y)
+    else:
+        assert a == b
+
+
+def test_bytes_and_file_round_trip(tmp_path):
+    obj = sample()
+    data = tensor_format.dumps(obj)
+    assert tensor_format.is_flat(data)
+    assert data == b"".join(bytes(chunk) for chunk in tensor_format.iter_chunks(obj))
+    assert_same(tensor_format.loads(data), obj)
+    path = tmp_path / "model.bin"
+    tensor_format.dump(obj, str(path))
+    assert_same(tensor_format.load(str(path)), obj)
+    assert_same(tensor_format.load(str(path), use_mmap=False), obj)
+
+
+def test_tensors_are_aligned_views_of_the_input():
+    data = bytearray(tensor_format.dumps({"w": torch.arange(16, dtype=torch.float32)}))
+    loaded = tensor_format.loads(data)["w"]
+    assert (loaded.data_ptr() - _address(data)) % tensor_format.ALIGNMENT == 0
+    data[-4:] = struct.pack("<f", 99.0)
+    assert loaded[-1].item() == 99.0
+
+
+def _address(buffer):
+    return torch.frombuffer(buffer, dtype=torch.uint8).data_ptr()
+
+
+def test_legacy_torch_save_still_loads():
+    buffer = io.BytesIO()
+    torch.save({"w": torch.ones(2)}, buffer)
+    assert torch.equal(tensor_format.loads(buffer.getvalue())["w"], torch.ones(2))
+
+
+def test_rejects_corrupt_or_unsupported_input():
+    data = bytearray(tensor_format.dumps({"w": torch.ones(4)}))
+    with pytest.raises(ValueError):
+        tensor_format.loads(bytes(data[:-8]))
+    data[8:16] = struct.pack("<Q", 1 << 40)
+    with pytest.raises(ValueError):
+        tensor_format.loads(bytes(data))
+    with pytest.raises(TypeError):
+        tensor_format.dumps({"w": torch.ones(2, dtype=torch.complex64)})
+    with pytest.raises(TypeError):
+        tensor_format.dumps({1: torch.ones(2)})
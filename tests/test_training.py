@@ -0,0 +1,74 @@
+import contextlib
+import io
+
+import pytest
+
+from benchmarks.fakes import InMemoryIPFSStore, InMemoryIPFSUtils, InProcessChain
+from client import BCFLClient
+from model import CNN
+from server import BCFLStrategy
+from server_main import advance_to_next_round, initialize_task
+from training import DEFAULT_TRAINING, training_config
+
+
+def test_defaults_fill_missing_keys_and_values_are_coerced():
+    assert training_config({}) == DEFAULT_TRAINING
+    # Flower 的 config 值可能以字符串或浮点数到达，按默认值的类型转换
+    params = training_config({"local_epochs": "3", "lr": 1, "optimizer": "adamw", "server_round": 7})
+    assert params["local_epochs"] == 3 and isinstance(params["lr"], float)
+    assert params["optimizer"] == "adamw" and "server_round" not in params
+
+
+@pytest.mark.parametrize("config", [
+    {"local_epochs": 0},
+    {"batch_size": -1},
+    {"grad_accum": 0},
+    {"batch_size": "many"},
+    {"optimizer": "lbfgs"},
+    {"lr_schedule": "step"},
+])
+def test_invalid_values_are_rejected(config):
+    with pytest.raises(ValueError):
+        training_config(config)
+
+
+@pytest.fixture
+def task(synthetic_data):
+    chain, store = InProcessChain(), InMemoryIPFSStore()
+    server_chain = chain.utils(0)
+    genesis = InMemoryIPFSUtils(store).upload_model(CNN())
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_task(server_chain, genesis, 3, 1)
+        advance_to_next_round(server_chain, 0, genesis)
+    return chain, store
+
+
+def test_strategy_validates_and_sends_training_config(task):
+    chain, store = task
+    with pytest.raises(ValueError):
+        BCFLStrategy(chain.utils(0), InMemoryIPFSUtils(store), model_class=CNN, async_evaluate=False,
+                     training={"optimizer": "lbfgs"})
+    strategy = BCFLStrategy(chain.utils(0), InMemoryIPFSUtils(store), model_class=CNN, async_evaluate=False,
+                            training={"local_epochs": 1, "lr": 0.1}, lr_decay=0.5)
+    config = strategy._fit_config(3)
+    assert config["local_epochs"] == 1 and config["batch_size"] == DEFAULT_TRAINING["batch_size"]
+    assert config["lr"] == pytest.approx(0.1 * 0.5 ** 2)
+
+
+def test_client_falls_back_to_defaults_on_invalid_config(task, monkeypatch):
+    chain, store = task
+    client = BCFLClient(chain.utils(1), InMemoryIPFSUtils(store), 1, CNN, num_clients=1, prefetch=False)
+    used = []
+    train = client.trainer.train
+
+    def recording_train(loader, params):
+        used.append(params)
+        return train(loader, {**params, "local_epochs": 1})
+
+    monkeypatch.setattr(client.trainer, "train", recording_train)
+    config = {"server_round": 1, "local_epochs": 1, "batch_size": 64, "optimizer": "lbfgs"}
+    _, num_examples, metrics = client.fit([], config)
+    assert num_examples > 0 and "error" not in metrics
+    # 一项非法即整体退回默认值，不混用服务器下发的其余取值
+    assert used == [DEFAULT_TRAINING]
+    client.flush()
@@ -0,0 +1,66 @@
+import pytest
+from web3.exceptions import TransactionNotFound
+
+from blockchain_utils import TransactionError, TransactionPipeline
+
+
+class FakeEth:
+    def __init__(self, receipt_error=None):
+        self.block_number = 10
+        self.receipt_error = receipt_error
+        self.receipts = {}
+
+    def get_transaction_count(self, account, block):
+        return 0
+
+    def get_transaction_receipt(self, tx_hash):
+        if self.receipt_error is not None:
+            raise self.receipt_error
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound("pending")
+        return self.receipts[tx_hash]
+
+
+class FakeWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+class FakeFunction:
+    def __init__(self):
+        self.sent = []
+
+    def transact(self, params):
+        self.sent.append(params)
+        return bytes([len(self.sent)]) * 32
+
+
+def test_receipts_resolve_in_nonce_order():
+    eth = FakeEth()
+    pipeline = TransactionPipeline(FakeWeb3(eth), "0x0", poll_interval=0.01, timeout=5)
+    fn = FakeFunction()
+    futures = [pipeline.submit(fn) for _ in range(3)]
+    assert [params["nonce"] for params in fn.sent] == [0, 1, 2]
+    for i in range(3):
+        eth.receipts[bytes([i + 1]) * 32] = {"blockNumber": 10, "status": 1, "n": i}
+    assert [future.result(timeout=5)["n"] for future in futures] == [0, 1, 2]
+    pipeline.close()
+
+
+def test_failed_transaction_raises():
+    eth = FakeEth()
+    pipeline = TransactionPipeline(FakeWeb3(eth), "0x0", poll_interval=0.01, timeout=5)
+    future = pipeline.submit(FakeFunction())
+    eth.receipts[bytes([1]) * 32] = {"blockNumber": 10, "status": 0}
+    with pytest.raises(TransactionError):
+        future.result(timeout=5)
+    pipeline.close()
+
+
+def test_persistent_receipt_errors_still_time_out():
+    eth = FakeEth(receipt_error=RuntimeError("node unavailable"))
+    pipeline = TransactionPipeline(FakeWeb3(eth), "0x0", poll_interval=0.01, timeout=0.1)
+    future = pipeline.submit(FakeFunction())
+    with pytest.raises(TransactionError):
+        future.result(timeout=5)
+    pipeline.close()
@@ -0,0 +1,156 @@
+"""客户端本地训练循环
+
+训练超参数由服务器通过 Flower 的 FitIns.config 下发（见 BCFLStrategy 的 training 参数），
+缺省项使用 DEFAULT_TRAINING，与原先写死的 2 个 epoch、SGD lr=0.01、batch_size=32 一致：
+    local_epochs  本地训练的 epoch 数
+    batch_size    每个微批次的样本数
+    grad_accum    梯度累积的微批次数，有效批大小为 batch_size * grad_accum
+    optimizer     sgd / adam / adamw，配合 lr、momentum、weight_decay
+    lr_schedule   轮内学习率调度：constant / cosine（按步余弦退火）/ exponential（每个 epoch 乘以 lr_gamma）
+
+吞吐相关的设置只与训练节点的硬件有关，由客户端自行决定：算子线程数、torch.compile、channels_last。
+"""
+import logging
+import os
+import time
+
+import torch
+
+import telemetry
+
+DEFAULT_TRAINING = {
+    "local_epochs": 2,
+    "batch_size": 32,
+    "grad_accum": 1,
+    "optimizer": "sgd",
+    "lr": 0.01,
+    "momentum": 0.0,
+    "weight_decay": 0.0,
+    "lr_schedule": "constant",
+    "lr_gamma": 0.5,
+}
+OPTIMIZERS = ("sgd", "adam", "adamw")
+LR_SCHEDULES = ("constant", "cosine", "exponential")
+
+
+def training_config(config):
+    """从 FitIns.config 中取出训练超参数，缺省项使用默认值，非法取值抛出 ValueError"""
+    params = {key: type(default)(config.get(key, default)) for key, default in DEFAULT_TRAINING.items()}
+    if params["local_epochs"] < 1 or params["batch_size"] < 1 or params["grad_accum"] < 1:
+        raise ValueError(f"local_epochs、batch_size 与 grad_accum 必须为正整数: {params}")
+    if params["optimizer"] not in OPTIMIZERS:
+        raise ValueError(f"未知的优化器: {params['optimizer']}")
+    if params["lr_schedule"] not in LR_SCHEDULES:
+        raise ValueError(f"未知的学习率调度: {params['lr_schedule']}")
+    return params
+
+
+def configure_threads(num_threads=None):
+    """设置 torch 算子线程数；0 表示使用本进程可用的全部CPU核，None 表示保持默认"""
+    if num_threads is None:
+        return torch.get_num_threads()
+    if num_threads == 0:
+        num_threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(num_threads)
+    logging.info(f"torch 算子线程数: {num_threads}")
+    return num_threads
+
+
+def make_optimizer(parameters, params):
+    if params["optimizer"] == "adam":
+        return torch.optim.Adam(parameters, lr=params["lr"], weight_decay=params["weight_decay"])
+    if params["optimizer"] == "adamw":
+        return torch.optim.AdamW(parameters, lr=params["lr"], weight_decay=params["weight_decay"])
+    return torch.optim.SGD(parameters, lr=params["lr"], momentum=params["momentum"],
+                           weight_decay=params["weight_decay"])
+
+
+class LocalTrainer:
+    """执行一次本地训练并统计吞吐
+
+    compile 时在第一次前向传播前用 torch.compile 编译模型，编译失败（例如缺少C++编译器）
+    则记录警告并退回 eager 模式；channels_last 时模型与四维输入都使用 NHWC 内存布局。
+    编译后的模块与原模型共享参数，state_dict 始终从原模型读取。
+    """
+
+    def __init__(self, model, device, compile_model=False, channels_last=False):
+        self.model = model
+        self.device = device
+        self.channels_last = channels_last
+        if channels_last:
+            self.model.to(memory_format=torch.channels_last)
+        self._forward = model
+        self._compiled = None
+        if compile_model:
+            if hasattr(torch, "compile"):
+                self._compiled = torch.compile(model)
+            else:
+                logging.warning("当前 torch 版本不支持 torch.compile，使用 eager 模式")
+
+    def _run_forward(self, data):
+        if self._compiled is not None:
+            try:
+                output = self._compiled(data)
+                self._forward = self._compiled
+                self._compiled = None
+                return output
+            except Exception as e:
+                logging.warning(f"torch.compile 失败，退回 eager 模式: {e}")
+                self._compiled = None
+        return self._forward(data)
+
+    def train(self, loader, params):
+        """按 params（见 training_config）训练，返回 {num_examples, train_seconds, samples_per_sec, train_loss}"""
+        criterion = torch.nn.CrossEntropyLoss()
+        optimizer = make_optimizer(self.model.parameters(), params)
+        accum = params["grad_accum"]
+        loader.batch_size = params["batch_size"]
+        steps_per_epoch = max(1, -(-len(loader) // accum))
+        scheduler = None
+        if params["lr_schedule"] == "cosine":
+            scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=steps_per_epoch * params["local_epochs"])
+        elif params["lr_schedule"] == "exponential":
+            scheduler = torch.optim.lr_scheduler.ExponentialLR(optimizer, gamma=params["lr_gamma"])
+
+        self.model.train()
+        num_examples = 0
+        total_loss = torch.zeros((), device=self.device)
+        num_batches = 0
+        start = time.perf_counter()
+        for epoch in range(params["local_epochs"]):
+            with telemetry.span("client.train_epoch", epoch=epoch + 1):
+                optimizer.zero_grad(set_to_none=True)
+                pending = 0
+                for data, target in loader:
+                    data, target = data.to(self.device, non_blocking=True), target.to(self.device, non_blocking=True)
+                    if self.channels_last and data.dim() == 4:
+                        data = data.contiguous(memory_format=torch.channels_last)
+                    loss = criterion(self._run_forward(data), target)
+                    (loss / accum if accum > 1 else loss).backward()
+                    # 避免每步 .item() 引起的同步，损失在设备上累加
+                    total_loss += loss.detach()
+                    num_batches += 1
+                    num_examples += target.size(0)
+                    pending += 1
+                    if pending == accum:
+                        optimizer.step()
+                        optimizer.zero_grad(set_to_none=True)
+                        pending = 0
+                        if params["lr_schedule"] == "cosine":
+                            scheduler.step()
+                if pending:
+                    # epoch 末尾不足 grad_accum 个微批次的梯度同样生效
+                    optimizer.step()
+                    optimizer.zero_grad(set_to_none=True)
+                    if params["lr_schedule"] == "cosine":
+                        scheduler.step()
+            if params["lr_schedule"] == "exponential":
+                scheduler.step()
+            logging.info(f"完成第 {epoch + 1} 次epoch")
+        elapsed = time.perf_counter() - start
+        return {
+            "num_examples": num_examples,
+            "train_seconds": elapsed,
+            "samples_per_sec": num_examples / elapsed if elapsed > 0 else 0.0,
+            "train_loss": (total_loss / max(1, num_batches)).item(),
+        }